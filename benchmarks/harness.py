@@ -0,0 +1,276 @@
+""" Benchmark harness measuring the throughput, latency and memory use of the clients against a MockSwsServer.
+    Three modes are measured:
+        sync : SwsClient, one call at a time
+        threaded : SwsClient, calls run concurrently by `sws.batch`
+        async : AsyncSwsClient, calls run concurrently by `client.batch`
+"""
+import asyncio
+import itertools
+import math
+import time
+import tracemalloc
+
+from sws_py_sdk.connection_pool import AsyncConnectionPool, ConnectionPool
+from sws_py_sdk.sws_client import SwsClient
+
+MODES = ('sync', 'threaded', 'async')
+
+# Calls made by the benchmark scenarios, as functions of the client and the index of the call. The endpoint methods
+# of AsyncSwsClient return awaitables, so the same calls are used in every mode.
+SCENARIOS = {
+    'user': lambda client, i: client.identity().get_user(),
+    'licenses': lambda client, i: client.license().get_licenses(),
+    'product': lambda client, i: client.license().get_product_info(f'product-{i % 50}'),
+    'subscriptions': lambda client, i: client.ecom().get_subscriptions(),
+    'file': lambda client, i: client.cloudlib().me_get_file(f'file-{i % 50}'),
+}
+
+
+def _scenario_calls(scenario):
+    if scenario == 'mixed':
+        return list(SCENARIOS.values())
+    return [SCENARIOS[scenario]]
+
+
+class BenchmarkResult(object):
+
+    def __init__(self, mode, scenario, requests, concurrency, duration, latencies, errors, server_stats,
+                 memory=None):
+        """ Measurements of a benchmark run
+            mode : str
+                'sync', 'threaded' or 'async'
+            scenario : str
+                Name of the calls made, see SCENARIOS, or 'mixed'
+            requests : int
+                Number of calls made
+            concurrency : int
+                Maximum number of calls in progress at once
+            duration : float
+                Number of seconds the calls took in total
+            latencies : list
+                Number of seconds each call took, including any token refresh and replay
+            errors : int
+                Number of calls that raised or returned an unsuccessful response
+            server_stats : dict
+                Counts of the server: requests, errors, expired_tokens and token_refreshes
+            memory : dict
+                'peak_bytes' and 'retained_bytes' allocated by Python while the calls ran, if memory was traced
+        """
+        self.mode = mode
+        self.scenario = scenario
+        self.requests = requests
+        self.concurrency = concurrency
+        self.duration = duration
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.server_stats = dict(server_stats)
+        self.memory = memory
+
+    @property
+    def throughput(self):
+        """ Number of calls completed per second """
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, percentile):
+        """ Returns the latency, in seconds, below which `percentile` percent of the calls completed """
+        if not self.latencies:
+            return 0.0
+        index = max(0, math.ceil(percentile / 100 * len(self.latencies)) - 1)
+        return self.latencies[index]
+
+    def to_dict(self):
+        result = {
+            'mode': self.mode,
+            'scenario': self.scenario,
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'errors': self.errors,
+            'server': self.server_stats,
+        }
+        if self.memory is not None:
+            result['memory'] = self.memory
+        return result
+
+    def __repr__(self):
+        return (f'BenchmarkResult(mode={self.mode!r}, throughput={self.throughput:.1f}/s, '
+                f'p50={self.percentile(50) * 1000:.2f}ms, p99={self.percentile(99) * 1000:.2f}ms, '
+                f'errors={self.errors})')
+
+
+def run_benchmark(server, mode='sync', scenario='mixed', requests=1000, concurrency=10, warmup=20,
+                  trace_memory=False, **client_options):
+    """ Makes `requests` calls to a running MockSwsServer and returns a BenchmarkResult
+        server : MockSwsServer
+            The server, which must be started
+        mode : str
+            'sync', 'threaded' or 'async'
+        scenario : str
+            Name of the calls to make, see SCENARIOS, or 'mixed' to cycle through all of them
+        requests : int
+            Number of calls to measure
+        concurrency : int
+            Maximum number of calls in progress at once in the threaded and async modes. The connection pool of the
+            client is sized to match.
+        warmup : int
+            Number of calls made before the measurement starts, e.g. to open the pooled connections
+        trace_memory : bool
+            If True, Python memory allocations are traced with tracemalloc while the calls run. Tracing slows every
+            allocation down, so the latencies of a traced run should not be compared with those of an untraced one.
+        client_options :
+            Extra arguments of the client, e.g. `retry_policy` or `response_cache`
+    """
+    if mode not in MODES:
+        raise ValueError(f'Unknown benchmark mode {mode!r}, expected one of {MODES}')
+    calls = _scenario_calls(scenario)
+    if mode == 'async':
+        run = _run_async
+    else:
+        run = _run_sync if mode == 'sync' else _run_threaded
+    latencies, errors, duration, memory = run(server, calls, requests, concurrency, warmup, trace_memory,
+                                              client_options)
+    return BenchmarkResult(mode=mode, scenario=scenario, requests=requests, concurrency=concurrency,
+                           duration=duration, latencies=latencies, errors=errors, server_stats=server.stats,
+                           memory=memory)
+
+
+def _authorize(client, server):
+    client.access_token, expires_at = server.issue_token()
+    client.refresh_token = 'bench-refresh-token'
+
+
+def _call_list(calls, client, count):
+    cycle = itertools.cycle(calls)
+    return [(lambda call=next(cycle), i=i: call(client, i)) for i in range(count)]
+
+
+class _Measurement(object):
+    # Times a run, and traces its memory allocations if requested
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.duration = None
+        self.memory = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.duration = time.perf_counter() - self._start
+        if self.trace_memory:
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = {'peak_bytes': peak, 'retained_bytes': retained}
+
+
+def _failed(response):
+    return response is None or not response.ok
+
+
+def _timed(call, latencies):
+    start = time.perf_counter()
+    try:
+        return call()
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+
+def _run_sync(server, calls, requests, concurrency, warmup, trace_memory, client_options):
+    client = SwsClient(app_id='benchmark', service_uri=server.service_uri(), **client_options)
+    _authorize(client, server)
+    latencies = []
+    errors = 0
+    try:
+        for call in _call_list(calls, client, warmup):
+            call()
+        server.reset_stats()
+        with _Measurement(trace_memory) as measurement:
+            for call in _call_list(calls, client, requests):
+                try:
+                    response = _timed(call, latencies)
+                except Exception:
+                    response = None
+                errors += _failed(response)
+    finally:
+        client.close()
+    return latencies, errors, measurement.duration, measurement.memory
+
+
+def _run_threaded(server, calls, requests, concurrency, warmup, trace_memory, client_options):
+    client = SwsClient(app_id='benchmark', service_uri=server.service_uri(),
+                       connection_pool=ConnectionPool(pool_maxsize=concurrency), **client_options)
+    _authorize(client, server)
+    latencies = []
+    errors = 0
+    try:
+        for result in client.batch(enumerate(_call_list(calls, client, warmup)), max_workers=concurrency):
+            pass
+        server.reset_stats()
+        timed_calls = ((i, lambda call=call: _timed(call, latencies))
+                       for i, call in enumerate(_call_list(calls, client, requests)))
+        with _Measurement(trace_memory) as measurement:
+            for result in client.batch(timed_calls, max_workers=concurrency):
+                errors += not result.ok
+    finally:
+        client.close()
+    return latencies, errors, measurement.duration, measurement.memory
+
+
+def _run_async(server, calls, requests, concurrency, warmup, trace_memory, client_options):
+    from sws_py_sdk.async_sws_client import AsyncSwsClient
+
+    async def timed(call, latencies):
+        start = time.perf_counter()
+        try:
+            return await call()
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        pool = AsyncConnectionPool(limit=concurrency, limit_per_host=concurrency)
+        async with AsyncSwsClient(app_id='benchmark', service_uri=server.service_uri(), connection_pool=pool,
+                                  **client_options) as client:
+            _authorize(client, server)
+            latencies = []
+            errors = 0
+            async for result in client.batch(enumerate(_call_list(calls, client, warmup)),
+                                             max_concurrency=concurrency):
+                pass
+            server.reset_stats()
+            timed_calls = ((i, lambda call=call: timed(call, latencies))
+                           for i, call in enumerate(_call_list(calls, client, requests)))
+            with _Measurement(trace_memory) as measurement:
+                async for result in client.batch(timed_calls, max_concurrency=concurrency):
+                    errors += not result.ok
+            return latencies, errors, measurement.duration, measurement.memory
+
+    return asyncio.run(run())
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ Compares results with those of an earlier run. Returns a description of every regression: a throughput
+        lower, or a p99 latency higher, than the baseline by more than `tolerance` (a fraction).
+        results : list
+            BenchmarkResult of the current run
+        baseline : list
+            Results of the earlier run, as returned by `BenchmarkResult.to_dict()`
+    """
+    earlier = {(result['mode'], result['scenario']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = earlier.get((result.mode, result.scenario))
+        if before is None:
+            continue
+        if result.throughput < before['throughput'] * (1 - tolerance):
+            regressions.append(f'{result.mode}/{result.scenario}: throughput fell from '
+                               f'{before["throughput"]:.1f}/s to {result.throughput:.1f}/s')
+        if result.percentile(99) > before['p99'] * (1 + tolerance):
+            regressions.append(f'{result.mode}/{result.scenario}: p99 latency rose from '
+                               f'{before["p99"] * 1000:.2f}ms to {result.percentile(99) * 1000:.2f}ms')
+    return regressions
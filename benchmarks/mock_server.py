@@ -0,0 +1,207 @@
+""" Lightweight local stand-in for the SWS id, license, ecom and cloudlib services.
+    Serves canned JSON for the endpoints exercised by the benchmarks from a single threaded HTTP/1.1 server, with
+    configurable latency, error rate and access token expiry. Uses only the standard library.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 401 response body of an expired or unknown access token, which makes SwsClient refresh the token and replay
+EXPIRED_TOKEN_BODY = {'code': 2002, 'error': 'Expired Access token'}
+UNAVAILABLE_BODY = {'code': 5001, 'error': 'Service Unavailable'}
+
+USER = {'id': 12345, 'email_address': 'example@example.com', 'first_name': 'Billy', 'last_name': 'Bob',
+        'locale': 'en_US.UTF-8'}
+
+
+def _licenses(match):
+    return {'items': [{'id': f'SDJ-{i}', 'product_type_id': 55, 'activation_limit': 2, 'deactivated': False}
+                      for i in range(5)]}
+
+
+def _product(match):
+    return {'id': match.group('product_id'), 'product_type': {'id': 55, 'name': 'Serato DJ Pro'}, 'licenses': []}
+
+
+def _product_types(match):
+    return {'items': [{'id': i, 'name': f'Product type {i}'} for i in range(20)]}
+
+
+def _user(match):
+    return USER
+
+
+def _subscriptions(match):
+    return {'items': [{'id': 'sub-1', 'status': 'Active', 'plan': 'dj-pro-monthly'}]}
+
+
+def _file(match):
+    return {'id': match.group('file_id'), 'name': 'track.mp3', 'mime_type': 'audio/mpeg', 'size': 5242880}
+
+
+# (method, path pattern, body factory) of the endpoints served with an access token
+ROUTES = [
+    ('GET', r'/api/v1/(me|users/\d+)', _user),
+    ('GET', r'/api/v1/(me|users/\d+)/licenses', _licenses),
+    ('GET', r'/api/v1/products/products/(?P<product_id>[^/]+)', _product),
+    ('GET', r'/api/v1/products/types', _product_types),
+    ('GET', r'/api/v1/(me|users/\d+)/subscriptions', _subscriptions),
+    ('GET', r'/api/v1/(me|users/\d+)/files/(?P<file_id>[^/]+)', _file),
+]
+
+TOKEN_REFRESH_PATH = '/api/v1/tokens/refresh'
+
+
+class MockSwsServer(object):
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, token_ttl=None, seed=None):
+        """ Create a stand-in server. Every service is served from the same address, see `service_uri()`.
+            host : str
+                Address to listen on
+            port : int
+                Port to listen on. A free port is picked if 0.
+            latency : float
+                Number of seconds each request is delayed by before it is answered
+            jitter : float
+                Maximum number of seconds randomly added to the latency of each request
+            error_rate : float
+                Fraction of requests answered with '503 Service Unavailable'
+            token_ttl : float
+                Number of seconds an access token issued by the server stays valid. Requests with an expired or
+                unknown token are answered with '401' code 2002. Any bearer token is accepted if None.
+            seed : int
+                Seed of the random latency jitter and errors, to make runs repeatable
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        self._random = random.Random(seed)
+        self._routes = [(method, re.compile(pattern + '$'), body) for method, pattern, body in ROUTES]
+        self._tokens = {}
+        self._token_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.stats = {}
+        self.reset_stats()
+
+    @property
+    def url(self):
+        """ Base URL of the running server """
+        return f'http://{self.host}:{self.port}'
+
+    def service_uri(self):
+        """ Returns the `service_uri` argument of a client sending every service's requests to this server """
+        return {service: self.url for service in ('id', 'license', 'ecom', 'cloudlib')}
+
+    def issue_token(self):
+        """ Issues an access token, valid for `token_ttl` seconds. Returns (token, expiry as a UNIX timestamp). """
+        ttl = self.token_ttl if self.token_ttl is not None else 3600
+        token = f'bench-token-{next(self._token_ids)}'
+        with self._lock:
+            self._tokens[token] = time.monotonic() + ttl
+        return token, int(time.time() + ttl)
+
+    def reset_stats(self):
+        """ Resets the counts of requests, errors, rejected tokens and token refreshes """
+        with self._lock:
+            self.stats = {'requests': 0, 'errors': 0, 'expired_tokens': 0, 'token_refreshes': 0}
+
+    def start(self):
+        """ Starts serving requests on a background thread """
+        server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        server.daemon_threads = True
+        self._server = server
+        self.port = server.server_address[1]
+        self._thread = threading.Thread(target=server.serve_forever, name='mock-sws-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the server """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def respond(self, method, path, headers):
+        """ Returns the (status, body) of the reply to a request """
+        with self._lock:
+            self.stats['requests'] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._count('errors')
+            return 503, UNAVAILABLE_BODY
+        if method == 'POST' and path == TOKEN_REFRESH_PATH:
+            self._count('token_refreshes')
+            token, expires_at = self.issue_token()
+            return 200, {'tokens': {'access': {'token': token, 'expires_at': expires_at, 'type': 'Bearer'},
+                                    'refresh': {'token': 'bench-refresh-token', 'expires_at': expires_at + 86400,
+                                                'type': 'Bearer'}}}
+        for route_method, pattern, body in self._routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                if not self._token_valid(headers.get('Authorization', '')):
+                    self._count('expired_tokens')
+                    return 401, EXPIRED_TOKEN_BODY
+                return 200, body(match)
+        return 404, {'code': 404, 'error': 'Not Found'}
+
+    def _token_valid(self, authorization):
+        if self.token_ttl is None:
+            return authorization.startswith('Bearer ')
+        with self._lock:
+            expires_at = self._tokens.get(authorization[len('Bearer '):])
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive connections, so that the pooled connections of the clients are reused
+        protocol_version = 'HTTP/1.1'
+        # The headers and body are written separately, so Nagle's algorithm would hold the body back for an ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            self._reply()
+
+        def do_POST(self):
+            self._reply()
+
+        def _reply(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            status, body = server.respond(self.command, self.path.split('?', 1)[0], self.headers)
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
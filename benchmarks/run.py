@@ -0,0 +1,81 @@
+""" Runs the client benchmarks against a local MockSwsServer, e.g.
+
+        python -m benchmarks.run --modes sync threaded async --requests 2000 --concurrency 20 --latency 0.002
+        python -m benchmarks.run --save baseline.json
+        python -m benchmarks.run --baseline baseline.json --tolerance 0.2
+
+    Exits with status 1 if a result regressed against the baseline.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.harness import MODES, SCENARIOS, compare, run_benchmark
+from benchmarks.mock_server import MockSwsServer
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SWS clients against a local mock server')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Client modes to measure')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS) + ['mixed'], default='mixed',
+                        help='Calls to make; mixed cycles through every scenario')
+    parser.add_argument('--requests', type=int, default=1000, help='Number of calls measured per mode')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='Calls in progress at once in the threaded and async modes')
+    parser.add_argument('--warmup', type=int, default=20, help='Calls made before each measurement')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the server delays each reply by')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum seconds of random extra latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of replies that are 503 errors')
+    parser.add_argument('--token-ttl', type=float, default=None,
+                        help='Seconds an access token stays valid, to measure token refreshes')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the server jitter and errors')
+    parser.add_argument('--memory', action='store_true',
+                        help='Also trace memory allocations, in a separate run of each mode')
+    parser.add_argument('--save', metavar='PATH', help='Write the results to a JSON file')
+    parser.add_argument('--baseline', metavar='PATH', help='Compare the results with those of a saved run')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction by which throughput or p99 latency may worsen before it is a regression')
+    return parser.parse_args(argv)
+
+
+def format_result(result):
+    line = (f'{result.mode:<9} {result.scenario:<14} {result.throughput:>10.1f}/s '
+            f'p50 {result.percentile(50) * 1000:>8.2f}ms  p99 {result.percentile(99) * 1000:>8.2f}ms  '
+            f'errors {result.errors:<5} refreshes {result.server_stats["token_refreshes"]}')
+    if result.memory is not None:
+        line += (f'  peak {result.memory["peak_bytes"] / 1024:.0f}KiB  '
+                 f'retained {result.memory["retained_bytes"] / result.requests:.0f}B/call')
+    return line
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = MockSwsServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           token_ttl=args.token_ttl, seed=args.seed)
+    results = []
+    with server:
+        for mode in args.modes:
+            result = run_benchmark(server, mode=mode, scenario=args.scenario, requests=args.requests,
+                                   concurrency=args.concurrency, warmup=args.warmup)
+            if args.memory:
+                # Tracing slows allocations down, so memory is measured separately from the timings
+                result.memory = run_benchmark(server, mode=mode, scenario=args.scenario, requests=args.requests,
+                                              concurrency=args.concurrency, warmup=args.warmup,
+                                              trace_memory=True).memory
+            results.append(result)
+            print(format_result(result))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump([result.to_dict() for result in results], f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), tolerance=args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,5 +20,9 @@ setuptools.setup(
   python_requires='>=3.7',
   install_requires=[
     'requests'
-  ]
+  ],
+  extras_require={
+    'async': ['aiohttp>=3.7'],   # Required by AsyncSwsClient
+    'tracing': ['opentelemetry-api>=1.0']   # Required by Tracing
+  }
 )
@@ -0,0 +1,372 @@
+""" Asyncio counterparts of the Web Service definitions.
+    Every endpoint method of the synchronous services returns an awaitable when called on these classes.
+"""
+import asyncio
+import contextvars
+import time
+from functools import partial
+
+from requests.exceptions import RequestException
+
+from sws_py_sdk.batch import BatchQueue, BatchResult
+from sws_py_sdk.cache import entry_from_response, response_from_entry
+from sws_py_sdk.download import DownloadFile
+from sws_py_sdk.service import RequestContext, Service, endpoint_template
+from sws_py_sdk.upload_journal import UploadCheckpoint
+from sws_py_sdk import identity, license, ecom, cloudlib, timeouts, upload
+
+# Number of chunks of a streamed response body that can be waiting for the caller to consume them
+STREAM_QUEUE_SIZE = 4
+
+
+class AsyncService(Service):
+
+    async def fetch(self,
+                    auth,
+                    endpoint,
+                    body={},
+                    params={},
+                    method='GET',
+                    timeout=None,
+                    headers={'Accept': 'application/json',
+                             'Content-Type': 'application/json'},
+                    sink=None,
+                    cache=False):
+        """ Asynchronous version of `Service.fetch`. Takes the same arguments, except for `stream`.
+            sink : function
+                If given, called with each chunk of the body of a successful response as it is received. The body is
+                then not kept in memory and the returned response has empty content. If the sink returns an
+                awaitable, it is awaited before the next chunk is read. Responses written to a sink are not cached.
+        """
+        cache_key = (self.cache_key(endpoint, body, params, auth, public=cache == 'public')
+                     if cache and method == 'GET' and sink is None else None)
+        response = self.cached_response(cache_key)
+        if response is not None:
+            self.record_cache_hit(endpoint, response)
+            return response
+        started = time.perf_counter()
+        call_timeout = timeouts.resolve(timeout, self.sws.timeout)
+        with timeouts.deadline(call_timeout.total):
+            request = self.build_request(
+                auth=auth,
+                endpoint=('' if self.service_uri.find('://') != -1 else 'https://') + self.service_uri + endpoint,
+                body=body,
+                method=method,
+                params=params,
+                timeout=timeout,
+                headers=headers)
+
+            context = RequestContext(request=request, timeout=call_timeout, endpoint=endpoint_template(endpoint),
+                                     sink=sink)
+            coalescing_key = self.coalescing_key(context)
+            try:
+                with self.call_span(context) as span:
+                    if coalescing_key is None:
+                        response = await self.fetch_request(request, context=context)
+                    else:
+                        response = await self.sws.request_coalescer.run_async(
+                            coalescing_key, lambda: self.fetch_request(request, context=context))
+                    self.trace_response(span, response, context)
+            except Exception as e:
+                self.record_call(context, started, exception=e)
+                raise
+        self.record_call(context, started, response=response)
+        self.cache_response(cache_key, response)
+        return response
+
+    async def fetch_request(self, request, timeout=None, context=None):
+        """ Sends the request through the asyncio connection pool - includes error handling
+            request : requests.Request
+                The HTTP request that is being sent.
+            timeout : Timeout | float
+                Connect and read timeouts for the request. Defaults to the client timeout.
+                Unlike the synchronous client, the deadline of the current call is enforced while the response is
+                being read, not just between requests.
+            context : RequestContext
+                State of the call the request belongs to. Created for the request if omitted.
+        """
+        if context is None:
+            context = RequestContext(request=request, timeout=timeouts.resolve(timeout, self.sws.timeout))
+        response = await self.send_request(context)
+        if self.is_invalid_access_token_response(response):
+            return await self.handle_invalid_access_token(response, context)
+
+        return response
+
+    async def send_request(self, context):
+        """ Asynchronous version of `Service.send_request`
+            context : RequestContext
+                State of the call the request belongs to
+        """
+        prepared_request = context.request.prepare()
+        stored = self.add_conditional_validators(context, prepared_request)
+        attempt = 1
+        while True:
+            try:
+                response = await self.send_attempt(context, prepared_request, attempt)
+            except RequestException as e:
+                delay = self.retry_delay(prepared_request.method, attempt, exception=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.retry_delay(prepared_request.method, attempt, response=response)
+                if delay is None:
+                    return self.conditional_response(stored, response)
+            await asyncio.sleep(delay)
+            attempt += 1
+            context.retries += 1
+
+    async def send_attempt(self, context, prepared_request, attempt):
+        """ Asynchronous version of `Service.send_attempt`. A cancelled attempt gives its trial slot back to the
+            circuit breaker.
+        """
+        self.check_circuit(context)
+        try:
+            await self.wait_for_rate_limit()
+            send = partial(self.sws.connection_pool.send, timeout=timeouts.attempt_timeouts(context.timeout),
+                           total_timeout=timeouts.remaining(), sink=context.sink,
+                           timings=context.timings if self.sws.metrics_hook is not None else None)
+            with self.request_span(context, prepared_request, attempt) as span:
+                response = await self.hedged_send(context, send, prepared_request)
+                self.trace_response(span, response)
+            return response
+        except BaseException:
+            self.release_circuit(context)
+            raise
+
+    async def hedged_send(self, context, send, prepared_request):
+        """ Asynchronous version of `Service.hedged_send`. The losing request of a hedged pair is cancelled.
+        """
+        key = self.hedging_key(context, prepared_request)
+        if key is None:
+            return await self.recorded_send(context, send, prepared_request)
+        return await self.sws.hedging_policy.send_async(key, partial(self.recorded_send, context, send),
+                                                        prepared_request,
+                                                        hedge_send=partial(self.send_hedge, context, send))
+
+    async def send_hedge(self, context, send, prepared_request):
+        """ Asynchronous version of `Service.send_hedge`
+        """
+        self.check_circuit(context)
+        try:
+            await self.wait_for_rate_limit()
+            return await self.recorded_send(context, send, prepared_request)
+        except BaseException:
+            self.release_circuit(context)
+            raise
+
+    async def wait_for_rate_limit(self):
+        """ Asynchronous version of `Service.wait_for_rate_limit`
+        """
+        rate_limit_delay = self.rate_limit_delay()
+        if rate_limit_delay > 0:
+            await asyncio.sleep(rate_limit_delay)
+
+    async def recorded_send(self, context, send, prepared_request):
+        """ Asynchronous version of `Service.recorded_send`. A request cancelled because its hedge answered first, or
+            because its call was cancelled, is not recorded.
+        """
+        try:
+            response = await send(prepared_request)
+        except RequestException as e:
+            self.record_circuit(context, exception=e)
+            raise
+        except BaseException:
+            self.release_circuit(context)
+            raise
+        self.record_circuit(context, response=response)
+        return response
+
+
+class AsyncIdentity(AsyncService, identity.Identity):
+    pass
+
+
+class AsyncLicense(AsyncService, license.License):
+
+    async def _change_products(self, product_ids, write):
+        try:
+            return await write()
+        finally:
+            for product_id in product_ids:
+                self.invalidate_product(product_id)
+
+
+class AsyncEcom(AsyncService, ecom.Ecom):
+
+    async def stream_invoice(self, order_id, invoice_id, accept='application/pdf'):
+        """ Asynchronous version of `Ecom.stream_invoice`. Returns an async iterator of the chunks of the invoice as
+            they are received, rather than a response. At most a few chunks are held in memory: reading from the
+            network waits for the caller to consume them. Raises `requests.HTTPError` if the request fails.
+        """
+        chunks = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        fetch = asyncio.ensure_future(self.fetch(
+            auth='bearer',
+            endpoint=self._invoice_endpoint(order_id, invoice_id),
+            method='GET',
+            headers={'Accept': accept},
+            sink=chunks.put
+        ))
+        try:
+            while True:
+                chunk = asyncio.ensure_future(chunks.get())
+                await asyncio.wait({chunk, fetch}, return_when=asyncio.FIRST_COMPLETED)
+                if not chunk.done():
+                    chunk.cancel()
+                    break
+                yield chunk.result()
+            # The request has completed, so no more chunks are added
+            while not chunks.empty():
+                yield chunks.get_nowait()
+            fetch.result().raise_for_status()
+        finally:
+            fetch.cancel()
+
+    async def download_invoice(self, order_id, invoice_id, destination, accept='application/pdf'):
+        """ Asynchronous version of `Ecom.download_invoice`. The invoice is written as it is received.
+        """
+        download = DownloadFile(destination)
+        try:
+            response = await self.fetch(
+                auth='bearer',
+                endpoint=self._invoice_endpoint(order_id, invoice_id),
+                method='GET',
+                headers={'Accept': accept},
+                sink=download.write
+            )
+        except BaseException:
+            download.discard()
+            raise
+        if response.ok:
+            download.commit()
+        else:
+            download.discard()
+        return response
+
+    def download_invoices(self, invoices, directory, accept='application/pdf', max_concurrency=10):
+        """ Asynchronous version of `Ecom.download_invoices`. Returns an async iterator of BatchResult.
+        """
+        return self.sws.batch(self._invoice_downloads(invoices, directory, accept), max_concurrency=max_concurrency)
+
+
+class AsyncCloudlib(AsyncService, cloudlib.Cloudlib):
+
+    def upload_files(self, paths, user_id=None, max_concurrency=10, part_workers=4, progress_callback=None,
+                     resolve_upload_target=upload.upload_target_from_response, journal=None):
+        """ Asynchronous version of `Cloudlib.upload_files`. Returns an async iterator of BatchResult.
+        """
+        return self.sws.batch(self._file_uploads(paths, user_id, part_workers, progress_callback,
+                                                 resolve_upload_target, journal),
+                              max_concurrency=max_concurrency)
+
+    async def get_files(self, file_ids, user_id=None, max_concurrency=10, cache=None):
+        """ Asynchronous version of `Cloudlib.get_files`. Returns an async iterator of BatchResult.
+        """
+        pending = []
+        for file_id in file_ids:
+            entry = cache.get(self._file_cache_key(user_id, file_id)) if cache is not None else None
+            if entry is not None:
+                yield BatchResult(file_id, response=response_from_entry(entry))
+            else:
+                pending.append(file_id)
+        async for result in self.sws.batch(self._file_lookups(pending, user_id, cache),
+                                           max_concurrency=max_concurrency):
+            yield result
+
+    async def _get_file(self, user_id, file_id, cache):
+        response = await self._get_uploaded_file(user_id, file_id)
+        if cache is not None and response.ok:
+            cache.set(self._file_cache_key(user_id, file_id), entry_from_response(response))
+        return response
+
+    async def sync_files(self, files, max_concurrency=10, part_workers=4, progress_callback=None,
+                         resolve_upload_target=upload.upload_target_from_response, journal=None, hash_cache=None):
+        """ Asynchronous version of `Cloudlib.sync_files`. Returns an async iterator of BatchResult.
+        """
+        # Hashing reads the files, so it is done off the event loop
+        loop = asyncio.get_running_loop()
+        plan = await loop.run_in_executor(None, partial(upload.SyncPlan, files, hash_cache=hash_cache))
+        first, followers = plan.schedule()
+        calls = BatchQueue(self._sync_uploads(plan, first, part_workers, progress_callback, resolve_upload_target,
+                                              journal))
+        async for result in self.sws.batch(calls, max_concurrency=max_concurrency):
+            calls.extend(self._sync_uploads(plan, followers.pop(result.key, ()), part_workers, progress_callback,
+                                            resolve_upload_target, journal))
+            for file_result in cloudlib._sync_results(plan, result):
+                yield file_result
+
+    async def _upload_file(self, user_id, path, name, max_workers, progress_callback, resolve_upload_target,
+                           journal):
+        # Hashing reads the whole file, so it is done off the event loop
+        loop = asyncio.get_running_loop()
+        descriptor = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                partial(upload.prepare_upload, path, name=name))
+        return await self._upload(user_id, descriptor, max_workers, progress_callback, resolve_upload_target,
+                                  journal)
+
+    async def _upload(self, user_id, descriptor, max_workers, progress_callback, resolve_upload_target, journal):
+        checkpoint = UploadCheckpoint(journal, user_id, descriptor)
+        entry = checkpoint.entry()
+        if entry is not None:
+            response = await self._get_uploaded_file(user_id, entry.file_id)
+            if checkpoint.is_gone(response):
+                entry = None
+            elif entry.complete or not response.ok:
+                return upload.UploadResult(descriptor, response, resumed=True)
+        if entry is None:
+            response = await self._create_upload(user_id, descriptor)
+            target = resolve_upload_target(response, descriptor.size) if response.ok else None
+            entry = checkpoint.start(response, target)
+            if target is None:
+                return upload.UploadResult(descriptor, response)
+        progress = upload.UploadProgress(descriptor, progress_callback)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def send_part(index, part):
+            async with semaphore:
+                part_response = await self._send_upload_part(descriptor, entry.target, part, progress)
+            checkpoint.record_part(entry, index, part_response)
+            return part_response
+
+        pending = checkpoint.pending_parts(entry, progress)
+        part_responses = await asyncio.gather(*(send_part(index, part) for index, part in pending))
+        checkpoint.finish(entry, part_responses)
+        return upload.UploadResult(descriptor, response, part_responses, resumed=checkpoint.resumed)
+
+    async def _send_upload_part(self, descriptor, target, part, progress):
+        """ Asynchronous version of `Cloudlib._send_upload_part`. File reads are done off the event loop.
+        """
+        timeout = timeouts.resolve(None, self.sws.timeout)
+        body = upload.FilePart(descriptor.path, part.offset, part.size, progress=progress)
+        attempt = 1
+        try:
+            while True:
+                request = self._upload_part_request(descriptor, target, part)
+                request.headers['Content-Length'] = str(part.size)
+                request.body = _read_chunks(body)
+                try:
+                    response = await self.sws.connection_pool.send(request,
+                                                                   timeout=timeouts.attempt_timeouts(timeout),
+                                                                   total_timeout=timeouts.remaining())
+                except RequestException as e:
+                    delay = self.retry_delay(request.method, attempt, exception=e)
+                    if delay is None:
+                        raise
+                else:
+                    delay = self.retry_delay(request.method, attempt, response=response)
+                    if delay is None:
+                        return response
+                body.rewind()
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            body.close()
+
+
+async def _read_chunks(body):
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, body.read, body.chunk_size)
+        if not chunk:
+            return
+        yield chunk
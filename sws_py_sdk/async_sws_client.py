@@ -0,0 +1,162 @@
+""" Asyncio version of the client.
+    Endpoint methods return awaitables and requests are sent through a shared aiohttp connection pool,
+    so a single event loop can drive many concurrent SWS calls.
+"""
+import asyncio
+
+from requests.exceptions import RequestException
+
+from sws_py_sdk.async_service import AsyncIdentity, AsyncLicense, AsyncEcom, AsyncCloudlib
+from sws_py_sdk.batch import run_batch_async
+from sws_py_sdk.connection_pool import AsyncConnectionPool
+from sws_py_sdk.sws_client import SwsClient
+
+
+class AsyncSwsClient(SwsClient):
+
+    def __init__(self, app_id, secret=None, user_id=0, timeout=3000, service_uri={}, auto_refresh=True, test_env=False,
+                 cdn_auth_id=None, cdn_auth_secret=None, connection_pool=None, retry_policy=None,
+                 rate_limits={}, circuit_breaker=None, response_cache=None, conditional_cache=None,
+                 request_coalescer=None, hedging_policy=None, firewall_header=None, metrics_hook=None,
+                 tracing=None):
+        """
+        Create an asyncio SWS client. Takes the same arguments as `SwsClient`, and requires the optional `aiohttp`
+        dependency.
+
+        connection_pool : AsyncConnectionPool
+            Pool of keep-alive HTTP connections used by every service. A default pool is created if omitted.
+        """
+        super().__init__(app_id=app_id, secret=secret, user_id=user_id, timeout=timeout, service_uri=service_uri,
+                         auto_refresh=auto_refresh, test_env=test_env, cdn_auth_id=cdn_auth_id,
+                         cdn_auth_secret=cdn_auth_secret,
+                         connection_pool=connection_pool if connection_pool is not None else AsyncConnectionPool(),
+                         retry_policy=retry_policy, rate_limits=rate_limits,
+                         circuit_breaker=circuit_breaker, response_cache=response_cache,
+                         conditional_cache=conditional_cache, request_coalescer=request_coalescer,
+                         hedging_policy=hedging_policy, firewall_header=firewall_header,
+                         metrics_hook=metrics_hook, tracing=tracing)
+        self.service = {
+            'id': AsyncIdentity(sws=self),
+            'license': AsyncLicense(sws=self),
+            'ecom': AsyncEcom(sws=self),
+            'cloudlib': AsyncCloudlib(sws=self)
+        }
+        self._async_refresh_lock = None
+        self._refresh_scheduler_task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """ Stops the token refresh scheduler and closes the pooled HTTP connections used by the services """
+        await self.stop_token_refresh_scheduler()
+        await self.connection_pool.close()
+
+    def batch(self, calls, max_concurrency=100):
+        """ Runs many service calls concurrently and yields a BatchResult for each as it completes, e.g.
+
+            calls = {product_id: partial(client.license().get_product_info, product_id) for product_id in product_ids}
+            async for result in client.batch(calls, max_concurrency=100):
+                ...
+
+            calls : dict | iterable
+                Maps keys to calls taking no arguments and returning an awaitable, either as a dict or as (key, call)
+                pairs
+            max_concurrency : int
+                Maximum number of calls in progress at once
+        """
+        return run_batch_async(calls, max_concurrency=max_concurrency)
+
+    async def refresh_access_token(self):
+        """
+        Refreshes the access token using the refresh token.
+
+        :return: The token refresh response.
+        :rtype: requests.Response
+        """
+        async with self._get_async_refresh_lock():
+            return await self._refresh_access_token()
+
+    def start_token_refresh_scheduler(self, refresh_margin=60, jitter=15, poll_interval=30):
+        """
+        Starts an asyncio task that refreshes the access token shortly before it expires. Must be called from a running
+        event loop. Takes the same arguments as `SwsClient.start_token_refresh_scheduler`.
+
+        :return: The scheduler task.
+        :rtype: asyncio.Task
+        """
+        if self._refresh_scheduler_task is None or self._refresh_scheduler_task.done():
+            self._refresh_scheduler_task = asyncio.ensure_future(
+                self._run_token_refresh_scheduler(refresh_margin, jitter, poll_interval)
+            )
+        return self._refresh_scheduler_task
+
+    async def stop_token_refresh_scheduler(self):
+        """
+        Stops the token refresh task, if it is running.
+
+        :return: Nothing.
+        """
+        if self._refresh_scheduler_task is not None:
+            self._refresh_scheduler_task.cancel()
+            try:
+                await self._refresh_scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_scheduler_task = None
+
+    async def _run_token_refresh_scheduler(self, refresh_margin, jitter, poll_interval):
+        while True:
+            delay = self._next_refresh_delay(refresh_margin, jitter)
+            if delay is None or delay > poll_interval:
+                await asyncio.sleep(poll_interval)
+                continue
+            await asyncio.sleep(max(delay, 0))
+            try:
+                await self.refresh_access_token()
+            except RequestException:
+                pass
+            if self._token_refresh_failed(refresh_margin):
+                await asyncio.sleep(poll_interval)
+
+    async def _refresh_access_token(self):
+        response = await self.identity().token_refresh(self.refresh_token)
+        data = response.json()
+        if 'tokens' in data:
+            self._update_access_token(data)
+        return response
+
+    def _get_async_refresh_lock(self):
+        #   Created on first use so that it belongs to the running event loop
+        if self._async_refresh_lock is None:
+            self._async_refresh_lock = asyncio.Lock()
+        return self._async_refresh_lock
+
+    async def _handle_invalid_access_token(self, service, response, context):
+        """
+        Asynchronous version of `SwsClient._handle_invalid_access_token`.
+
+        :param AsyncService service: The service which failed to fulfill a request due to an invalid access token.
+        :param requests.Response response: The response given due to the invalid access token.
+        :param RequestContext context: State of the call that failed, including the request to replay.
+        :return: A HTTP response.
+        :rtype: requests.Response
+        """
+        if self.auto_refresh:
+            #   Only one task refreshes the token at a time, the others wait for it and reuse the new token
+            async with self._get_async_refresh_lock():
+                if self._needs_refresh(response.request):
+                    with self._token_refresh_span():
+                        response = await self._refresh_access_token()
+
+                    if 'tokens' not in response.json():
+                        return response
+
+            #   Replay the failed request with a new Authorization header
+            context.request.headers['Authorization'] = f'Bearer {self.access_token}'
+            context.token_refreshed = True
+            return await service.fetch_request(context.request, context=context)
+        return response
@@ -0,0 +1,138 @@
+""" Concurrent execution of many service calls, e.g. fetching product information for thousands of product IDs.
+    Calls share the client connection pool, token refresh, rate limiters and circuit breaker.
+"""
+import asyncio
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class BatchResult(object):
+    def __init__(self, key, response=None, exception=None):
+        """ Outcome of one call of a batch
+            key :
+                Key identifying the call, as given when the batch was submitted
+            response : requests.Response
+                The response of the call, if it did not raise an exception
+            exception : Exception
+                The exception raised by the call, if any
+        """
+        self.key = key
+        self.response = response
+        self.exception = exception
+
+    @property
+    def ok(self):
+        """ True if the call completed without an exception and with a successful HTTP status """
+        return self.exception is None and self.response is not None and self.response.ok
+
+    def __repr__(self):
+        outcome = repr(self.exception) if self.exception is not None else self.response
+        return f'BatchResult(key={self.key!r}, {outcome})'
+
+
+class BatchQueue(object):
+
+    def __init__(self, calls=()):
+        """ Calls of a batch to which more calls can be added while its results are consumed, e.g. calls that can
+            only start once another call of the batch has completed. The batch ends once no call is in progress and
+            the queue is empty.
+            calls : iterable
+                Initial (key, call) pairs
+        """
+        self._calls = deque(calls)
+
+    def extend(self, calls):
+        """ Adds (key, call) pairs to the batch """
+        self._calls.extend(calls)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # Unlike a generator, the queue can yield calls again after it has been found empty
+        if not self._calls:
+            raise StopIteration
+        return self._calls.popleft()
+
+
+def _items(calls):
+    if isinstance(calls, BatchQueue):
+        return calls
+    return iter(calls.items()) if isinstance(calls, dict) else iter(calls)
+
+
+def run_batch(calls, max_workers=10):
+    """ Runs calls on a bounded thread pool and yields a BatchResult for each as it completes.
+        Calls are submitted as workers free up, so `calls` can be a lazy iterable of any length, or a BatchQueue.
+        calls : dict | iterable
+            Maps keys to calls, either as a dict or as (key, call) pairs. Each call is a function taking no arguments,
+            e.g. `functools.partial(sws.license().get_product_info, product_id)`.
+        max_workers : int
+            Maximum number of calls in progress at once. Should not exceed the `pool_maxsize` of the client connection
+            pool, or the extra connections will not be kept alive.
+    """
+    pending_calls = _items(calls)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def submit_next():
+            for key, call in pending_calls:
+                # Run each call in a copy of the caller's context so that timeout overrides apply to it
+                in_flight[executor.submit(contextvars.copy_context().run, call)] = key
+                return True
+            return False
+
+        while True:
+            # Calls added to a BatchQueue while the last results were consumed are submitted here
+            while len(in_flight) < max_workers and submit_next():
+                pass
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = in_flight.pop(future)
+                submit_next()
+                exception = future.exception()
+                if exception is not None:
+                    yield BatchResult(key, exception=exception)
+                else:
+                    yield BatchResult(key, response=future.result())
+
+
+async def run_batch_async(calls, max_concurrency=100):
+    """ Runs asynchronous calls with bounded concurrency and yields a BatchResult for each as it completes.
+        calls : dict | iterable
+            Maps keys to calls, either as a dict, as (key, call) pairs or as a BatchQueue. Each call is a function
+            taking no arguments and returning an awaitable, e.g.
+            `functools.partial(client.license().get_product_info, product_id)`.
+        max_concurrency : int
+            Maximum number of calls in progress at once
+    """
+    pending_calls = _items(calls)
+    in_flight = {}
+
+    def submit_next():
+        for key, call in pending_calls:
+            in_flight[asyncio.ensure_future(call())] = key
+            return True
+        return False
+
+    try:
+        while True:
+            while len(in_flight) < max_concurrency and submit_next():
+                pass
+            if not in_flight:
+                break
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = in_flight.pop(task)
+                submit_next()
+                if task.exception() is not None:
+                    yield BatchResult(key, exception=task.exception())
+                else:
+                    yield BatchResult(key, response=task.result())
+    finally:
+        # The caller stopped iterating early: do not leave calls running in the background
+        for task in in_flight:
+            task.cancel()
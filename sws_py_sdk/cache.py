@@ -0,0 +1,291 @@
+""" Caching of service responses.
+    Every cache has the same interface, so the response caches of an Sws instance can be kept in process memory
+    (TTLCache), in a SQLite file shared by the worker processes of a host (SQLiteCache), or in a Redis-compatible
+    server (RedisCache).
+    Responses are cached in the storable form returned by `entry_from_response`, which leaves out the request and so
+    never contains the access token.
+"""
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+_MISSING = object()
+
+
+class Cache(object):
+    """ Interface of the caches. Keys are tuples of strings, numbers and None. Values stored outside of the process
+        are serialised as JSON, so they must be made of dicts, lists, strings, numbers, booleans, None and bytes.
+    """
+
+    def get(self, key, default=None):
+        """ Returns the value cached for a key, or `default` if there is none or it has expired """
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """ Caches a value for `ttl` seconds, or for the default TTL of the cache """
+        raise NotImplementedError
+
+    def invalidate(self, key):
+        """ Removes the value cached for a key, if any """
+        raise NotImplementedError
+
+    def invalidate_matching(self, predicate):
+        """ Removes every value whose key satisfies `predicate(key)` """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Removes every value """
+        raise NotImplementedError
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+
+def entry_from_response(response):
+    """ Returns the storable form of a response: its status, reason, headers, URL and body. The request it was sent
+        with is left out, so that its Authorization header is never stored.
+    """
+    return {
+        'status_code': response.status_code,
+        'reason': response.reason,
+        'headers': dict(response.headers),
+        'url': response.url,
+        'content': response.content,
+    }
+
+
+def response_from_entry(entry):
+    """ Builds a response from its storable form, see `entry_from_response` """
+    response = Response()
+    response.status_code = entry['status_code']
+    response.reason = entry['reason']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = entry['url']
+    response._content = entry['content']
+    return response
+
+
+def _key_digest(key):
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+def _dumps(value):
+    # JSON rather than pickle, so that reading a shared cache can never run code
+    return json.dumps(value, default=_encode_bytes)
+
+
+def _loads(data):
+    return json.loads(data, object_hook=_decode_bytes)
+
+
+def _encode_bytes(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'{type(value).__name__} values cannot be stored in a shared cache')
+
+
+def _decode_bytes(value):
+    if len(value) == 1 and '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+
+def _key_from_json(key):
+    # JSON turns the tuples of a key into lists
+    return tuple(_key_from_json(item) for item in key) if isinstance(key, list) else key
+
+
+class TTLCache(Cache):
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """ Create a thread-safe cache whose entries expire after a time to live. Once the cache is full, the least
+            recently used entry is evicted to make room for a new one.
+            maxsize : int
+                Maximum number of entries
+            ttl : float
+                Default number of seconds an entry stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ Returns the value cached for a key, or `default` if there is none or it has expired """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """ Caches a value
+            key :
+                Hashable key of the value
+            value :
+                The value to cache
+            ttl : float
+                Number of seconds the value stays valid. Defaults to the TTL of the cache.
+        """
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """ Removes the value cached for a key, if any """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, predicate):
+        """ Removes every value whose key satisfies `predicate(key)` """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        """ Removes every value """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache(Cache):
+
+    # Number of seconds within which the recency of an entry is not updated again. Recency is only needed for
+    # eviction, so most reads of a hot entry are read-only and do not wait for each other.
+    touch_interval = 1.0
+
+    def __init__(self, path, maxsize=10000, ttl=60):
+        """ Create a cache stored in a SQLite database, which the processes of a host can share. Once the cache is
+            full, the least recently used entries are evicted.
+            path : str
+                Path of the database file
+            maxsize : int
+                Maximum number of entries
+            ttl : float
+                Default number of seconds an entry stays valid
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Wait for other processes instead of failing while they write
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS entries (digest TEXT PRIMARY KEY, key BLOB NOT NULL, '
+                                     'value BLOB NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)')
+
+    def get(self, key, default=None):
+        digest = _key_digest(key)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT value, expires_at, used_at FROM entries WHERE digest = ?',
+                                           (digest,)).fetchone()
+            # Expired entries are left for `set` to delete, so that reads do not take the write lock of the database
+            if row is None or row[1] <= now:
+                return default
+            if now - row[2] > self.touch_interval:
+                self._connection.execute('UPDATE entries SET used_at = ? WHERE digest = ?', (now, digest))
+        return _loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+            self._connection.execute('INSERT OR REPLACE INTO entries (digest, key, value, expires_at, used_at) '
+                                     'VALUES (?, ?, ?, ?, ?)',
+                                     (_key_digest(key), _dumps(key), _dumps(value), expires_at, now))
+            self._connection.execute('DELETE FROM entries WHERE digest IN (SELECT digest FROM entries '
+                                     'ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def invalidate(self, key):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries WHERE digest = ?', (_key_digest(key),))
+
+    def invalidate_matching(self, predicate):
+        with self._lock, self._connection:
+            digests = [(digest,) for digest, key in self._connection.execute('SELECT digest, key FROM entries')
+                       if predicate(_key_from_json(_loads(key)))]
+            self._connection.executemany('DELETE FROM entries WHERE digest = ?', digests)
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class RedisCache(Cache):
+
+    def __init__(self, client, ttl=60, prefix='sws:'):
+        """ Create a cache stored in a Redis-compatible server, which every process that can reach the server can
+            share. Eviction of the least recently used entries is left to the server's `maxmemory-policy`.
+            client :
+                Client of the server with the interface of `redis.Redis`: `get(name)`, `set(name, value, px=...)`,
+                `delete(*names)` and `scan_iter(match=...)`. Any compatible client works, e.g. one connected to a
+                local stand-in server.
+            ttl : float
+                Default number of seconds an entry stays valid
+            prefix : str
+                Prefix of the names of the entries on the server, so that several caches can share it
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        data = self.client.get(self._name(key))
+        if data is None:
+            return default
+        return _loads(data)[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        # The key is stored with the value so that `invalidate_matching` can test it
+        self.client.set(self._name(key), _dumps([key, value]), px=max(1, int(ttl * 1000)))
+
+    def invalidate(self, key):
+        self.client.delete(self._name(key))
+
+    def invalidate_matching(self, predicate):
+        names = []
+        for name in self.client.scan_iter(match=f'{self.prefix}*'):
+            data = self.client.get(name)
+            if data is not None and predicate(_key_from_json(_loads(data)[0])):
+                names.append(name)
+        if names:
+            self.client.delete(*names)
+
+    def clear(self):
+        names = list(self.client.scan_iter(match=f'{self.prefix}*'))
+        if names:
+            self.client.delete(*names)
+
+    def _name(self, key):
+        return self.prefix + _key_digest(key)
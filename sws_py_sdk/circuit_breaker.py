@@ -0,0 +1,150 @@
+""" Circuit breaker for SWS endpoints.
+    After repeated failures of an endpoint, calls to it fail immediately for a while instead of each one waiting for
+    the degraded service to time out.
+"""
+import threading
+import time
+
+from requests.exceptions import ConnectionError, RequestException, Timeout
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RequestException):
+    """ Raised instead of sending a request while the circuit of its endpoint is open """
+
+
+class _Circuit(object):
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.trial_started_at = 0.0
+
+
+class CircuitBreaker(object):
+
+    def __init__(self,
+                 failure_threshold=5,
+                 recovery_timeout=30,
+                 half_open_max_calls=1,
+                 failure_statuses=(500, 502, 503, 504),
+                 state_change_callback=None):
+        """ Create a circuit breaker. Each endpoint has its own circuit, keyed by service key and endpoint template,
+            e.g. ('license', '/api/v1/users/{id}/licenses').
+            failure_threshold : int
+                Number of consecutive failures that opens a circuit
+            recovery_timeout : float
+                Number of seconds a circuit stays open before trial requests are let through (half-open state)
+            half_open_max_calls : int
+                Maximum number of trial requests in flight while a circuit is half-open. Trials whose outcome has
+                not been recorded after `recovery_timeout` seconds no longer count.
+            failure_statuses : tuple
+                HTTP status codes counted as failures. Connection errors and timeouts are always failures.
+            state_change_callback : function
+                Called as `callback(key, old_state, new_state)` whenever a circuit changes state.
+                States are 'closed', 'open' and 'half_open'.
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.failure_statuses = frozenset(failure_statuses)
+        self.state_change_callback = state_change_callback
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def state(self, key):
+        """ Returns the state of the circuit for a key: 'closed', 'open' or 'half_open' """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit.state if circuit is not None else CLOSED
+
+    def before_request(self, key):
+        """ Must be called before sending a request. Raises CircuitOpenError if the request must not be sent.
+            key : tuple
+                (service key, endpoint template) of the request
+        """
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            if circuit.state == OPEN:
+                if time.monotonic() - circuit.opened_at < self.recovery_timeout:
+                    raise CircuitOpenError(f'Circuit for {key[0]} {key[1]} is open')
+                changes.append(self._set_state(key, circuit, HALF_OPEN))
+            if circuit.state == HALF_OPEN:
+                now = time.monotonic()
+                if circuit.half_open_calls >= self.half_open_max_calls:
+                    # Trials whose outcome was never recorded, e.g. because they were lost, do not block the circuit
+                    if now - circuit.trial_started_at < self.recovery_timeout:
+                        raise CircuitOpenError(f'Circuit for {key[0]} {key[1]} is half-open')
+                    circuit.half_open_calls = 0
+                circuit.half_open_calls += 1
+                circuit.trial_started_at = now
+        self._notify(changes)
+
+    def release(self, key):
+        """ Must be called instead of `record` when a request allowed by `before_request` is not sent, e.g. because
+            waiting for the rate limiter would take it past its deadline
+            key : tuple
+                (service key, endpoint template) of the request
+        """
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is not None and circuit.state == HALF_OPEN and circuit.half_open_calls > 0:
+                circuit.half_open_calls -= 1
+
+    def record(self, key, response=None, exception=None):
+        """ Records the outcome of a request that was allowed by `before_request`
+            key : tuple
+                (service key, endpoint template) of the request
+            response : requests.Response
+                The response received, if any
+            exception : Exception
+                The exception raised while sending the request, if any
+        """
+        if self.is_failure(response=response, exception=exception):
+            self.record_failure(key)
+        else:
+            self.record_success(key)
+
+    def is_failure(self, response=None, exception=None):
+        """ Determines whether the outcome of a request counts as a failure of the endpoint """
+        if exception is not None:
+            return isinstance(exception, (ConnectionError, Timeout))
+        return response is not None and response.status_code in self.failure_statuses
+
+    def record_success(self, key):
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures = 0
+            if circuit.state == HALF_OPEN:
+                circuit.half_open_calls = 0
+                changes.append(self._set_state(key, circuit, CLOSED))
+        self._notify(changes)
+
+    def record_failure(self, key):
+        changes = []
+        with self._lock:
+            circuit = self._circuits.setdefault(key, _Circuit())
+            circuit.failures += 1
+            if circuit.state == HALF_OPEN or circuit.failures >= self.failure_threshold:
+                circuit.half_open_calls = 0
+                circuit.opened_at = time.monotonic()
+                if circuit.state != OPEN:
+                    changes.append(self._set_state(key, circuit, OPEN))
+        self._notify(changes)
+
+    def _set_state(self, key, circuit, state):
+        old_state = circuit.state
+        circuit.state = state
+        return key, old_state, state
+
+    def _notify(self, changes):
+        # Callbacks are made outside of the lock so that they can safely query the breaker
+        if self.state_change_callback is not None:
+            for key, old_state, new_state in changes:
+                self.state_change_callback(key, old_state, new_state)
@@ -1,11 +1,26 @@
 """ This file exposes endpoints from the SWS Cloud Libary Service
 """
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+from requests import Request
+from requests.exceptions import RequestException
+
+from sws_py_sdk import timeouts
+from sws_py_sdk.batch import BatchQueue, BatchResult
+from sws_py_sdk.cache import entry_from_response, response_from_entry
 from sws_py_sdk.service import Service
+from sws_py_sdk.upload import (FilePart, SyncPlan, UploadProgress, UploadResult, _list_files, prepare_upload,
+                               upload_target_from_response)
+from sws_py_sdk.upload_journal import UploadCheckpoint
 
 
 class Cloudlib(Service):
 
+    service_key = 'cloudlib'
+
     def __init__(self, sws):
         super().__init__(sws)
         self.service_uri = sws.service_uris['cloudlib']
@@ -79,3 +94,228 @@ class Cloudlib(Service):
             method='GET',
 
         )
+
+    def get_files(self, file_ids, user_id=None, max_workers=10, cache=None):
+        """ Gets the details of many files concurrently. Yields a BatchResult keyed by file ID for each file as it
+            completes.
+            file_ids : iterable
+                File IDs
+            user_id : int
+                User the files belong to. Defaults to the authenticated user.
+            max_workers : int
+                Maximum number of requests in progress at once
+            cache : TTLCache
+                If given, successful responses are cached, and a file whose response is cached is not fetched again
+                until it expires. A TTL of a few seconds suits polling the files of an upload in progress.
+        """
+        pending = []
+        for file_id in file_ids:
+            entry = cache.get(self._file_cache_key(user_id, file_id)) if cache is not None else None
+            if entry is not None:
+                yield BatchResult(file_id, response=response_from_entry(entry))
+            else:
+                pending.append(file_id)
+        yield from self.sws.batch(self._file_lookups(pending, user_id, cache), max_workers=max_workers)
+
+    def _file_lookups(self, file_ids, user_id, cache):
+        for file_id in file_ids:
+            yield file_id, partial(self._get_file, user_id, file_id, cache)
+
+    def _file_cache_key(self, user_id, file_id):
+        return self.service_key, 'file', user_id, file_id, self.service_uri, self.cache_identity('bearer')
+
+    def _get_file(self, user_id, file_id, cache):
+        response = self._get_uploaded_file(user_id, file_id)
+        if cache is not None and response.ok:
+            cache.set(self._file_cache_key(user_id, file_id), entry_from_response(response))
+        return response
+
+    def me_upload_file(self, path, name=None, max_workers=4, progress_callback=None,
+                       resolve_upload_target=upload_target_from_response, journal=None):
+        """ Uploads a file: creates the file upload, then sends the content of the file to the upload target returned
+            by the service, if any. The file is streamed from disk and the parts of a multipart upload are sent in
+            parallel. Returns an UploadResult.
+            path : str
+                Path of the file
+            name : str
+                Name of the file. Defaults to the base name of the path.
+            max_workers : int
+                Maximum number of parts of the file sent at once
+            progress_callback : function
+                Called as `callback(descriptor, bytes_sent, total_bytes)` as the content is sent
+            resolve_upload_target : function
+                Called as `resolve_upload_target(response, size)` with the response creating the upload. Returns the
+                UploadTarget the content is sent to, or None if no content needs to be sent.
+                See `upload_target_from_response`.
+            journal : UploadJournal
+                If given, the progress of the upload is recorded in the journal. A file the journal records as
+                uploaded is only verified with `me_get_file`, and an interrupted upload only sends the parts that
+                were not sent, after checking that its file still exists.
+        """
+        return self._upload_file(None, path, name, max_workers, progress_callback, resolve_upload_target, journal)
+
+    def user_upload_file(self, user_id, path, name=None, max_workers=4, progress_callback=None,
+                         resolve_upload_target=upload_target_from_response, journal=None):
+        """ Uploads a file for a user. Same as `me_upload_file`, for the given user.
+            user_id : int
+                User ID
+        """
+        return self._upload_file(user_id, path, name, max_workers, progress_callback, resolve_upload_target,
+                                 journal)
+
+    def upload_files(self, paths, user_id=None, max_workers=4, part_workers=4, progress_callback=None,
+                     resolve_upload_target=upload_target_from_response, journal=None):
+        """ Uploads many files concurrently. Yields a BatchResult keyed by file path for each file as it completes,
+            whose `response` is the UploadResult of the file.
+            paths : str | iterable
+                A directory, uploaded recursively, or an iterable of file and directory paths
+            user_id : int
+                User the files are uploaded for. Defaults to the authenticated user.
+            max_workers : int
+                Maximum number of files uploaded at once
+            part_workers : int
+                Maximum number of parts of each file sent at once
+            progress_callback : function
+                Called as `callback(descriptor, bytes_sent, total_bytes)` as the content of each file is sent
+            resolve_upload_target : function
+                See `me_upload_file`
+            journal : UploadJournal
+                See `me_upload_file`. Rerunning an interrupted batch with the same journal skips the files it
+                completed.
+        """
+        return self.sws.batch(self._file_uploads(paths, user_id, part_workers, progress_callback,
+                                                 resolve_upload_target, journal),
+                              max_workers=max_workers)
+
+    def _file_uploads(self, paths, user_id, part_workers, progress_callback, resolve_upload_target, journal):
+        if isinstance(paths, str) or not hasattr(paths, '__iter__'):
+            paths = [paths]
+        for path in _list_files(paths, recursive=True):
+            yield path, partial(self._upload_file, user_id, path, None, part_workers, progress_callback,
+                                resolve_upload_target, journal)
+
+    def _create_upload(self, user_id, descriptor):
+        if user_id is None:
+            return self.me_create_file_upload(**descriptor.upload_params())
+        return self.user_create_file_upload(user_id, **descriptor.upload_params())
+
+    def _get_uploaded_file(self, user_id, file_id):
+        if user_id is None:
+            return self.me_get_file(file_id)
+        return self.user_get_file(user_id, file_id)
+
+    def sync_files(self, files, max_workers=4, part_workers=4, progress_callback=None,
+                   resolve_upload_target=upload_target_from_response, journal=None, hash_cache=None):
+        """ Uploads the files of many users, e.g. to sync their libraries. Every file is hashed once, and files with
+            the same content are uploaded once per user. For content shared by several users, the uploads of the
+            other users are created as soon as the upload of the first one completes, so the content is only sent
+            if the service returns an upload target for it again.
+            Yields a BatchResult keyed by (user_id, path) for each file, whose `response` is the UploadResult of the
+            file. Files of a user with the same content share the same UploadResult.
+            files : dict
+                Maps user IDs, or None for the authenticated user, to a directory or an iterable of file and
+                directory paths
+            max_workers : int
+                Maximum number of files uploaded at once
+            part_workers : int
+                Maximum number of parts of each file sent at once
+            progress_callback : function
+                Called as `callback(descriptor, bytes_sent, total_bytes)` as the content of each file is sent
+            resolve_upload_target : function
+                See `me_upload_file`
+            journal : UploadJournal
+                See `me_upload_file`. Content already uploaded for a user in an earlier run is only verified.
+            hash_cache : HashCache
+                If given, files unchanged since an earlier run are not hashed again
+        """
+        plan = SyncPlan(files, hash_cache=hash_cache)
+        first, followers = plan.schedule()
+        calls = BatchQueue(self._sync_uploads(plan, first, part_workers, progress_callback, resolve_upload_target,
+                                              journal))
+        for result in self.sws.batch(calls, max_workers=max_workers):
+            calls.extend(self._sync_uploads(plan, followers.pop(result.key, ()), part_workers, progress_callback,
+                                            resolve_upload_target, journal))
+            yield from _sync_results(plan, result)
+
+    def _sync_uploads(self, plan, keys, part_workers, progress_callback, resolve_upload_target, journal):
+        for key in keys:
+            yield key, partial(self._upload, key[0], plan.uploads[key], part_workers, progress_callback,
+                               resolve_upload_target, journal)
+
+    def _upload_file(self, user_id, path, name, max_workers, progress_callback, resolve_upload_target, journal):
+        descriptor = prepare_upload(path, name=name)
+        return self._upload(user_id, descriptor, max_workers, progress_callback, resolve_upload_target, journal)
+
+    def _upload(self, user_id, descriptor, max_workers, progress_callback, resolve_upload_target, journal):
+        checkpoint = UploadCheckpoint(journal, user_id, descriptor)
+        entry = checkpoint.entry()
+        if entry is not None:
+            response = self._get_uploaded_file(user_id, entry.file_id)
+            if checkpoint.is_gone(response):
+                entry = None
+            elif entry.complete or not response.ok:
+                return UploadResult(descriptor, response, resumed=True)
+        if entry is None:
+            response = self._create_upload(user_id, descriptor)
+            target = resolve_upload_target(response, descriptor.size) if response.ok else None
+            entry = checkpoint.start(response, target)
+            if target is None:
+                return UploadResult(descriptor, response)
+        progress = UploadProgress(descriptor, progress_callback)
+
+        def send_part(index, part):
+            part_response = self._send_upload_part(descriptor, entry.target, part, progress)
+            checkpoint.record_part(entry, index, part_response)
+            return part_response
+
+        pending = checkpoint.pending_parts(entry, progress)
+        if len(pending) <= 1:
+            part_responses = [send_part(index, part) for index, part in pending]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # Send each part in a copy of the caller's context so that timeout overrides apply to it
+                futures = [executor.submit(contextvars.copy_context().run, send_part, index, part)
+                           for index, part in pending]
+                part_responses = [future.result() for future in futures]
+        checkpoint.finish(entry, part_responses)
+        return UploadResult(descriptor, response, part_responses, resumed=checkpoint.resumed)
+
+    def _upload_part_request(self, descriptor, target, part):
+        headers = {'Content-Type': descriptor.mime_type, **target.headers, **part.headers}
+        return Request(target.method, part.url, headers=headers).prepare()
+
+    def _send_upload_part(self, descriptor, target, part, progress):
+        """ Sends one part of the content of a file, retrying transient failures according to the client retry policy.
+            The part is sent to the upload target, not to SWS, so the service rate limit and circuit breaker do not
+            apply.
+        """
+        session = self.sws.connection_pool.session()
+        timeout = timeouts.resolve(None, self.sws.timeout)
+        body = FilePart(descriptor.path, part.offset, part.size, progress=progress)
+        attempt = 1
+        try:
+            while True:
+                request = self._upload_part_request(descriptor, target, part)
+                request.prepare_body(body, None)
+                try:
+                    response = session.send(request, timeout=timeouts.attempt_timeouts(timeout))
+                except RequestException as e:
+                    delay = self.retry_delay(request.method, attempt, exception=e)
+                    if delay is None:
+                        raise
+                else:
+                    delay = self.retry_delay(request.method, attempt, response=response)
+                    if delay is None:
+                        return response
+                body.rewind()
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            body.close()
+
+
+def _sync_results(plan, result):
+    # One result for each file of the upload
+    user_id = result.key[0]
+    for path in plan.paths[result.key]:
+        yield BatchResult((user_id, path), response=result.response, exception=result.exception)
@@ -0,0 +1,98 @@
+""" Coalescing of identical in-flight requests.
+    When several threads or tasks make the same GET request at the same time, only the first one is sent and every
+    caller receives its response.
+"""
+import asyncio
+import threading
+
+from sws_py_sdk import timeouts
+
+# Outcome shared with the followers of an asyncio call that was cancelled, which then make the call themselves
+_CANCELLED = object()
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.exception = None
+
+
+class RequestCoalescer(object):
+
+    def __init__(self):
+        """ Create a request coalescer. Can be shared between threads and asyncio tasks, and between Sws instances
+            that use the same credentials.
+        """
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._futures = {}
+
+    def run(self, key, call):
+        """ Makes a call, unless an identical call is already in progress, in which case its outcome is shared.
+            Waiting for another call is bounded by the deadline of the current call.
+            key : tuple
+                Identity of the call
+            call : function
+                Makes the call, taking no arguments
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not flight.done.wait(timeouts.remaining()):
+                raise timeouts.DeadlineExceeded('SWS call exceeded its total timeout')
+            if flight.exception is not None:
+                raise flight.exception
+            return flight.response
+        try:
+            flight.response = call()
+        except BaseException as e:
+            flight.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.response
+
+    async def run_async(self, key, call):
+        """ Asynchronous version of `run`. `call` returns an awaitable. If the call is cancelled, the callers waiting
+            for it are not: one of them makes the call again.
+        """
+        loop = asyncio.get_running_loop()
+        # Futures cannot be awaited from another event loop
+        key = (id(loop), key)
+        while True:
+            with self._lock:
+                future = self._futures.get(key)
+                leader = future is None
+                if leader:
+                    future = self._futures[key] = loop.create_future()
+            if leader:
+                break
+            try:
+                # Shielded so that a follower timing out does not cancel the call of the others
+                response = await asyncio.wait_for(asyncio.shield(future), timeouts.remaining())
+            except asyncio.TimeoutError:
+                raise timeouts.DeadlineExceeded('SWS call exceeded its total timeout') from None
+            if response is not _CANCELLED:
+                return response
+        try:
+            response = await call()
+        except asyncio.CancelledError:
+            future.set_result(_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, as there may be no followers to retrieve it
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            with self._lock:
+                del self._futures[key]
@@ -0,0 +1,66 @@
+""" HTTP conditional requests.
+    The validators (ETag and Last-Modified) and body of GET responses are stored, so that repeated requests only
+    download a body when it has changed. A '304 Not Modified' reply is turned back into the stored response.
+"""
+import hashlib
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Headers of a 304 reply that describe its own (empty) body rather than the stored one
+_BODY_HEADERS = frozenset(['content-length', 'content-type', 'content-encoding', 'transfer-encoding'])
+
+
+def cache_key(service_key, prepared_request):
+    """ Returns the key of the stored response of a request. Responses depend on the access token, so the key
+        includes a digest of the Authorization header rather than the header itself.
+    """
+    authorization = prepared_request.headers.get('Authorization', '')
+    return (service_key, 'conditional', prepared_request.url, hashlib.sha256(authorization.encode()).hexdigest())
+
+
+def add_validators(prepared_request, entry):
+    """ Makes a request conditional on the stored response `entry` having changed """
+    if entry.get('etag'):
+        prepared_request.headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        prepared_request.headers['If-Modified-Since'] = entry['last_modified']
+
+
+def entry_from_response(response):
+    """ Returns the storable form of a successful response that has validators, or None """
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code != 200 or (etag is None and last_modified is None):
+        return None
+    return {
+        'etag': etag,
+        'last_modified': last_modified,
+        'status_code': response.status_code,
+        'reason': response.reason,
+        'headers': dict(response.headers),
+        'content': response.content,
+    }
+
+
+def response_from_entry(entry, not_modified):
+    """ Builds the response of a request answered with '304 Not Modified' from its stored response
+        entry : dict
+            The stored response
+        not_modified : requests.Response
+            The 304 reply. Its headers, other than those describing its body, update the stored ones.
+    """
+    headers = CaseInsensitiveDict(entry['headers'])
+    headers.update((name, value) for name, value in not_modified.headers.items()
+                   if name.lower() not in _BODY_HEADERS)
+    response = Response()
+    response.status_code = entry['status_code']
+    response.reason = entry['reason']
+    response.headers = headers
+    response.encoding = get_encoding_from_headers(headers)
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.elapsed = not_modified.elapsed
+    response._content = entry['content']
+    return response
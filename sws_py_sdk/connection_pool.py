@@ -0,0 +1,282 @@
+""" Long-lived HTTP connection pools shared by the services of an Sws instance.
+    Reusing the same session keeps TCP/TLS connections to the SWS hosts alive between requests.
+"""
+import asyncio
+import datetime
+import inspect
+import socket
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ConnectTimeout, ReadTimeout, Timeout
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Size of the chunks handed to a sink when streaming a response body with the asyncio pool
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Connections of the synchronous pools waiting for response headers, keyed by the ID of the thread waiting on them
+_waiting_connections = {}
+
+
+class ConnectionPool(object):
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, idle_timeout=None):
+        """ Create a connection pool
+            pool_connections : int
+                Number of per-host connection pools to keep (one per SWS host is enough)
+            pool_maxsize : int
+                Maximum number of keep-alive connections retained for each host
+            pool_block : bool
+                If True, a request waits for a free connection once `pool_maxsize` connections are in use
+                instead of opening an extra connection that is discarded after use
+            idle_timeout : float
+                Number of seconds the pool can go unused before its connections are closed and replaced.
+                None disables idle eviction.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._session = None
+        self._last_used = 0.0
+
+    def session(self):
+        """ Returns the shared session, creating it on first use or after it has been evicted for being idle.
+            The session is safe to share between threads as long as it is only used to send prepared requests.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (self._session is not None and self.idle_timeout is not None
+                    and now - self._last_used > self.idle_timeout):
+                self._session.close()
+                self._session = None
+            if self._session is None:
+                self._session = self._create_session()
+            self._last_used = now
+            return self._session
+
+    def close(self):
+        """ Closes every pooled connection. The pool can still be used afterwards and will reconnect on demand.
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _create_session(self):
+        session = Session()
+        # Cookies are never sent back to the services, so a shared session behaves like the per-request sessions
+        # that were used before pooling was introduced
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = _AbortableAdapter(pool_connections=self.pool_connections,
+                                    pool_maxsize=self.pool_maxsize,
+                                    pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+class RequestAborter(object):
+
+    def __init__(self):
+        """ Handle aborting the request that the creating thread is about to send through a ConnectionPool, e.g.
+            once another request made for the same call has answered it
+        """
+        self.thread_id = threading.get_ident()
+        self.aborted = False
+
+    def __call__(self):
+        """ Aborts the request, which then raises ConnectionError, if it is waiting for its response headers.
+            A request that is still connecting, or whose body is being read, completes normally.
+        """
+        self.aborted = True
+        connection = _waiting_connections.get(self.thread_id)
+        if connection is not None and connection.sock is not None:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class _AbortableConnectionMixin(object):
+    # Registers the connection while its thread waits for the response headers, so that a RequestAborter can shut
+    # its socket down
+
+    def getresponse(self, *args, **kwargs):
+        thread_id = threading.get_ident()
+        _waiting_connections[thread_id] = self
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            _waiting_connections.pop(thread_id, None)
+
+
+class _AbortableHTTPConnection(_AbortableConnectionMixin, HTTPConnection):
+    pass
+
+
+class _AbortableHTTPSConnection(_AbortableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _AbortableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _AbortableHTTPConnection
+
+
+class _AbortableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _AbortableHTTPSConnection
+
+
+class _AbortableAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _AbortableHTTPConnectionPool,
+                                                   'https': _AbortableHTTPSConnectionPool}
+
+
+class AsyncConnectionPool(object):
+
+    def __init__(self, limit=100, limit_per_host=10, keepalive_timeout=15):
+        """ Create an asyncio connection pool. Requires the optional `aiohttp` dependency.
+            limit : int
+                Maximum number of simultaneous connections across all hosts
+            limit_per_host : int
+                Maximum number of simultaneous connections to a single host. 0 means no per-host limit.
+            keepalive_timeout : float
+                Number of seconds an idle keep-alive connection is retained before being closed
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    def session(self):
+        """ Returns the shared aiohttp session, creating it on first use. Must be called from a running event loop.
+        """
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout)
+            # Cookies are never sent back to the services, matching the synchronous pool
+            self._session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+                                                  trace_configs=[_timing_trace_config()])
+        return self._session
+
+    async def send(self, prepared_request, timeout=None, total_timeout=None, sink=None, timings=None):
+        """ Sends a prepared request and returns a fully read `requests.Response`, so callers get the same response
+            type from the synchronous and asynchronous clients.
+            prepared_request : requests.PreparedRequest
+                The request to send
+            timeout : tuple
+                (connect, read) timeouts in seconds, like the `timeout` argument of `requests.Session.send`
+            total_timeout : float
+                Time allowed for the whole request, including reading the response body, in seconds
+            sink : function
+                If given, called with each chunk of the body of a successful response instead of the body being
+                kept in memory. The returned response then has empty content. If the sink returns an awaitable, it
+                is awaited before the next chunk is read.
+            timings : dict
+                If given, the number of seconds spent resolving the host name and opening a new connection are stored
+                in it as 'dns' and 'connect', see RequestEvent
+        """
+        import aiohttp
+        connect_timeout, read_timeout = timeout if timeout is not None else (None, None)
+        client_timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout,
+                                               sock_read=read_timeout)
+        body = prepared_request.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if timings is not None:
+            timings.clear()
+        started = time.perf_counter()
+        try:
+            async with self.session().request(prepared_request.method,
+                                              prepared_request.url,
+                                              headers=dict(prepared_request.headers),
+                                              data=body,
+                                              timeout=client_timeout,
+                                              trace_request_ctx=timings) as aiohttp_response:
+                # Time to the response headers, like the `elapsed` of a response of the synchronous client
+                elapsed = datetime.timedelta(seconds=time.perf_counter() - started)
+                if sink is not None and aiohttp_response.status < 400:
+                    await _stream_body(aiohttp_response, sink)
+                    content = b''
+                else:
+                    content = await aiohttp_response.read()
+                response = _build_response(prepared_request, aiohttp_response, content)
+                response.elapsed = elapsed
+                return response
+        except asyncio.TimeoutError as e:
+            # Raise the same exception types as the synchronous client
+            if isinstance(e, getattr(aiohttp, 'ConnectionTimeoutError', ())):
+                raise ConnectTimeout(f'Connection to {prepared_request.url} timed out', request=prepared_request) from e
+            if isinstance(e, getattr(aiohttp, 'SocketTimeoutError', ())):
+                raise ReadTimeout(f'Read from {prepared_request.url} timed out', request=prepared_request) from e
+            raise Timeout(f'Request to {prepared_request.url} timed out', request=prepared_request) from e
+        except aiohttp.ClientConnectionError as e:
+            raise ConnectionError(f'Connection to {prepared_request.url} failed', request=prepared_request) from e
+
+    async def close(self):
+        """ Closes every pooled connection. The pool reconnects on demand if used again.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def _stream_body(aiohttp_response, sink):
+    import aiohttp
+    try:
+        async for chunk in aiohttp_response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            result = sink(chunk)
+            if inspect.isawaitable(result):
+                await result
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        # Part of the body has already been handed to the sink, so the failure must not be retried like a failure
+        # to send the request
+        raise ChunkedEncodingError(f'Response from {aiohttp_response.url} was interrupted') from e
+
+
+def _timing_trace_config():
+    # Records connection timings into the `trace_request_ctx` of requests that pass a timings dict
+    import aiohttp
+
+    def on_start(phase):
+        async def handler(session, trace, params):
+            if trace.trace_request_ctx is not None:
+                trace.trace_request_ctx[phase] = -time.perf_counter()
+        return handler
+
+    def on_end(phase):
+        async def handler(session, trace, params):
+            timings = trace.trace_request_ctx
+            if timings is not None and phase in timings:
+                timings[phase] += time.perf_counter()
+        return handler
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_start('dns'))
+    trace_config.on_dns_resolvehost_end.append(on_end('dns'))
+    trace_config.on_connection_create_start.append(on_start('connect'))
+    trace_config.on_connection_create_end.append(on_end('connect'))
+    return trace_config
+
+
+def _build_response(prepared_request, aiohttp_response, content):
+    response = Response()
+    response.status_code = aiohttp_response.status
+    response.reason = aiohttp_response.reason
+    response.headers = CaseInsensitiveDict(aiohttp_response.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = str(aiohttp_response.url)
+    response.request = prepared_request
+    response._content = content
+    return response
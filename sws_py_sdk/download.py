@@ -0,0 +1,41 @@
+""" Helpers for writing downloaded content to disk with bounded memory.
+"""
+import os
+
+
+class DownloadFile(object):
+
+    def __init__(self, destination):
+        """ Destination of a download, written one chunk at a time.
+            When the destination is a path, data is written to '<path>.part', which is only moved into place by
+            `commit()`, so a failed download never leaves a truncated file behind.
+            destination : str | os.PathLike | file
+                Path of the file to write, or a binary file-like object
+        """
+        self.destination = destination
+        self._is_file_object = hasattr(destination, 'write')
+        self._file = destination if self._is_file_object else None
+        self._part_path = None if self._is_file_object else f'{os.fspath(destination)}.part'
+
+    def write(self, chunk):
+        """ Writes a chunk of the content """
+        if self._file is None:
+            self._file = open(self._part_path, 'wb')
+        self._file.write(chunk)
+
+    def commit(self):
+        """ Completes the download, moving the file into place """
+        if self._is_file_object:
+            return
+        if self._file is None:
+            # The content was empty
+            self._file = open(self._part_path, 'wb')
+        self._file.close()
+        os.replace(self._part_path, self.destination)
+
+    def discard(self):
+        """ Abandons the download, deleting any partially written file """
+        if self._is_file_object or self._file is None:
+            return
+        self._file.close()
+        os.remove(self._part_path)
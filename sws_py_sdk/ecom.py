@@ -1,13 +1,22 @@
 """ This file exposes endpoints from the SWS Ecom Service
 """
+import mimetypes
+import os
+from functools import partial
 
 from requests.auth import HTTPBasicAuth
 
+from sws_py_sdk.download import DownloadFile
 from sws_py_sdk.service import Service
 
+# Number of bytes read from the network at a time when downloading invoices
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 
 class Ecom(Service):
 
+    service_key = 'ecom'
+
     def __init__(self, sws):
         super().__init__(sws)
         self.service_uri = sws.service_uris['ecom']
@@ -70,15 +79,88 @@ class Ecom(Service):
             accept: string
                 Accept header, can be JSON, PDF or HTML
         """
-        prefix = "/api/v1/me" if self.sws.user_id == 0 else "/api/v1/users/" + str(self.sws.user_id)
-        endpoint = f"{prefix}/orders/{order_id}/invoices/{invoice_id}"
         return self.fetch(
             auth="bearer",
-            endpoint=endpoint,
+            endpoint=self._invoice_endpoint(order_id, invoice_id),
             method="GET",
             headers={'Accept': accept}
         )
 
+    def stream_invoice(self, order_id, invoice_id, accept='application/pdf'):
+        """ Gets a specific invoice for an order without loading it into memory.
+            The response body must be read, e.g. with `iter_content()`, or the response closed.
+
+            order_id: int
+                ID of the order
+            invoice_id: int
+                ID of the invoice
+            accept: string
+                Accept header, can be JSON, PDF or HTML
+        """
+        return self.fetch(
+            auth="bearer",
+            endpoint=self._invoice_endpoint(order_id, invoice_id),
+            method="GET",
+            headers={'Accept': accept},
+            stream=True
+        )
+
+    def download_invoice(self, order_id, invoice_id, destination, accept='application/pdf',
+                         chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """ Downloads a specific invoice for an order to a file, holding at most one chunk of it in memory.
+            The invoice is only written if the request succeeds. Returns the response, whose body has been consumed
+            if the request succeeded.
+
+            order_id: int
+                ID of the order
+            invoice_id: int
+                ID of the invoice
+            destination: str | file
+                Path of the file to write, or a binary file-like object
+            accept: string
+                Accept header, can be JSON, PDF or HTML
+            chunk_size: int
+                Number of bytes read from the network at a time
+        """
+        response = self.stream_invoice(order_id, invoice_id, accept=accept)
+        if not response.ok:
+            return response
+        download = DownloadFile(destination)
+        try:
+            with response:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    download.write(chunk)
+        except BaseException:
+            download.discard()
+            raise
+        download.commit()
+        return response
+
+    def download_invoices(self, invoices, directory, accept='application/pdf', max_workers=10):
+        """ Downloads many invoices concurrently into a directory, as '<order_id>-<invoice_id>.<extension>' files.
+            Yields a BatchResult keyed by (order_id, invoice_id) for each invoice as it completes.
+
+            invoices: iterable
+                (order_id, invoice_id) pairs
+            directory: str
+                Directory to write the invoices to
+            accept: string
+                Accept header, can be JSON, PDF or HTML
+            max_workers: int
+                Maximum number of invoices downloaded at once
+        """
+        return self.sws.batch(self._invoice_downloads(invoices, directory, accept), max_workers=max_workers)
+
+    def _invoice_endpoint(self, order_id, invoice_id):
+        prefix = "/api/v1/me" if self.sws.user_id == 0 else "/api/v1/users/" + str(self.sws.user_id)
+        return f"{prefix}/orders/{order_id}/invoices/{invoice_id}"
+
+    def _invoice_downloads(self, invoices, directory, accept):
+        extension = mimetypes.guess_extension(accept) or ''
+        for order_id, invoice_id in invoices:
+            path = os.path.join(directory, f'{order_id}-{invoice_id}{extension}')
+            yield (order_id, invoice_id), partial(self.download_invoice, order_id, invoice_id, path, accept=accept)
+
     def get_orders(self, order_id=0):
         """ Get list of all orders created by the authenticated client user
 
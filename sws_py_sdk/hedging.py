@@ -0,0 +1,313 @@
+""" Hedged requests.
+    When a GET request takes longer than most requests to the same endpoint, a second identical request is sent and
+    whichever responds first is used. This cuts tail latency at the cost of a few extra requests.
+"""
+import asyncio
+import contextvars
+import heapq
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class HedgingPolicy(object):
+
+    def __init__(self,
+                 percentile=95,
+                 delay=None,
+                 min_delay=0.01,
+                 max_delay=2.0,
+                 min_samples=20,
+                 window=200,
+                 endpoints=None,
+                 max_workers=20):
+        """ Create a hedging policy. Only GET requests whose response is read into memory are hedged.
+            percentile : float
+                Latency percentile of an endpoint after which a request to it is hedged, e.g. 95 hedges at most about
+                5% of requests
+            delay : float
+                Fixed number of seconds after which requests are hedged, instead of a delay derived from the latency
+                of each endpoint
+            min_delay : float
+                Minimum hedging delay in seconds
+            max_delay : float
+                Maximum hedging delay in seconds
+            min_samples : int
+                Number of latencies of an endpoint recorded before its requests are hedged with a derived delay
+            window : int
+                Number of recent latencies of each endpoint the derived delay is computed from
+            endpoints : iterable
+                Endpoint templates to hedge, e.g. '/api/v1/me/licenses'. All GET endpoints are hedged if omitted.
+            max_workers : int
+                Number of threads sending hedged requests for the synchronous client
+        """
+        self.percentile = percentile
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.endpoints = frozenset(endpoints) if endpoints is not None else None
+        self.max_workers = max_workers
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._scheduler = None
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def applies_to(self, key):
+        """ Determines whether requests to an endpoint are hedged
+            key : tuple
+                (service key, endpoint template) of the request
+        """
+        return self.endpoints is None or key[1] in self.endpoints
+
+    def hedge_delay(self, key):
+        """ Returns the number of seconds after which a request to an endpoint is hedged, or None if it must not be
+            hedged yet
+        """
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        index = max(0, math.ceil(self.percentile / 100 * len(latencies)) - 1)
+        return min(self.max_delay, max(self.min_delay, latencies[index]))
+
+    def record(self, key, latency):
+        """ Records the latency, in seconds, of a request to an endpoint that received a response """
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(latency)
+
+    def stats(self):
+        """ Returns hedging metrics: the number of requests, the number hedged, the number won by the hedge, and the
+            hedge rate
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'hedge_rate': self.hedged / self.requests if self.requests else 0.0,
+            }
+
+    def send(self, key, send, request, hedge_send=None, abort=None):
+        """ Sends a request with `send(request)` on the calling thread, hedging it if it is too slow: once the hedging
+            delay has passed, a copy of the request is sent on a thread of the policy. Blocks until a response is
+            received. Only hedges use the threads of the policy, so the number of calls in progress is not limited
+            by `max_workers`.
+            key : tuple
+                (service key, endpoint template) of the request
+            send : function
+                Sends a prepared request and returns its response
+            request : requests.PreparedRequest
+                The request to send
+            hedge_send : function
+                Sends the hedge, e.g. once it has been allowed by the rate limiter and circuit breaker. Defaults to
+                `send`.
+            abort : function
+                Interrupts `send` on the calling thread, making it raise, once the hedge has responded first, e.g. a
+                RequestAborter. If omitted, or the request cannot be interrupted, the response of the hedge is only
+                returned once `send` has completed. The request that loses is closed.
+        """
+        delay = self.hedge_delay(key)
+        self._count()
+        if delay is None:
+            return self._timed(key, send, request)
+        race = _Race()
+        timer = self._get_scheduler().call_later(delay, self._start_hedge, race, key, hedge_send or send,
+                                                 request.copy(), abort, contextvars.copy_context())
+        response = error = None
+        try:
+            response = self._timed(key, send, request)
+        except Exception as e:
+            error = e
+        finally:
+            timer.cancel()
+        with race.lock:
+            race.primary_done = True
+            race.primary_failed = error is not None
+            hedge = race.hedge
+            hedge_won = race.hedge_won
+        if not hedge_won:
+            if hedge is None or error is None:
+                if error is not None:
+                    raise error
+                return response
+            # The request failed while its hedge is in progress, which can still answer it
+            if hedge.exception() is not None:
+                raise error
+        elif response is not None:
+            response.close()
+        self._count(hedge_won=True)
+        return hedge.result()
+
+    async def send_async(self, key, send, request, hedge_send=None):
+        """ Asynchronous version of `send`. `send(request)` and `hedge_send(request)` return awaitables. The primary
+            request is sent as a task of the calling event loop rather than on a thread, and the losing request is
+            cancelled.
+        """
+        delay = self.hedge_delay(key)
+        self._count()
+        if delay is None:
+            return await self._timed_async(key, send, request)
+        primary = asyncio.ensure_future(self._timed_async(key, send, request))
+        try:
+            return await asyncio.wait_for(asyncio.shield(primary), delay)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            primary.cancel()
+            raise
+        self._count(hedged=True)
+        hedge = asyncio.ensure_future(self._timed_async(key, hedge_send or send, request.copy()))
+        winner = None
+        pending = {primary, hedge}
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner is None:
+            return primary.result()
+        if winner is hedge:
+            self._count(hedge_won=True)
+        return winner.result()
+
+    def close(self):
+        """ Stops the threads of the policy. They are restarted on demand if the policy is used again. """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None:
+            scheduler.stop()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _start_hedge(self, race, key, send, request, abort, context):
+        with race.lock:
+            if race.primary_done:
+                return
+            try:
+                race.hedge = self._get_executor().submit(context.run, self._timed, key, send, request)
+            except RuntimeError:
+                # The policy was closed while the request was in progress
+                return
+            self._count(hedged=True)
+        race.hedge.add_done_callback(partial(_hedge_done, race, abort))
+
+    def _timed(self, key, send, request):
+        start = time.monotonic()
+        response = send(request)
+        self.record(key, time.monotonic() - start)
+        return response
+
+    async def _timed_async(self, key, send, request):
+        start = time.monotonic()
+        response = await send(request)
+        self.record(key, time.monotonic() - start)
+        return response
+
+    def _count(self, hedged=False, hedge_won=False):
+        with self._lock:
+            if hedge_won:
+                self.hedge_wins += 1
+            elif hedged:
+                self.hedged += 1
+            else:
+                self.requests += 1
+
+    def _get_scheduler(self):
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = _Scheduler()
+            return self._scheduler
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='sws-hedge')
+            return self._executor
+
+
+class _Race(object):
+    # State shared by a request sent on the calling thread and its hedge
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hedge = None
+        self.hedge_won = False
+        self.primary_done = False
+        self.primary_failed = False
+
+
+def _hedge_done(race, abort, future):
+    if future.exception() is not None:
+        return
+    with race.lock:
+        if not race.primary_done:
+            race.hedge_won = True
+            if abort is not None:
+                abort()
+            return
+        lost = not race.primary_failed
+    if lost:
+        future.result().close()
+
+
+class _Timer(object):
+    def __init__(self, when, function, args):
+        self.when = when
+        self.function = function
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Scheduler(object):
+    # Single thread calling functions once their delay has passed, so that waiting for the hedging delay of a
+    # request does not take a thread
+
+    def __init__(self):
+        self._timers = []
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='sws-hedge-scheduler', daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, function, *args):
+        timer = _Timer(time.monotonic() + delay, function, args)
+        with self._condition:
+            heapq.heappush(self._timers, timer)
+            if self._timers[0] is timer:
+                self._condition.notify()
+        return timer
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._timers or self._timers[0].when > time.monotonic()):
+                    self._condition.wait(self._timers[0].when - time.monotonic() if self._timers else None)
+                if self._stopped:
+                    return
+                timer = heapq.heappop(self._timers)
+            if not timer.cancelled:
+                timer.function(*timer.args)
@@ -9,6 +9,8 @@ from sws_py_sdk.service import Service
 
 class Identity(Service):
 
+    service_key = 'id'
+
     def __init__(self, sws):
         super().__init__(sws)
         self.service_uri = sws.service_uris['id']
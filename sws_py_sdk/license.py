@@ -1,10 +1,14 @@
 """ This file exposes endpoints from the SWS License Service
 """
 
+from functools import partial
+
 from sws_py_sdk.service import Service
 
 
 class License(Service):
+    service_key = 'license'
+
     def __init__(self, sws):
         super().__init__(sws)
         self.service_uri = sws.service_uris['license']
@@ -160,13 +164,14 @@ class License(Service):
         :return: Information on product updated.
         :rtype: requests.Response
         """
-        return self.fetch(
+        return self._change_products([product_id], partial(
+            self.fetch,
             method='PUT',
             endpoint=f'/api/v1/me/products/{product_id}' if self.sws.user_id == 0
             else f'/api/v1/users/{self.sws.user_id}/products/{product_id}',
             auth='bearer',
             body={'ilok_user_id': ilok_user_id}
-        )
+        ))
 
     def get_product_types(self, app_name=None, app_version=None, term=None):
         """
@@ -181,7 +186,8 @@ class License(Service):
         return self.fetch(
             endpoint='/api/v1/products/types',
             auth='bearer',
-            body={'app_name': app_name, 'app_version': app_version, 'term': term}
+            body={'app_name': app_name, 'app_version': app_version, 'term': term},
+            cache='public'
         )
 
     def get_product_type_details(self, product_type_id):
@@ -194,9 +200,18 @@ class License(Service):
         """
         return self.fetch(
             endpoint=f'/api/v1/products/types/{product_type_id}',
-            auth='bearer'
+            auth='bearer',
+            cache='public'
         )
 
+    def invalidate_product_types(self):
+        """
+        Removes the product type lists and details cached by `get_product_types` and `get_product_type_details`.
+        Does nothing unless the client was created with a `response_cache`.
+        """
+        self.invalidate_cache('/api/v1/products/types')
+        self.invalidate_cache('/api/v1/products/types/{id}')
+
     def reset_trials_for_product_type(self, product_type_id, reset_date):
         """
         Reset trials for a product type.
@@ -284,7 +299,9 @@ class License(Service):
         :return: Information on the product added.
         :rtype: requests.Response
         """
-        return self.fetch(
+        # The upgraded product changes too
+        return self._change_products([] if upgrade_from_product_id is None else [upgrade_from_product_id], partial(
+            self.fetch,
             method='POST',
             endpoint='/api/v1/products/products',
             auth='bearer',
@@ -305,7 +322,7 @@ class License(Service):
                 'subscription_status': subscription_status,
                 'upgrade_from_product_id': upgrade_from_product_id
             }
-        )
+        ))
 
     def admin_update_product(self,
                              product_id,
@@ -335,7 +352,8 @@ class License(Service):
         :return: Information on product updated.
         :rtype: requests.Response
         """
-        return self.fetch(
+        return self._change_products([product_id], partial(
+            self.fetch,
             method='PUT',
             endpoint=f'/api/v1/products/products/{product_id}',
             auth='bearer',
@@ -348,7 +366,7 @@ class License(Service):
                 'magento_order_item_id': magento_order_item_id,
                 'subscription_status': subscription_status
             }
-        )
+        ))
 
     def delete_product(self, product_id):
         """
@@ -360,11 +378,12 @@ class License(Service):
         :return: HTTP response. 204 is successful.
         :rtype: requests.Response
         """
-        return self.fetch(
+        return self._change_products([product_id], partial(
+            self.fetch,
             method='DELETE',
             endpoint=f'/api/v1/products/products/{product_id}',
             auth='bearer'
-        )
+        ))
 
     def get_product_info(self, product_id):
         """
@@ -379,5 +398,25 @@ class License(Service):
         """
         return self.fetch(
             endpoint=f'/api/v1/products/products/{product_id}',
-            auth='bearer'
+            auth='bearer',
+            cache=True
         )
+
+    def invalidate_product(self, product_id):
+        """
+        Removes the product information cached by `get_product_info` for a product.
+        Called by the methods that change products, once their request has completed.
+        Does nothing unless the client was created with a `response_cache`.
+
+        :param str product_id: Product ID.
+        """
+        self.invalidate_cache(f'/api/v1/products/products/{product_id}')
+
+    def _change_products(self, product_ids, write):
+        # Invalidating after the write, rather than before, keeps a concurrent `get_product_info` from caching the
+        # product as it was before the change. The write may have been applied even if it raised.
+        try:
+            return write()
+        finally:
+            for product_id in product_ids:
+                self.invalidate_product(product_id)
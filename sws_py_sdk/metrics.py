@@ -0,0 +1,245 @@
+""" Per-call instrumentation.
+    When an Sws instance has a metrics hook, the hook is called with a RequestEvent describing every call made through
+    `Service.fetch`: where its time went, how much data it moved, and how many retries and token refreshes it took.
+    Without a hook no event is built.
+"""
+import bisect
+import threading
+
+# Upper bounds, in seconds, of the buckets of the duration histogram of PrometheusMetrics
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestEvent(object):
+
+    def __init__(self,
+                 service,
+                 endpoint,
+                 method,
+                 status=None,
+                 error=None,
+                 duration=0.0,
+                 ttfb=None,
+                 dns=None,
+                 connect=None,
+                 request_bytes=0,
+                 response_bytes=0,
+                 retries=0,
+                 token_refreshed=False,
+                 cached=False):
+        """ A completed call
+            service : str
+                Key of the service, e.g. 'license'
+            endpoint : str
+                Template of the endpoint called, e.g. '/api/v1/products/products/{id}'
+            method : str
+                HTTP method
+            status : int
+                HTTP status of the response, or None if the call raised
+            error : Exception
+                Exception raised by the call, if any
+            duration : float
+                Number of seconds the whole call took, including retries, token refresh and replay
+            ttfb : float
+                Number of seconds between sending the last request of the call and receiving its response headers
+            dns : float
+                Number of seconds spent resolving the host name (asyncio client only). None if no new connection
+                was opened, or the host name was already resolved.
+            connect : float
+                Number of seconds spent opening a new connection, including resolving the host name and the TLS
+                handshake (asyncio client only). None if a pooled connection was reused.
+            request_bytes : int
+                Size of the body of the last request of the call
+            response_bytes : int
+                Size of the body of the response
+            retries : int
+                Number of times a request of the call was retried after a transient failure
+            token_refreshed : bool
+                True if the call was replayed after its access token was found to be invalid or expired
+            cached : bool
+                True if the response came from the client response cache without a request being sent
+        """
+        self.service = service
+        self.endpoint = endpoint
+        self.method = method
+        self.status = status
+        self.error = error
+        self.duration = duration
+        self.ttfb = ttfb
+        self.dns = dns
+        self.connect = connect
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.retries = retries
+        self.token_refreshed = token_refreshed
+        self.cached = cached
+
+    def __repr__(self):
+        outcome = f'status={self.status}' if self.error is None else f'error={self.error!r}'
+        return (f'RequestEvent({self.method} {self.service}{self.endpoint}, {outcome}, '
+                f'duration={self.duration:.4f}, retries={self.retries})')
+
+
+def event_from_call(service_key, context, duration, response=None, exception=None):
+    """ Builds the RequestEvent of a call from its RequestContext and outcome """
+    event = RequestEvent(service=service_key,
+                         endpoint=context.endpoint,
+                         method=context.request.method,
+                         duration=duration,
+                         dns=_phase(context.timings, 'dns'),
+                         connect=_phase(context.timings, 'connect'),
+                         retries=context.retries,
+                         token_refreshed=context.token_refreshed)
+    if response is not None:
+        event.status = response.status_code
+        event.ttfb = response.elapsed.total_seconds()
+        event.response_bytes = _response_size(response)
+        if response.request is not None:
+            event.request_bytes = int(response.request.headers.get('Content-Length') or 0)
+    else:
+        event.error = exception
+    return event
+
+
+def _phase(timings, phase):
+    # A phase that did not complete, e.g. because the connection failed, is stored as minus its start time
+    value = timings.get(phase)
+    return value if value is not None and value >= 0 else None
+
+
+def _response_size(response):
+    length = response.headers.get('Content-Length')
+    if length is not None and length.isdigit():
+        return int(length)
+    # Only count a body that has already been read: reading a streamed body here would consume it
+    content = response._content
+    return len(content) if isinstance(content, bytes) else 0
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+
+class PrometheusMetrics(object):
+
+    def __init__(self, prefix='sws', buckets=DEFAULT_BUCKETS):
+        """ Metrics hook aggregating events into Prometheus-style counters and histograms, labelled with the service,
+            endpoint template and method of each call, e.g.
+
+                metrics = PrometheusMetrics()
+                client = SwsClient(app_id, metrics_hook=metrics)
+                ...
+                body = metrics.exposition()  # Served to the Prometheus scraper
+
+            Endpoint templates are used rather than URLs, so the number of series stays bounded.
+            prefix : str
+                Prefix of the metric names
+            buckets : tuple
+                Upper bounds, in seconds, of the buckets of the call duration histogram
+        """
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._errors = {}
+        self._retries = {}
+        self._token_refreshes = {}
+        self._cache_hits = {}
+        self._request_bytes = {}
+        self._response_bytes = {}
+        self._durations = {}
+        self._ttfb = {}
+
+    def __call__(self, event):
+        labels = (event.service, event.endpoint, event.method)
+        with self._lock:
+            if event.error is None:
+                _increment(self._requests, labels + (str(event.status),))
+            else:
+                _increment(self._errors, labels + (type(event.error).__name__,))
+            _increment(self._retries, labels, event.retries)
+            _increment(self._token_refreshes, labels, int(event.token_refreshed))
+            _increment(self._cache_hits, labels, int(event.cached))
+            _increment(self._request_bytes, labels, event.request_bytes)
+            _increment(self._response_bytes, labels, event.response_bytes)
+            self._observe(self._durations, labels, event.duration)
+            if event.ttfb is not None and not event.cached:
+                self._observe(self._ttfb, labels, event.ttfb)
+
+    def value(self, name, **labels):
+        """ Returns the current value of a counter, or the (count, sum) of a histogram, summed over the series that
+            match the given labels, e.g. `metrics.value('requests_total', service='license', status='200')`
+            name : str
+                Name of the metric, without the prefix
+        """
+        with self._lock:
+            for metric in self._metrics():
+                if metric[0] == name:
+                    _, kind, label_names, series = metric
+                    break
+            else:
+                raise KeyError(name)
+            matching = [value for key, value in series.items()
+                        if all(dict(zip(label_names, key)).get(label) == wanted for label, wanted in labels.items())]
+            if kind == 'histogram':
+                return sum(sum(h.counts) for h in matching), sum(h.sum for h in matching)
+            return sum(matching)
+
+    def exposition(self):
+        """ Returns the metrics in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            for name, kind, label_names, series in self._metrics():
+                name = f'{self.prefix}_{name}'
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in sorted(series.items()):
+                    labels = list(zip(label_names, key))
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(labels)} {value}')
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), value.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{_labels(labels + [("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {value.sum}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        """ Resets every metric """
+        with self._lock:
+            for _, _, _, series in self._metrics():
+                series.clear()
+
+    def _metrics(self):
+        labels = ('service', 'endpoint', 'method')
+        return [
+            ('requests_total', 'counter', labels + ('status',), self._requests),
+            ('errors_total', 'counter', labels + ('error',), self._errors),
+            ('retries_total', 'counter', labels, self._retries),
+            ('token_refreshes_total', 'counter', labels, self._token_refreshes),
+            ('cache_hits_total', 'counter', labels, self._cache_hits),
+            ('request_bytes_total', 'counter', labels, self._request_bytes),
+            ('response_bytes_total', 'counter', labels, self._response_bytes),
+            ('request_duration_seconds', 'histogram', labels, self._durations),
+            ('time_to_first_byte_seconds', 'histogram', labels, self._ttfb),
+        ]
+
+    def _observe(self, series, labels, value):
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = _Histogram(self.buckets)
+        histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+        histogram.sum += value
+
+
+def _increment(series, labels, amount=1):
+    series[labels] = series.get(labels, 0) + amount
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
@@ -0,0 +1,55 @@
+""" Client-side rate limiting.
+    A token bucket can be shared between threads, asyncio tasks and Sws instances to keep the combined request rate
+    to a service at or below a sustainable level.
+"""
+import asyncio
+import threading
+import time
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, capacity=None):
+        """ Create a token bucket
+            rate : float
+                Number of requests allowed per second, on average
+            capacity : float
+                Maximum number of requests that can be sent in a burst after the bucket has been idle.
+                Defaults to `rate`, with a minimum of 1.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1, max_wait=None):
+        """ Takes tokens from the bucket, and returns the number of seconds the caller must wait before sending its
+            request. Callers are served in the order they reserve, so waiting callers cannot be starved by new ones.
+            tokens : float
+                Number of tokens to take
+            max_wait : float
+                Maximum acceptable wait in seconds. If the wait would be longer no tokens are taken and None is
+                returned.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= tokens
+            return wait
+
+    def acquire(self, tokens=1):
+        """ Blocks the calling thread until tokens are available """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """ Waits, without blocking the event loop, until tokens are available """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,104 @@
+""" Retry policy for transient request failures such as connection resets, gateway errors and throttling.
+"""
+import datetime
+import random
+from email.utils import parsedate_to_datetime
+
+from requests.exceptions import ConnectionError, ConnectTimeout, Timeout
+
+
+class RetryPolicy(object):
+
+    # Methods that can be replayed without risking a duplicate side effect
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+    def __init__(self,
+                 max_attempts=3,
+                 backoff_factor=0.2,
+                 max_backoff=10,
+                 jitter=True,
+                 retry_statuses=(429, 502, 503, 504),
+                 retry_methods=IDEMPOTENT_METHODS,
+                 respect_retry_after=True):
+        """ Create a retry policy
+            max_attempts : int
+                Maximum number of times a request is sent, including the first attempt
+            backoff_factor : float
+                Base delay in seconds. The delay before retry n is up to `backoff_factor * 2 ** (n - 1)` seconds.
+            max_backoff : float
+                Maximum delay in seconds between two attempts, unless the service asks for a longer one
+            jitter : bool
+                If True, each delay is drawn at random between 0 and the exponential delay ("full jitter"), so that
+                clients that failed together do not retry together
+            retry_statuses : tuple
+                HTTP status codes that are retried
+            retry_methods : iterable
+                HTTP methods that can be retried after the service may have processed the request. Requests using
+                other methods, like POST, are only retried when the service cannot have processed them: when the
+                connection could not be established, or the service throttled the request with a 429 response.
+            respect_retry_after : bool
+                If True, the delay given by a Retry-After response header is used instead of the computed one
+        """
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_methods = frozenset(method.upper() for method in retry_methods)
+        self.respect_retry_after = respect_retry_after
+
+    def should_retry(self, method, attempt, response=None, exception=None):
+        """ Determines whether a failed attempt should be retried
+            method : str
+                HTTP method of the request
+            attempt : int
+                Number of attempts made so far, starting at 1
+            response : requests.Response
+                The response received, if any
+            exception : Exception
+                The exception raised while sending the request, if any
+        """
+        if attempt >= self.max_attempts:
+            return False
+        idempotent = method.upper() in self.retry_methods
+        if exception is not None:
+            if isinstance(exception, ConnectTimeout):
+                # The request was never sent
+                return True
+            return idempotent and isinstance(exception, (ConnectionError, Timeout))
+        if response is not None and response.status_code in self.retry_statuses:
+            return idempotent or response.status_code == 429
+        return False
+
+    def backoff(self, attempt, response=None):
+        """ Returns the number of seconds to wait before the next attempt
+            attempt : int
+                Number of attempts made so far, starting at 1
+            response : requests.Response
+                The response of the failed attempt, if any
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after
+        delay = min(self.max_backoff, self.backoff_factor * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+def parse_retry_after(value):
+    """ Parses a Retry-After header, given either as a number of seconds or as an HTTP date.
+        Returns the number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
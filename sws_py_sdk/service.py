@@ -1,21 +1,97 @@
 """ This is the base class for the Web Service definitions -- includes common functions
 """
+import hashlib
+import inspect
 import json
-from requests import Request, Session
+import re
+import time
+from contextlib import nullcontext
+from functools import partial
+from urllib.parse import urlparse
+from requests import Request
+from requests.exceptions import RequestException
 from requests.auth import HTTPBasicAuth
-from sws_py_sdk import firewall_header
+from sws_py_sdk import conditional, metrics, timeouts
+from sws_py_sdk.cache import entry_from_response, response_from_entry
+from sws_py_sdk.connection_pool import RequestAborter
+
+
+def endpoint_template(endpoint):
+    """ Returns the template of an endpoint, with the IDs in its path replaced by '{id}'. For example
+        '/api/v1/users/1000/licenses' becomes '/api/v1/users/{id}/licenses'. Any path segment containing a digit, other
+        than the API version, is treated as an ID.
+        endpoint : string
+            The URI path or full URL of the endpoint
+    """
+    path = urlparse(endpoint).path
+    return '/'.join('{id}' if _ID_PATTERN.search(segment) and not _VERSION_PATTERN.match(segment) else segment
+                    for segment in path.split('/'))
+
+
+_ID_PATTERN = re.compile(r'\d')
+_VERSION_PATTERN = re.compile(r'^v\d+$')
+
+
+def _frozen_params(params):
+    # Params set to None are not sent, so they do not distinguish calls
+    return tuple(sorted((key, str(value)) for key, value in params.items() if value is not None))
+
+
+def _accepts_context(handler):
+    # Determines whether an invalid access token handler takes the context of the call as a third argument
+    try:
+        parameters = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return True
+    positional = [parameter for parameter in parameters
+                  if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)]
+    return len(positional) >= 3 or any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters)
+
+
+class RequestContext(object):
+    def __init__(self, request, timeout, endpoint=None, stream=False, sink=None):
+        """ State of a single logical call, carried explicitly through the token refresh and replay so that
+            services can be shared between threads.
+            request : requests.Request
+                The request made by the call. Its Authorization header is replaced when the call is replayed with a
+                refreshed access token.
+            timeout : Timeout
+                Timeouts that apply to the call
+            endpoint : string
+                Template of the endpoint called, see `endpoint_template`. Derived from the request URL if omitted.
+            stream : bool
+                If True, the body of the response is not read before it is returned (synchronous client only)
+            sink : function
+                Called with each chunk of the body of a successful response, instead of the body being kept in memory
+                (asyncio client only)
+        """
+        self.request = request
+        self.timeout = timeout
+        self.endpoint = endpoint if endpoint is not None else endpoint_template(request.url)
+        self.stream = stream
+        self.sink = sink
+        # Number of times a request of the call was retried after a transient failure
+        self.retries = 0
+        # True once the call has been replayed with a refreshed access token
+        self.token_refreshed = False
+        # Connection timings of the last request of the call, in seconds, see RequestEvent
+        self.timings = {}
 
 
 class Service(object):
+    # Key of the service in the Sws configuration, e.g. 'license'
+    service_key = None
+
     def __init__(self, sws):
         """ Initializes the service object with a reference to the base SWS instance.
             sws : Sws instance
         """
         self.sws = sws
         self.service_uri = ''
-        self.last_request = None
         self.invalid_access_token_handler = None
-        self.FirewallHeader = firewall_header.FirewallHeader()
+        # Request of the last call rejected because of its access token, for handlers that do not take a context
+        self.last_request = None
+        self.FirewallHeader = sws.firewall_header
 
     def fetch(self,
               auth,
@@ -25,7 +101,9 @@ class Service(object):
               method='GET',
               timeout=None,
               headers={'Accept': 'application/json',
-                       'Content-Type': 'application/json'}):
+                       'Content-Type': 'application/json'},
+              stream=False,
+              cache=False):
         """ Highest level function for handling requests
             auth : object | string
                 Will either contain a configured form of authentication - like the well supported
@@ -38,44 +116,453 @@ class Service(object):
                 If a POST request this will be the data in the body of the packet.
             method : string
                 The HTTP method
-            timeout : float
-                The time that the request will wait before timing out if there is
-                no data from the server.
+            timeout : Timeout | float
+                Overrides the client timeout for this call. Either a Timeout or a number of milliseconds.
+                The total limit covers any token refresh and replay triggered by the call.
             headers : dict
                 The headers that will be sent in the request
+            stream : bool
+                If True, the response body is not downloaded until it is accessed, e.g. with `iter_content()`.
+                The caller must then close the response.
+            cache : bool | str
+                If True and the client has a response cache, a successful GET response is cached, keyed by endpoint,
+                params and the identity of the caller, and returned again without a request until it expires. If
+                'public', the response is shared by every caller whatever their credentials.
 
         """
-        self.last_request = self.build_request(
-            auth=auth,
-            endpoint=('' if self.service_uri.find('://') != -1 else 'https://') + self.service_uri + endpoint,
-            body=body,
-            method=method,
-            params=params,
-            timeout=timeout,
-            headers=headers)
+        cache_key = (self.cache_key(endpoint, body, params, auth, public=cache == 'public')
+                     if cache and method == 'GET' and not stream else None)
+        response = self.cached_response(cache_key)
+        if response is not None:
+            self.record_cache_hit(endpoint, response)
+            return response
+        started = time.perf_counter()
+        call_timeout = timeouts.resolve(timeout, self.sws.timeout)
+        with timeouts.deadline(call_timeout.total):
+            request = self.build_request(
+                auth=auth,
+                endpoint=('' if self.service_uri.find('://') != -1 else 'https://') + self.service_uri + endpoint,
+                body=body,
+                method=method,
+                params=params,
+                timeout=timeout,
+                headers=headers)
 
-        return self.fetch_request(self.last_request)
+            context = RequestContext(request=request, timeout=call_timeout, endpoint=endpoint_template(endpoint),
+                                     stream=stream)
+            coalescing_key = self.coalescing_key(context)
+            try:
+                with self.call_span(context) as span:
+                    if coalescing_key is None:
+                        response = self.fetch_request(request, context=context)
+                    else:
+                        response = self.sws.request_coalescer.run(coalescing_key,
+                                                                  lambda: self.fetch_request(request, context=context))
+                    self.trace_response(span, response, context)
+            except Exception as e:
+                self.record_call(context, started, exception=e)
+                raise
+        self.record_call(context, started, response=response)
+        self.cache_response(cache_key, response)
+        return response
+
+    def record_call(self, context, started, response=None, exception=None):
+        """ Reports a completed call to the client metrics hook, if any
+            context : RequestContext
+                State of the call
+            started : float
+                `time.perf_counter()` when the call started
+            response : requests.Response
+                Response of the call, if it did not raise
+            exception : Exception
+                Exception raised by the call, if any
+        """
+        hook = self.sws.metrics_hook
+        if hook is not None:
+            hook(metrics.event_from_call(self.service_key, context, time.perf_counter() - started, response,
+                                         exception))
+
+    def record_cache_hit(self, endpoint, response):
+        """ Reports a call answered from the client response cache to the client metrics hook and tracing, if any """
+        hook = self.sws.metrics_hook
+        if hook is not None:
+            hook(metrics.RequestEvent(service=self.service_key, endpoint=endpoint_template(endpoint), method='GET',
+                                      status=response.status_code, cached=True))
+        if self.sws.tracing is not None:
+            self.sws.tracing.record_cache_hit(self.service_key, endpoint_template(endpoint), response)
+
+    def call_span(self, context):
+        """ Returns a context manager tracing a call, which yields its span, or None if the client has no tracing
+            context : RequestContext
+                State of the call
+        """
+        if self.sws.tracing is None:
+            return nullcontext()
+        return self.sws.tracing.call_span(self.service_key, context)
+
+    def request_span(self, context, prepared_request, attempt):
+        """ Returns a context manager tracing a request sent by a call, which yields its span, or None if the client
+            has no tracing. The trace context is added to the headers of the request.
+            context : RequestContext
+                State of the call
+            prepared_request : requests.PreparedRequest
+                The request, about to be sent
+            attempt : int
+                1 for the first request of the call, 2 for its first retry, and so on
+        """
+        if self.sws.tracing is None:
+            return nullcontext()
+        return self.sws.tracing.request_span(self.service_key, context, prepared_request, attempt)
+
+    def trace_response(self, span, response, context=None):
+        """ Records a response on the span of a call or request, if it is traced """
+        if span is not None:
+            self.sws.tracing.record_response(span, response, context)
+
+    def coalescing_key(self, context):
+        """ Returns the key shared by identical calls, which the client request coalescer sends only once if they
+            are made at the same time, or None if the call must not be coalesced. Only GET calls whose response is
+            read into memory are coalesced. Calls are identical if they have the same URL, params, Accept header
+            and credentials.
+            context : RequestContext
+                State of the call
+        """
+        if (self.sws.request_coalescer is None or context.request.method != 'GET' or context.stream
+                or context.sink is not None):
+            return None
+        prepared_request = context.request.prepare()
+        authorization = prepared_request.headers.get('Authorization', '')
+        return (self.service_key, prepared_request.url, prepared_request.headers.get('Accept'),
+                hashlib.sha256(authorization.encode()).hexdigest())
+
+    def cache_key(self, endpoint, body={}, params={}, auth=None, public=False):
+        """ Returns the key of a call in the client response cache. Responses depend on the host and on who fetched
+            them, so the key includes the service URI and the identity of the caller (see `cache_identity`).
+            endpoint : string
+                The URI path of the call
+            body : dict
+                The body of the call, used for the URL params of a GET request
+            params : dict
+                The URL params of the call
+            auth : object | string
+                The authentication of the call, see `fetch`
+            public : bool
+                If True, the response is the same for every caller, e.g. a catalogue, and is shared whoever fetched
+                it
+        """
+        return (self.service_key, endpoint, _frozen_params(body), _frozen_params(params), self.service_uri,
+                None if public else self.cache_identity(auth))
+
+    def cache_identity(self, auth):
+        """ Returns the identity cached responses are shared under: the app ID and user ID of the client for calls
+            made with its access token, whichever token it currently holds, so entries survive token refreshes and
+            are shared by every worker of the same app and user. Clients with the default `user_id` of 0, acting for
+            whoever their access token belongs to, must only share a cache if they act for the same user.
+            auth : object | string
+                The authentication of the call, see `fetch`
+        """
+        if auth == 'bearer':
+            return self.sws.app_id, self.sws.user_id
+        if isinstance(auth, HTTPBasicAuth):
+            return 'basic', auth.username
+        return None
+
+    def cached_response(self, cache_key):
+        """ Returns the response cached for a key, or None """
+        if cache_key is None or self.sws.response_cache is None:
+            return None
+        entry = self.sws.response_cache.get(cache_key)
+        return response_from_entry(entry) if entry is not None else None
+
+    def cache_response(self, cache_key, response):
+        """ Caches a successful response, without the request it was sent with """
+        if cache_key is not None and self.sws.response_cache is not None and response.ok:
+            self.sws.response_cache.set(cache_key, entry_from_response(response))
+
+    def invalidate_cache(self, endpoint=None):
+        """ Removes responses of this service from the client response cache
+            endpoint : string
+                The URI path, or endpoint template, of the responses to remove, e.g. '/api/v1/products/types/{id}'.
+                Every response of the service is removed if omitted.
+        """
+        if self.sws.response_cache is None:
+            return
+        self.sws.response_cache.invalidate_matching(
+            lambda key: key[0] == self.service_key and endpoint in (None, key[1], endpoint_template(key[1])))
 
-    def fetch_request(self, request):
+    def fetch_request(self, request, timeout=None, context=None):
         """ Responsible for taking the Request object and sending it - includes error handling
             request : Requests.Request
                 The HTTP request that is being sent.
+            timeout : Timeout | float
+                Connect and read timeouts for the request. Defaults to the client timeout.
+                Both are capped by the time left before the deadline of the current call.
+            context : RequestContext
+                State of the call the request belongs to. Created for the request if omitted, and passed to the
+                invalid access token handler so that it can replay this call's request.
         """
-        # First, prepare request
-        session = Session()
-        prepared_request = session.prepare_request(request)
-        response = session.send(prepared_request)
-        if not response.ok:
-            data = response.json()
-            if ((response.status_code == 403 and data['code'] == 2001)
-                    or (response.status_code == 401 and data['code'] == 2002)):
-                # Access token is invalid or expired
-                # 403 2001 - Invalid access token
-                # 401 2002 - Expired access token
-                return self.sws.invalid_access_token_handler(self, response)
+        if context is None:
+            context = RequestContext(request=request, timeout=timeouts.resolve(timeout, self.sws.timeout))
+        response = self.send_request(context)
+        if self.is_invalid_access_token_response(response):
+            return self.handle_invalid_access_token(response, context)
 
         return response
 
+    def handle_invalid_access_token(self, response, context):
+        """ Calls the client invalid access token handler with a response rejected because of its access token.
+            Handlers written as `handler(service, response)`, before the context was passed, are still supported:
+            `last_request` is set to the request of the call for them to replay.
+            response : requests.Response
+                The rejected response
+            context : RequestContext
+                State of the call
+        """
+        handler = self.sws.invalid_access_token_handler
+        if _accepts_context(handler):
+            return handler(self, response, context)
+        # Not thread-safe, like the handlers relying on it
+        self.last_request = context.request
+        return handler(self, response)
+
+    def send_request(self, context):
+        """ Sends the request of a call, retrying transient failures according to the client retry policy
+            context : RequestContext
+                State of the call the request belongs to
+        """
+        # First, prepare request using the pooled session so that connections are reused between calls
+        session = self.sws.connection_pool.session()
+        prepared_request = session.prepare_request(context.request)
+        stored = self.add_conditional_validators(context, prepared_request)
+        attempt = 1
+        while True:
+            try:
+                response = self.send_attempt(context, session, prepared_request, attempt)
+            except RequestException as e:
+                delay = self.retry_delay(prepared_request.method, attempt, exception=e)
+                if delay is None:
+                    raise
+            else:
+                delay = self.retry_delay(prepared_request.method, attempt, response=response)
+                if delay is None:
+                    return self.conditional_response(stored, response)
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+            context.retries += 1
+
+    def send_attempt(self, context, session, prepared_request, attempt):
+        """ Sends a request of a call once the circuit breaker and rate limiter allow it, and returns its response.
+            Whatever ends the attempt, the trial slot it may hold in a half-open circuit is either used by recording
+            its outcome or given back.
+            session : requests.Session
+                Pooled session sending the request
+            attempt : int
+                1 for the first request of the call, 2 for its first retry, and so on
+        """
+        # An open circuit fails the call without taking a rate limit token from the requests that can be sent
+        self.check_circuit(context)
+        try:
+            self.wait_for_rate_limit()
+            attempt_timeouts = timeouts.attempt_timeouts(context.timeout)
+            with self.request_span(context, prepared_request, attempt) as span:
+                response = self.hedged_send(context,
+                                            partial(session.send, timeout=attempt_timeouts, stream=context.stream),
+                                            prepared_request)
+                self.trace_response(span, response)
+            return response
+        except BaseException:
+            self.release_circuit(context)
+            raise
+
+    def add_conditional_validators(self, context, prepared_request):
+        """ Makes a GET request conditional if the client stores conditional responses and has a response to it.
+            Returns the (key, stored response) of the request, to be passed to `conditional_response`, or None if
+            the response of the request is not stored.
+            context : RequestContext
+                State of the call the request belongs to
+            prepared_request : requests.PreparedRequest
+                The request, about to be sent
+        """
+        cache = self.sws.conditional_cache
+        if cache is None or prepared_request.method != 'GET' or context.stream or context.sink is not None:
+            return None
+        key = conditional.cache_key(self.service_key, prepared_request)
+        entry = cache.get(key)
+        if entry is not None:
+            conditional.add_validators(prepared_request, entry)
+        return key, entry
+
+    def conditional_response(self, stored, response):
+        """ Returns the response to give to the caller of a request made conditional by
+            `add_conditional_validators`. A '304 Not Modified' reply is replaced by the stored response, and new
+            responses with validators are stored.
+            stored : tuple
+                (key, stored response) of the request, or None
+            response : requests.Response
+                The response received
+        """
+        if stored is None:
+            return response
+        key, entry = stored
+        if response.status_code == 304 and entry is not None:
+            return conditional.response_from_entry(entry, response)
+        entry = conditional.entry_from_response(response)
+        if entry is not None:
+            self.sws.conditional_cache.set(key, entry)
+        return response
+
+    def hedged_send(self, context, send, prepared_request):
+        """ Sends a request with `send(prepared_request)`, hedged if the client hedging policy applies to it. The
+            request must have been allowed by `check_circuit`. The outcome of each request sent, including the hedge,
+            is recorded with the circuit breaker.
+            context : RequestContext
+                State of the call the request belongs to
+            send : function
+                Sends a prepared request and returns its response
+            prepared_request : requests.PreparedRequest
+                The request to send
+        """
+        key = self.hedging_key(context, prepared_request)
+        if key is None:
+            return self.recorded_send(context, send, prepared_request)
+        abort = RequestAborter()
+        return self.sws.hedging_policy.send(key, partial(self.recorded_send, context, send, abort=abort),
+                                            prepared_request, hedge_send=partial(self.send_hedge, context, send),
+                                            abort=abort)
+
+    def send_hedge(self, context, send, prepared_request):
+        """ Sends the hedge of a request once the rate limiter and circuit breaker allow it, like any other request
+        """
+        self.check_circuit(context)
+        try:
+            self.wait_for_rate_limit()
+            return self.recorded_send(context, send, prepared_request)
+        except BaseException:
+            self.release_circuit(context)
+            raise
+
+    def recorded_send(self, context, send, prepared_request, abort=None):
+        """ Sends a request with `send(prepared_request)` and records its outcome with the circuit breaker. A request
+            that ends without an outcome gives its trial slot back to the circuit breaker instead.
+            abort : RequestAborter
+                Aborts the request once its hedge has answered it. An aborted request is not recorded.
+        """
+        try:
+            response = send(prepared_request)
+        except RequestException as e:
+            if abort is not None and abort.aborted:
+                self.release_circuit(context)
+            else:
+                self.record_circuit(context, exception=e)
+            raise
+        except BaseException:
+            self.release_circuit(context)
+            raise
+        self.record_circuit(context, response=response)
+        return response
+
+    def hedging_key(self, context, prepared_request):
+        """ Returns the (service key, endpoint template) the hedging policy tracks a request under, or None if the
+            request must not be hedged. Only GET requests whose response is read into memory can be hedged.
+        """
+        policy = self.sws.hedging_policy
+        if policy is None or prepared_request.method != 'GET' or context.stream or context.sink is not None:
+            return None
+        key = (self.service_key, context.endpoint)
+        return key if policy.applies_to(key) else None
+
+    def rate_limit_delay(self):
+        """ Takes a token from the rate limiter configured for this service, if any, and returns the number of seconds
+            to wait before sending the request. Raises DeadlineExceeded if the wait would take the call past its
+            deadline.
+        """
+        bucket = self.sws.rate_limits.get(self.service_key)
+        if bucket is None:
+            return 0
+        wait = bucket.reserve(max_wait=timeouts.remaining())
+        if wait is None:
+            raise timeouts.DeadlineExceeded(f'Rate limit for the {self.service_key} service would exceed the timeout')
+        return wait
+
+    def wait_for_rate_limit(self):
+        """ Waits until the rate limiter configured for this service allows a request. Raises DeadlineExceeded if
+            the wait would take the call past its deadline.
+        """
+        rate_limit_delay = self.rate_limit_delay()
+        if rate_limit_delay > 0:
+            time.sleep(rate_limit_delay)
+
+    def check_circuit(self, context):
+        """ Raises CircuitOpenError if the client circuit breaker does not allow a request to the endpoint of the call
+            context : RequestContext
+                State of the call the request belongs to
+        """
+        if self.sws.circuit_breaker is not None:
+            self.sws.circuit_breaker.before_request((self.service_key, context.endpoint))
+
+    def release_circuit(self, context):
+        """ Tells the client circuit breaker that a request allowed by `check_circuit` ended without an outcome to
+            record, e.g. because it was not sent or was cancelled. Has no effect once its outcome has been recorded.
+            context : RequestContext
+                State of the call the request belongs to
+        """
+        if self.sws.circuit_breaker is not None:
+            self.sws.circuit_breaker.release((self.service_key, context.endpoint))
+
+    def record_circuit(self, context, response=None, exception=None):
+        """ Records the outcome of a request with the client circuit breaker
+            context : RequestContext
+                State of the call the request belongs to
+            response : requests.Response
+                The response received, if any
+            exception : Exception
+                The exception raised while sending the request, if any
+        """
+        if self.sws.circuit_breaker is not None:
+            self.sws.circuit_breaker.record((self.service_key, context.endpoint),
+                                            response=response,
+                                            exception=exception)
+
+    def retry_delay(self, method, attempt, response=None, exception=None):
+        """ Returns the number of seconds to wait before retrying a failed attempt, or None if it must not be retried.
+            A request is never retried if the wait would take the call past its deadline.
+            method : str
+                HTTP method of the request
+            attempt : int
+                Number of attempts made so far, starting at 1
+            response : requests.Response
+                The response received, if any
+            exception : Exception
+                The exception raised while sending the request, if any
+        """
+        policy = self.sws.retry_policy
+        if policy is None or not policy.should_retry(method, attempt, response=response, exception=exception):
+            return None
+        delay = policy.backoff(attempt, response=response)
+        try:
+            left = timeouts.remaining()
+        except timeouts.DeadlineExceeded:
+            return None
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    @staticmethod
+    def is_invalid_access_token_response(response):
+        """ Checks whether a request failed because its access token is invalid or expired
+            response : requests.Response
+                The response to check
+        """
+        if not response.ok:
+            data = response.json()
+            # Access token is invalid or expired
+            # 403 2001 - Invalid access token
+            # 401 2002 - Expired access token
+            return ((response.status_code == 403 and data['code'] == 2001)
+                    or (response.status_code == 401 and data['code'] == 2002))
+        return False
+
     def build_request(self, auth, endpoint, body, params, method, timeout, headers):
         """ Build up the request object.
             auth : object | string
@@ -96,7 +583,8 @@ class Service(object):
                 The headers that will be sent in the request
         """
 
-        request = Request(method=method, url=endpoint, headers=headers)
+        # Copy the headers so that the request never modifies the caller's dict, or a shared default argument
+        request = Request(method=method, url=endpoint, headers=dict(headers))
 
         if auth is 'bearer':
             request.headers['Authorization'] = f'Bearer {self.sws.access_token}'
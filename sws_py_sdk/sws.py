@@ -5,7 +5,10 @@
 """
 import base64
 
-from sws_py_sdk import identity, license, ecom, cloudlib
+from sws_py_sdk import identity, license, ecom, cloudlib, timeouts
+from sws_py_sdk.batch import run_batch
+from sws_py_sdk.connection_pool import ConnectionPool
+from sws_py_sdk.firewall_header import FirewallHeader
 
 service_uri_default = {
     'id': 'id.serato.com',
@@ -29,6 +32,17 @@ class Sws(object):
         test_env=False,
         cdn_auth_id=None,
         cdn_auth_secret=None,
+        connection_pool=None,
+        retry_policy=None,
+        rate_limits={},
+        circuit_breaker=None,
+        response_cache=None,
+        conditional_cache=None,
+        request_coalescer=None,
+        hedging_policy=None,
+        firewall_header=None,
+        metrics_hook=None,
+        tracing=None,
     ):
         """
         Create SWS object
@@ -40,20 +54,61 @@ class Sws(object):
             Application secret
         user_id : int
             End user ID
-        timeout : float
-            Request timeout
+        timeout : Timeout | float
+            Request timeout in milliseconds, or a Timeout with separate connect, read and total limits
         service_uri : object
             Base URIs for SWS services
         service_uri.id : str
             Base URI for SWS ID Service
         service_uri.license : str
             Base URI for SWS License Service
-        auto_refresh : boolean
-            Determines if the client will attempt to refresh the access token if invalid or expired.
+        invalid_access_token_handler : function
+            Called as `handler(service, response, context)` when a request fails due to an invalid or expired access
+            token. `context` is the RequestContext of the failed call. Returns the response to give to the caller.
+            Handlers taking only `(service, response)` are called without the context, and can replay
+            `service.last_request`, which is not safe when a client is shared between threads.
         cdn_auth_id : str
             Client ID used to authenticate with test stack CDNs
         cdn_auth_secret : str
             Secret used to authenticate with test stack CDNs
+        connection_pool : ConnectionPool
+            Pool of keep-alive HTTP connections used by every service. A default pool is created if omitted.
+            Pass the same pool to several Sws instances to share connections between them.
+        retry_policy : RetryPolicy
+            Policy used to retry requests after transient failures. Requests are not retried if omitted.
+        rate_limits : dict
+            Rate limiters (TokenBucket) keyed by service key: 'id', 'license', 'ecom' or 'cloudlib'.
+            A limiter can be shared between Sws instances, threads and asyncio tasks.
+        circuit_breaker : CircuitBreaker
+            Circuit breaker used to fail fast on endpoints that keep failing. Disabled if omitted.
+        response_cache : Cache
+            Cache of the responses of rarely changing endpoints, such as the product type catalogue: a TTLCache in
+            process memory, or a SQLiteCache or RedisCache shared between processes. Responses are keyed by service
+            URI and by the app ID and user ID of the client, so entries survive token refreshes and are shared by the
+            workers of the same app and user. Catalogue responses, such as product types, are shared by every
+            client. Disabled if omitted.
+        conditional_cache : Cache
+            Store of GET responses that carry an ETag or Last-Modified header. When set, repeated GET requests are
+            sent with If-None-Match / If-Modified-Since, and a '304 Not Modified' reply is answered with the stored
+            response, so unchanged bodies are not downloaded again. Disabled if omitted.
+        request_coalescer : RequestCoalescer
+            When set, identical GET requests made at the same time by several threads or tasks are sent once and
+            every caller receives the same response object. Disabled if omitted.
+        hedging_policy : HedgingPolicy
+            When set, slow GET requests are hedged: a second identical request is sent and the first response is
+            used. Hedges are rate limited and checked by the circuit breaker like any other request. Disabled if
+            omitted.
+        firewall_header : FirewallHeader
+            Generator of the firewall header sent to test stacks when `test_env` is set. Pass
+            `FirewallHeader(cache_window=...)` to reuse each header for a few seconds under load. A new header is
+            generated for every request if omitted.
+        metrics_hook : function
+            Called with a RequestEvent after every call, with its timings, sizes, retries and whether its access token
+            was refreshed, e.g. a PrometheusMetrics. No event is built if omitted.
+        tracing : Tracing
+            When set, every call opens an OpenTelemetry span named after its endpoint template, with child spans for
+            each request it sends and any token refresh, and the trace context is propagated in request headers.
+            Disabled if omitted.
         """
         self.app_id = app_id
         self.secret = secret
@@ -61,6 +116,17 @@ class Sws(object):
         self.timeout = timeout
         self.access_token = ''
         self.refresh_token = ''
+        self.connection_pool = connection_pool if connection_pool is not None else ConnectionPool()
+        self.retry_policy = retry_policy
+        self.rate_limits = dict(rate_limits)
+        self.circuit_breaker = circuit_breaker
+        self.response_cache = response_cache
+        self.conditional_cache = conditional_cache
+        self.request_coalescer = request_coalescer
+        self.hedging_policy = hedging_policy
+        self.firewall_header = firewall_header if firewall_header is not None else FirewallHeader()
+        self.metrics_hook = metrics_hook
+        self.tracing = tracing
         self.service_uris = {
             'id': service_uri['id'] if 'id' in service_uri.keys() else service_uri_default['id'],
             'license': service_uri['license'] if 'license' in service_uri.keys() else service_uri_default['license'],
@@ -96,6 +162,38 @@ class Sws(object):
         """ Getter for the cloud library service instance """
         return self.service['cloudlib']
 
+    def batch(self, calls, max_workers=10):
+        """ Runs many service calls concurrently and yields a BatchResult for each as it completes, e.g.
+
+            calls = {product_id: partial(sws.license().get_product_info, product_id) for product_id in product_ids}
+            for result in sws.batch(calls, max_workers=10):
+                ...
+
+            calls : dict | iterable
+                Maps keys to calls taking no arguments, either as a dict or as (key, call) pairs
+            max_workers : int
+                Maximum number of calls in progress at once. Should not exceed the `pool_maxsize` of the connection
+                pool.
+        """
+        return run_batch(calls, max_workers=max_workers)
+
+    def with_timeout(self, timeout):
+        """ Returns a context manager that overrides the client timeout for calls made within it, e.g.
+
+            with sws.with_timeout(Timeout(connect=500, total=2000)):
+                sws.license().get_licenses()
+
+            timeout : Timeout | float
+                The timeout to use, or a number of milliseconds applied to every limit
+        """
+        return timeouts.override(timeout)
+
+    def close(self):
+        """ Closes the pooled HTTP connections used by the services """
+        self.connection_pool.close()
+        if self.hedging_policy is not None:
+            self.hedging_policy.close()
+
     def get_cdn_auth_header(self):
         """ Returns the x-serato-cdn-auth header, encoding the credentials used to access test stack CDNs
         """
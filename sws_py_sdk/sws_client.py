@@ -1,7 +1,12 @@
 import datetime
+import random
+import threading
+from contextlib import nullcontext
 from uuid import uuid4
 from urllib.parse import urlencode
 
+from requests.exceptions import RequestException
+
 from .sws import Sws
 """ This is the client.
     It needs a nice description.
@@ -11,7 +16,10 @@ from .sws import Sws
 class SwsClient(Sws):
 
     def __init__(self, app_id, secret=None, user_id=0, timeout=3000, service_uri={}, auto_refresh=True, test_env=False,
-                 cdn_auth_id=None, cdn_auth_secret=None):
+                 cdn_auth_id=None, cdn_auth_secret=None, connection_pool=None, retry_policy=None,
+                 rate_limits={}, circuit_breaker=None, response_cache=None, conditional_cache=None,
+                 request_coalescer=None, hedging_policy=None, firewall_header=None, metrics_hook=None,
+                 tracing=None):
         """
         Here we set up a mechanism for token refresh to be handled and triggered
         Create SWS object
@@ -23,8 +31,8 @@ class SwsClient(Sws):
             Application secret
         user_id : int
             End user ID
-        timeout : float
-            Request timeout
+        timeout : Timeout | float
+            Request timeout in milliseconds, or a Timeout with separate connect, read and total limits
         service_uri : object
             Base URIs for SWS services
         service_uri.id : str
@@ -39,12 +47,45 @@ class SwsClient(Sws):
             Client ID used to authenticate with test stack CDNs
         cdn_auth_secret : str
             Secret used to authenticate with test stack CDNs
+        connection_pool : ConnectionPool
+            Pool of keep-alive HTTP connections used by every service. A default pool is created if omitted.
+        retry_policy : RetryPolicy
+            Policy used to retry requests after transient failures. Requests are not retried if omitted.
+        rate_limits : dict
+            Rate limiters (TokenBucket) keyed by service key: 'id', 'license', 'ecom' or 'cloudlib'.
+        circuit_breaker : CircuitBreaker
+            Circuit breaker used to fail fast on endpoints that keep failing. Disabled if omitted.
+        response_cache : Cache
+            Cache of the responses of rarely changing endpoints, such as the product type catalogue. Disabled if
+            omitted.
+        conditional_cache : Cache
+            Store of GET responses used to make repeated GET requests conditional. Disabled if omitted.
+        request_coalescer : RequestCoalescer
+            Shares one request between identical GET requests made at the same time. Disabled if omitted.
+        hedging_policy : HedgingPolicy
+            Hedges slow GET requests with a second identical request. Disabled if omitted.
+        firewall_header : FirewallHeader
+            Generator of the test stack firewall header. A new header is generated for every request if omitted.
+        metrics_hook : function
+            Called with a RequestEvent after every call, e.g. a PrometheusMetrics. Disabled if omitted.
+        tracing : Tracing
+            Opens OpenTelemetry spans around calls, their requests and token refreshes. Disabled if omitted.
         """
         super().__init__(app_id=app_id, secret=secret, user_id=user_id, timeout=timeout, service_uri=service_uri,
                          invalid_access_token_handler=self._handle_invalid_access_token, test_env=test_env,
-                         cdn_auth_id=cdn_auth_id, cdn_auth_secret=cdn_auth_secret)
+                         cdn_auth_id=cdn_auth_id, cdn_auth_secret=cdn_auth_secret, connection_pool=connection_pool,
+                         retry_policy=retry_policy, rate_limits=rate_limits,
+                         circuit_breaker=circuit_breaker, response_cache=response_cache,
+                         conditional_cache=conditional_cache, request_coalescer=request_coalescer,
+                         hedging_policy=hedging_policy, firewall_header=firewall_header,
+                         metrics_hook=metrics_hook, tracing=tracing)
         self.auto_refresh = auto_refresh
         self.access_token_updated_callback = None
+        #   UTC expiry time of the access token. Set automatically when the token is refreshed.
+        self.access_token_expires_at = None
+        self._refresh_lock = threading.RLock()
+        self._refresh_scheduler_thread = None
+        self._refresh_scheduler_stop = None
 
     def set_access_token_updated_callback(self, callback):
         """
@@ -54,43 +95,173 @@ class SwsClient(Sws):
         """
         self.access_token_updated_callback = callback
 
-    def _handle_invalid_access_token(self, service, response):
+    def _handle_invalid_access_token(self, service, response, context):
         """
         Handles the case where a response came back from a service where the access token was not valid or was expired.
 
-        If `auto_refresh` is true, will attempt to refresh the access token then attempt to make the last request again,
-        otherwise returns the original response.
+        If `auto_refresh` is true, will attempt to refresh the access token then attempt to make the failed request
+        again, otherwise returns the original response.
 
         :param Service service: The service which failed to fulfill a request due to an invalid access token.
         :param requests.Response response: The response given due to the invalid access token.
+        :param RequestContext context: State of the call that failed, including the request to replay.
         :return: A HTTP response.
         :rtype: requests.Response
         """
         if self.auto_refresh:
-            last_request = service.last_request
-            response = self.identity().token_refresh(self.refresh_token)
-            #   This token refresh request may have resulted in an error that was
-            #   handled by a custom error handler.
+            #   Only one thread refreshes the token at a time. Threads that were waiting on the lock find the token
+            #   has already been replaced and replay their request without refreshing it again.
+            with self._refresh_lock:
+                if self._needs_refresh(response.request):
+                    with self._token_refresh_span():
+                        response = self.refresh_access_token()
+                    #   This token refresh request may have resulted in an error that was
+                    #   handled by a custom error handler.
 
-            data = response.json()
+                    if 'tokens' not in response.json():
+                        return response
 
-            if 'tokens' in data:
-                #   Update the access token property
-                self.access_token = data['tokens']['access']['token']
-                #   Call the callback
-                if self.access_token_updated_callback:
-                    self.access_token_updated_callback(
-                        token=self.access_token,
-                        expires=datetime.datetime.utcfromtimestamp(data['tokens']['access']['expires_at'])
-                    )
-
-                #   Set a new Authorization header for the request
-                last_request.headers['Authorization'] = f'Bearer {self.access_token}'
-
-                #   Re-execute the 'last request'
-                return service.fetch_request(last_request)
+            #   Set a new Authorization header for the request
+            context.request.headers['Authorization'] = f'Bearer {self.access_token}'
+            context.token_refreshed = True
+
+            #   Re-execute the failed request
+            return service.fetch_request(context.request, context=context)
         return response
 
+    def refresh_access_token(self):
+        """
+        Refreshes the access token using the refresh token.
+
+        :return: The token refresh response.
+        :rtype: requests.Response
+        """
+        with self._refresh_lock:
+            response = self.identity().token_refresh(self.refresh_token)
+            data = response.json()
+            if 'tokens' in data:
+                self._update_access_token(data)
+            return response
+
+    def start_token_refresh_scheduler(self, refresh_margin=60, jitter=15, poll_interval=30):
+        """
+        Starts a background thread that refreshes the access token shortly before it expires, so that requests do not
+        have to fail with an expired token before it is refreshed.
+
+        The expiry time is taken from `access_token_expires_at`, which is set whenever the token is refreshed and can
+        also be set when assigning an access token.
+
+        :param float refresh_margin: Number of seconds before expiry at which the token is refreshed.
+        :param float jitter: Maximum number of seconds randomly added to the margin, so that many clients sharing a
+                             refresh schedule do not all refresh at the same moment.
+        :param float poll_interval: Maximum number of seconds between checks of the expiry time. Also used as the
+                                    delay before retrying a failed refresh.
+        :return: Nothing.
+        """
+        if self._refresh_scheduler_thread is not None and self._refresh_scheduler_thread.is_alive():
+            return
+        self._refresh_scheduler_stop = threading.Event()
+        self._refresh_scheduler_thread = threading.Thread(
+            target=self._run_token_refresh_scheduler,
+            args=(self._refresh_scheduler_stop, refresh_margin, jitter, poll_interval),
+            name='sws-token-refresh',
+            daemon=True
+        )
+        self._refresh_scheduler_thread.start()
+
+    def stop_token_refresh_scheduler(self):
+        """
+        Stops the background token refresh thread, if it is running.
+
+        :return: Nothing.
+        """
+        if self._refresh_scheduler_thread is not None:
+            self._refresh_scheduler_stop.set()
+            self._refresh_scheduler_thread.join()
+            self._refresh_scheduler_thread = None
+
+    def close(self):
+        """ Stops the token refresh scheduler and closes the pooled HTTP connections """
+        self.stop_token_refresh_scheduler()
+        super().close()
+
+    def _run_token_refresh_scheduler(self, stop, refresh_margin, jitter, poll_interval):
+        while not stop.is_set():
+            delay = self._next_refresh_delay(refresh_margin, jitter)
+            if delay is None or delay > poll_interval:
+                #   The expiry is unknown or still far away. Check again later as the token may be replaced meanwhile.
+                stop.wait(poll_interval)
+                continue
+            if stop.wait(max(delay, 0)):
+                break
+            try:
+                self.refresh_access_token()
+            except RequestException:
+                pass
+            if self._token_refresh_failed(refresh_margin):
+                stop.wait(poll_interval)
+
+    def _next_refresh_delay(self, refresh_margin, jitter):
+        """
+        Computes the number of seconds until the access token should be refreshed.
+
+        :param float refresh_margin: Number of seconds before expiry at which the token is refreshed.
+        :param float jitter: Maximum number of seconds randomly added to the margin.
+        :return: Seconds until the refresh is due, or None if the expiry time of the token is unknown.
+        :rtype: float
+        """
+        if self.access_token_expires_at is None:
+            return None
+        time_to_expiry = (self.access_token_expires_at - datetime.datetime.utcnow()).total_seconds()
+        return time_to_expiry - refresh_margin - random.uniform(0, jitter)
+
+    def _token_refresh_failed(self, refresh_margin):
+        """
+        Checks whether a scheduled refresh left the client without a token that is valid past the refresh margin,
+        meaning the refresh failed and must not be retried straight away.
+        """
+        delay = self._next_refresh_delay(refresh_margin, 0)
+        return delay is None or delay <= 0
+
+    def _token_refresh_span(self):
+        """
+        Returns a context manager tracing a token refresh triggered by a call, or doing nothing if the client has no
+        tracing.
+
+        :return: A context manager.
+        """
+        if self.tracing is None:
+            return nullcontext()
+        return self.tracing.token_refresh_span()
+
+    def _needs_refresh(self, failed_request):
+        """
+        Determines whether a request failed with the current access token, or with one that has since been replaced.
+
+        :param requests.PreparedRequest failed_request: The request that failed due to an invalid access token.
+        :return: True if the access token must be refreshed before the request is replayed.
+        :rtype: bool
+        """
+        authorization = failed_request.headers.get('Authorization')
+        return authorization is None or authorization == f'Bearer {self.access_token}'
+
+    def _update_access_token(self, data):
+        """
+        Stores the access token from a token refresh response body and notifies the access token updated callback.
+
+        :param dict data: Decoded body of a successful token refresh response.
+        :return: Nothing.
+        """
+        #   Update the access token property
+        self.access_token = data['tokens']['access']['token']
+        self.access_token_expires_at = datetime.datetime.utcfromtimestamp(data['tokens']['access']['expires_at'])
+        #   Call the callback
+        if self.access_token_updated_callback:
+            self.access_token_updated_callback(
+                token=self.access_token,
+                expires=self.access_token_expires_at
+            )
+
     def create_authorization_request(self, redirect_uri, code_challenge='', code_challenge_method='s256'):
         """
         Creates the data required for a client application to complete the authorization process.
@@ -0,0 +1,120 @@
+""" Request timeouts and deadlines.
+    All durations are expressed in milliseconds, matching the `timeout` argument of Sws.
+
+    A logical call (including any automatic token refresh and replay it triggers) runs under a single deadline. The
+    deadline is held in a context variable, so requests made while handling a call - like the token refresh - can
+    never outlive the call that caused them.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from requests.exceptions import Timeout as RequestsTimeout
+
+_deadline = contextvars.ContextVar('sws_deadline', default=None)
+_override = contextvars.ContextVar('sws_timeout_override', default=None)
+
+
+class DeadlineExceeded(RequestsTimeout):
+    """ Raised when the total time allowed for a call has been used up before a request could be sent """
+
+
+class Timeout(object):
+
+    def __init__(self, connect=None, read=None, total=None):
+        """ Timeouts for a request, in milliseconds. None means no limit.
+            connect : float
+                Time allowed to establish a connection to the service
+            read : float
+                Time allowed between bytes received from the service
+            total : float
+                Time allowed for the whole call, including token refresh and retries
+        """
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+    @classmethod
+    def from_value(cls, value):
+        """ Builds a Timeout from a Timeout instance, a number of milliseconds applied to every limit, or None.
+        """
+        if value is None:
+            return cls()
+        if isinstance(value, cls):
+            return value
+        return cls(connect=value, read=value, total=value)
+
+    def __repr__(self):
+        return f'Timeout(connect={self.connect}, read={self.read}, total={self.total})'
+
+
+@contextmanager
+def override(timeout):
+    """ Overrides the client timeout for every call made within the block.
+        timeout : Timeout | float
+            The timeout to use, or a number of milliseconds applied to every limit.
+    """
+    token = _override.set(Timeout.from_value(timeout))
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+
+def resolve(timeout, default):
+    """ Returns the Timeout that applies to a call: the timeout given for the call, else any active override, else the
+        client default.
+    """
+    if timeout is not None:
+        return Timeout.from_value(timeout)
+    if _override.get() is not None:
+        return _override.get()
+    return Timeout.from_value(default)
+
+
+@contextmanager
+def deadline(total):
+    """ Starts the deadline of a logical call. A deadline that is already running is never extended.
+        total : float
+            Time allowed for the call, in milliseconds. None adds no limit of its own.
+    """
+    current = _deadline.get()
+    new = current
+    if total is not None:
+        new = time.monotonic() + total / 1000
+        if current is not None:
+            new = min(new, current)
+    token = _deadline.set(new)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """ Returns the number of seconds left before the current deadline, or None if there is no deadline.
+        Raises DeadlineExceeded if the deadline has already passed.
+    """
+    current = _deadline.get()
+    if current is None:
+        return None
+    left = current - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded('SWS call exceeded its total timeout')
+    return left
+
+
+def attempt_timeouts(timeout):
+    """ Returns the (connect, read) timeouts in seconds for the next request, capped by the current deadline.
+        timeout : Timeout
+            Timeouts that apply to the call
+    """
+    left = remaining()
+    return _cap(timeout.connect, left), _cap(timeout.read, left)
+
+
+def _cap(limit, left):
+    seconds = limit / 1000 if limit is not None else None
+    if left is None:
+        return seconds
+    return left if seconds is None else min(seconds, left)
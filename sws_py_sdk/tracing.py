@@ -0,0 +1,112 @@
+""" OpenTelemetry tracing of SWS calls.
+    Every call made through `Service.fetch` gets a span named after its method and endpoint template, with a child
+    span for each HTTP request it sends (the first attempt and each retry) and for any token refresh it triggers.
+    A call answered from the response cache gets a call span alone, marked with the `sws.cache_hit` attribute.
+    Span names and attributes use endpoint templates rather than URLs, so IDs never end up in them.
+"""
+from urllib.parse import urlparse
+
+TRACER_NAME = 'sws_py_sdk'
+
+
+class Tracing(object):
+
+    def __init__(self, tracer=None, propagate=True):
+        """ Create a tracing configuration. Requires the optional `opentelemetry-api` dependency.
+            tracer : opentelemetry.trace.Tracer
+                Tracer creating the spans. Defaults to the 'sws_py_sdk' tracer of the global tracer provider.
+            propagate : bool
+                If True, the context of the span of each HTTP request is injected into its headers with the global
+                propagator (W3C `traceparent` by default), so that the spans of the services join the trace
+        """
+        from opentelemetry import propagate as propagation, trace
+
+        self.tracer = tracer if tracer is not None else trace.get_tracer(TRACER_NAME)
+        self.propagate = propagate
+        self._inject = propagation.inject
+        self._span_kind = trace.SpanKind
+        self._status = trace.Status
+        self._status_code = trace.StatusCode
+
+    def call_span(self, service_key, context):
+        """ Returns a context manager opening the span of a call
+            service_key : str
+                Key of the service called, e.g. 'license'
+            context : RequestContext
+                State of the call
+        """
+        method = context.request.method
+        return self.tracer.start_as_current_span(f'{method} {context.endpoint}',
+                                                 kind=self._span_kind.INTERNAL,
+                                                 attributes={'sws.service': service_key,
+                                                             'http.request.method': method,
+                                                             'url.template': context.endpoint,
+                                                             'sws.cache_hit': False})
+
+    def record_cache_hit(self, service_key, endpoint, response):
+        """ Records a call answered from the client response cache, as a call span without request spans whose
+            `sws.cache_hit` attribute is True
+            endpoint : str
+                Template of the endpoint called
+        """
+        with self.tracer.start_as_current_span(f'GET {endpoint}',
+                                               kind=self._span_kind.INTERNAL,
+                                               attributes={'sws.service': service_key,
+                                                           'http.request.method': 'GET',
+                                                           'url.template': endpoint,
+                                                           'sws.cache_hit': True}) as span:
+            self.record_response(span, response)
+
+    def request_span(self, service_key, context, prepared_request, attempt):
+        """ Returns a context manager opening the span of an HTTP request sent by a call, and injecting its context
+            into the headers of the request
+            attempt : int
+                1 for the first request of the call, 2 for its first retry, and so on
+        """
+        url = urlparse(prepared_request.url)
+        attributes = {'sws.service': service_key,
+                      'http.request.method': prepared_request.method,
+                      'url.template': context.endpoint,
+                      'server.address': url.hostname}
+        if url.port is not None:
+            attributes['server.port'] = url.port
+        if attempt > 1:
+            attributes['http.request.resend_count'] = attempt - 1
+        span = self.tracer.start_as_current_span(f'{prepared_request.method} {context.endpoint}',
+                                                 kind=self._span_kind.CLIENT, attributes=attributes)
+        return _InjectingSpan(span, prepared_request, self._inject if self.propagate else None)
+
+    def token_refresh_span(self):
+        """ Returns a context manager opening the span of an access token refresh """
+        return self.tracer.start_as_current_span('sws token refresh', kind=self._span_kind.INTERNAL)
+
+    def record_response(self, span, response, context=None):
+        """ Records the outcome of a call or request on its span. Responses with an error status mark the span as
+            failed.
+            context : RequestContext
+                State of the call, if `span` is the span of a call
+        """
+        span.set_attribute('http.response.status_code', response.status_code)
+        if context is not None:
+            span.set_attribute('sws.retries', context.retries)
+            span.set_attribute('sws.token_refreshed', context.token_refreshed)
+        if response.status_code >= 400:
+            span.set_status(self._status(self._status_code.ERROR))
+
+
+class _InjectingSpan(object):
+    # Opens a span, then injects its context into the headers of a request
+
+    def __init__(self, span, prepared_request, inject):
+        self._span = span
+        self._prepared_request = prepared_request
+        self._inject = inject
+
+    def __enter__(self):
+        span = self._span.__enter__()
+        if self._inject is not None:
+            self._inject(self._prepared_request.headers)
+        return span
+
+    def __exit__(self, *exc_info):
+        return self._span.__exit__(*exc_info)
@@ -0,0 +1,442 @@
+""" Preparation and transfer of Cloud Library file uploads.
+    Computes the base64 encoded MD5 hash, MIME type and size required by `Cloudlib.me_create_file_upload` and
+    `Cloudlib.user_create_file_upload`, and describes where the content of a file is sent once its upload has been
+    created. Files are always read in fixed-size chunks so that memory use does not depend on file size.
+"""
+import base64
+import hashlib
+import mimetypes
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of bytes hashed at a time
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Number of bytes read from a file at a time while its content is being sent
+TRANSFER_CHUNK_SIZE = 64 * 1024
+
+DEFAULT_MIME_TYPE = 'application/octet-stream'
+
+# Audio formats missing from the `mimetypes` database of some Python versions
+AUDIO_MIME_TYPES = {
+    '.aac': 'audio/aac',
+    '.aif': 'audio/aiff',
+    '.aiff': 'audio/aiff',
+    '.alac': 'audio/mp4',
+    '.flac': 'audio/flac',
+    '.m4a': 'audio/mp4',
+    '.ogg': 'audio/ogg',
+}
+
+
+class UploadDescriptor(object):
+    def __init__(self, path, name, md5_hash, mime_type, size):
+        """ Description of a file, ready to be submitted as a Cloud Library file upload
+            path : str
+                Path of the file
+            name : str
+                Name of the file
+            md5_hash : str
+                Base64 encoded MD5 hash of the file content
+            mime_type : str
+                MIME type of the file
+            size : int
+                Size of the file in bytes
+        """
+        self.path = path
+        self.name = name
+        self.md5_hash = md5_hash
+        self.mime_type = mime_type
+        self.size = size
+
+    def upload_params(self):
+        """ Returns the arguments for `Cloudlib.me_create_file_upload` or `Cloudlib.user_create_file_upload`, e.g.
+            `sws.cloudlib().me_create_file_upload(**descriptor.upload_params())`
+        """
+        return {'md5_hash': self.md5_hash, 'mime_type': self.mime_type, 'size': self.size, 'name': self.name}
+
+    def __repr__(self):
+        return f'UploadDescriptor(name={self.name!r}, md5_hash={self.md5_hash!r}, size={self.size})'
+
+
+def md5_file(path, chunk_size=HASH_CHUNK_SIZE, use_mmap=False):
+    """ Returns the base64 encoded MD5 hash of a file, reading it one chunk at a time.
+        path : str
+            Path of the file
+        chunk_size : int
+            Number of bytes hashed at a time
+        use_mmap : bool
+            If True, the file is memory-mapped instead of read into a buffer, avoiding a copy of each chunk
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        if use_mmap and os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, len(view), chunk_size):
+                        md5.update(view[offset:offset + chunk_size])
+                finally:
+                    view.release()
+        else:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+
+def guess_mime_type(path):
+    """ Returns the MIME type of a file based on its extension """
+    mime_type, _ = mimetypes.guess_type(path, strict=False)
+    if mime_type is None:
+        mime_type = AUDIO_MIME_TYPES.get(os.path.splitext(path)[1].lower(), DEFAULT_MIME_TYPE)
+    return mime_type
+
+
+class HashCache(object):
+
+    def __init__(self, path):
+        """ Open, or create, a persistent cache of file hashes, so that unchanged files are not hashed again.
+            A hash is reused only while the size and modification time of its file are unchanged.
+            path : str
+                Path of the SQLite database holding the cache, or ':memory:'
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                                     'mtime_ns INTEGER NOT NULL, md5_hash TEXT NOT NULL)')
+
+    def get(self, path, stat):
+        """ Returns the cached MD5 hash of a file, or None if the file is not cached or has changed
+            path : str
+                Path of the file
+            stat : os.stat_result
+                Current status of the file
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT md5_hash FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?',
+                                           (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, path, stat, md5_hash):
+        """ Caches the MD5 hash of a file, computed when the file had the given status """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO hashes (path, size, mtime_ns, md5_hash) '
+                                     'VALUES (?, ?, ?, ?)',
+                                     (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, md5_hash))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def prepare_upload(path, name=None, chunk_size=HASH_CHUNK_SIZE, use_mmap=False, hash_cache=None):
+    """ Returns the UploadDescriptor of a file
+        path : str
+            Path of the file
+        name : str
+            Name of the file. Defaults to the base name of the path.
+        chunk_size : int
+            Number of bytes hashed at a time
+        use_mmap : bool
+            If True, the file is memory-mapped while it is hashed
+        hash_cache : HashCache
+            If given, the hash of the file is read from the cache, or stored in it once computed
+    """
+    path = os.fspath(path)
+    stat = os.stat(path)
+    md5_hash = hash_cache.get(path, stat) if hash_cache is not None else None
+    if md5_hash is None:
+        md5_hash = md5_file(path, chunk_size=chunk_size, use_mmap=use_mmap)
+        if hash_cache is not None:
+            hash_cache.set(path, stat, md5_hash)
+    return UploadDescriptor(
+        path=path,
+        name=name if name is not None else os.path.basename(path),
+        md5_hash=md5_hash,
+        mime_type=guess_mime_type(path),
+        size=stat.st_size
+    )
+
+
+def prepare_uploads(paths, recursive=True, max_workers=None, chunk_size=HASH_CHUNK_SIZE, use_mmap=False,
+                    hash_cache=None):
+    """ Returns the UploadDescriptor of many files, hashing them in parallel.
+        MD5 hashing releases the GIL, so a thread pool keeps every core busy without the cost of starting processes.
+        paths : str | iterable
+            A directory, or an iterable of file and directory paths. Files are returned in the order they are found.
+        recursive : bool
+            If True, files in subdirectories are included
+        max_workers : int
+            Number of files hashed at once. Defaults to the number of CPUs.
+        chunk_size : int
+            Number of bytes hashed at a time
+        use_mmap : bool
+            If True, files are memory-mapped while they are hashed
+        hash_cache : HashCache
+            If given, files whose hash is cached are not read
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    files = list(_list_files(paths, recursive))
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(
+            lambda path: prepare_upload(path, chunk_size=chunk_size, use_mmap=use_mmap, hash_cache=hash_cache),
+            files))
+
+
+def _list_files(paths, recursive):
+    for path in paths:
+        path = os.fspath(path)
+        if not os.path.isdir(path):
+            yield path
+        elif recursive:
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(names):
+                    yield os.path.join(directory, name)
+        else:
+            for name in sorted(os.listdir(path)):
+                if os.path.isfile(os.path.join(path, name)):
+                    yield os.path.join(path, name)
+
+
+class UploadPart(object):
+    def __init__(self, url, offset, size, headers=None):
+        """ Byte range of a file sent in its own request
+            url : str
+                URL the range is sent to
+            offset : int
+                Position of the first byte of the range in the file
+            size : int
+                Number of bytes in the range
+            headers : dict
+                Headers sent with this part only, in addition to the headers of the upload target
+        """
+        self.url = url
+        self.offset = offset
+        self.size = size
+        self.headers = dict(headers or {})
+
+    def __repr__(self):
+        return f'UploadPart(url={self.url!r}, offset={self.offset}, size={self.size})'
+
+
+class UploadTarget(object):
+    def __init__(self, parts, method='PUT', headers=None):
+        """ Destination of the content of a file upload, e.g. pre-signed storage URLs
+            parts : list
+                UploadPart objects covering the file. Parts are sent in parallel.
+            method : str
+                HTTP method used to send each part
+            headers : dict
+                Headers sent with every part
+        """
+        self.parts = parts
+        self.method = method
+        self.headers = dict(headers or {})
+
+    def to_dict(self):
+        """ Returns the target as a JSON serializable dict, see `from_dict` """
+        return {
+            'method': self.method,
+            'headers': self.headers,
+            'parts': [{'url': part.url, 'offset': part.offset, 'size': part.size, 'headers': part.headers}
+                      for part in self.parts]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Builds a target from a dict returned by `to_dict` """
+        return cls(parts=[UploadPart(**part) for part in data['parts']],
+                   method=data['method'],
+                   headers=data['headers'])
+
+
+def upload_target_from_response(response, size):
+    """ Default resolver of the upload target of a file, used by the `Cloudlib` upload methods.
+        Expects the response creating the upload to include an 'upload' object:
+
+            {"upload": {"url": "...", "method": "PUT", "headers": {...}}}
+
+        or, for a multipart upload, a list of parts, each optionally giving its own byte range:
+
+            {"upload": {"method": "PUT", "parts": [{"url": "...", "offset": 0, "size": 8388608}, ...]}}
+
+        Parts without a byte range split the file evenly, in order. Returns None if the response has no upload
+        object, i.e. there is no content to send.
+        response : requests.Response
+            Successful response of `me_create_file_upload` or `user_create_file_upload`
+        size : int
+            Size of the file in bytes
+    """
+    upload = response.json().get('upload')
+    if not upload:
+        return None
+    parts = upload.get('parts') or [{'url': upload['url']}]
+    part_size = -(-size // len(parts))
+    return UploadTarget(
+        parts=[UploadPart(url=part['url'],
+                          offset=part.get('offset', index * part_size),
+                          size=part.get('size', max(0, min(part_size, size - index * part_size))),
+                          headers=part.get('headers'))
+               for index, part in enumerate(parts)],
+        method=upload.get('method', 'PUT'),
+        headers=upload.get('headers')
+    )
+
+
+class UploadResult(object):
+    def __init__(self, descriptor, response, part_responses=(), resumed=False):
+        """ Outcome of a file upload
+            descriptor : UploadDescriptor
+                The uploaded file
+            response : requests.Response
+                Response of the request creating the upload, or of the request verifying the file if the upload was
+                resumed from a journal
+            part_responses : list
+                Responses of the requests sending the content in this run, in the order of the parts. Empty if the
+                service did not ask for the content, or if the upload could not be created.
+            resumed : bool
+                True if the upload was recorded in a journal by an earlier run, and only the content that run did not
+                send was sent
+        """
+        self.descriptor = descriptor
+        self.response = response
+        self.part_responses = list(part_responses)
+        self.resumed = resumed
+
+    @property
+    def ok(self):
+        """ True if the upload was created and all of its content was accepted """
+        return self.response.ok and all(response.ok for response in self.part_responses)
+
+    def __repr__(self):
+        return f'UploadResult({self.descriptor!r}, {self.response}, parts={len(self.part_responses)})'
+
+
+class UploadProgress(object):
+    def __init__(self, descriptor, callback=None):
+        """ Thread-safe count of the bytes of a file sent so far
+            descriptor : UploadDescriptor
+                The file being uploaded
+            callback : function
+                Called as `callback(descriptor, bytes_sent, total_bytes)` after each chunk is sent, from the thread
+                sending it. The count goes back down when a part is retried.
+        """
+        self.descriptor = descriptor
+        self.callback = callback
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def advance(self, size):
+        with self._lock:
+            self.sent += size
+            sent = self.sent
+        if self.callback is not None:
+            self.callback(self.descriptor, sent, self.descriptor.size)
+
+
+class FilePart(object):
+    def __init__(self, path, offset, size, progress=None, chunk_size=TRANSFER_CHUNK_SIZE):
+        """ Read-only view of a byte range of a file, usable as a streamed request body. Reports to `progress` as the
+            range is read.
+        """
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.sent = 0
+        self._file = None
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        left = self.size - self.sent
+        size = left if size is None or size < 0 else min(size, left)
+        if size == 0:
+            return b''
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+            self._file.seek(self.offset + self.sent)
+        chunk = self._file.read(size)
+        self.sent += len(chunk)
+        if len(chunk) < size or self.sent == self.size:
+            self.close()
+        if chunk and self.progress is not None:
+            self.progress.advance(len(chunk))
+        return chunk
+
+    def chunks(self):
+        """ Yields the content of the range one chunk at a time """
+        for chunk in iter(lambda: self.read(self.chunk_size), b''):
+            yield chunk
+
+    def rewind(self):
+        """ Resets the view to the start of the range, taking back the progress reported so far """
+        self.close()
+        if self.sent and self.progress is not None:
+            self.progress.advance(-self.sent)
+        self.sent = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SyncPlan(object):
+
+    def __init__(self, files, max_workers=None, hash_cache=None):
+        """ Plan of a bulk upload of the files of many users, with each distinct path hashed once and each distinct
+            content uploaded once per user.
+            files : dict
+                Maps user IDs, or None for the authenticated user, to a directory or an iterable of file and
+                directory paths
+            max_workers : int
+                Number of files hashed at once. Defaults to the number of CPUs.
+            hash_cache : HashCache
+                If given, files whose hash is cached are not read
+        """
+        owned_paths = []
+        for user_id, paths in files.items():
+            if isinstance(paths, (str, os.PathLike)):
+                paths = [paths]
+            owned_paths.extend((user_id, path) for path in _list_files(paths, recursive=True))
+        distinct_paths = list(dict.fromkeys(path for _, path in owned_paths))
+        descriptors = dict(zip(distinct_paths, prepare_uploads(distinct_paths, max_workers=max_workers,
+                                                               hash_cache=hash_cache)))
+        # (user ID, MD5 hash, size) of each upload -> descriptor of its first file, and paths of all of its files
+        self.uploads = {}
+        self.paths = {}
+        for user_id, path in owned_paths:
+            descriptor = descriptors[path]
+            key = (user_id, descriptor.md5_hash, descriptor.size)
+            self.uploads.setdefault(key, descriptor)
+            self.paths.setdefault(key, []).append(path)
+
+    def schedule(self):
+        """ Returns the keys of one upload of each distinct content, and a dict mapping each of them to the keys of
+            the uploads of the same content for other users. Those are only created once the first upload of their
+            content has completed, so that the content is known to the service and not sent again.
+        """
+        first, followers = {}, {}
+        for key in self.uploads:
+            content = key[1:]
+            if content in first:
+                followers.setdefault(first[content], []).append(key)
+            else:
+                first[content] = key
+        return list(first.values()), followers
@@ -0,0 +1,213 @@
+""" Local checkpoint journal of Cloud Library file uploads.
+    Records the uploads created and the parts of their content sent, so that an interrupted upload of a large library
+    resumes where it stopped instead of starting again from the first file.
+"""
+import json
+import sqlite3
+import threading
+
+from sws_py_sdk.upload import UploadTarget
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS uploads (
+        owner TEXT NOT NULL,
+        md5_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        target TEXT,
+        complete INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (owner, md5_hash, size)
+    );
+    CREATE TABLE IF NOT EXISTS upload_parts (
+        owner TEXT NOT NULL,
+        md5_hash TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        part INTEGER NOT NULL,
+        PRIMARY KEY (owner, md5_hash, size, part)
+    );
+"""
+
+
+class JournalEntry(object):
+    def __init__(self, file_id, target=None, completed_parts=(), complete=False):
+        """ State of a file upload recorded in the journal
+            file_id : str
+                ID of the file created by the upload
+            target : UploadTarget
+                Destination of the content of the file, if any
+            completed_parts : iterable
+                Indexes of the parts of the target that were sent successfully
+            complete : bool
+                True if all of the content was sent
+        """
+        self.file_id = file_id
+        self.target = target
+        self.completed_parts = set(completed_parts)
+        self.complete = complete
+
+
+class UploadJournal(object):
+
+    def __init__(self, path):
+        """ Open, or create, a journal. Entries are keyed by the owner and the MD5 hash and size of the content, so
+            a file that is moved or renamed is still recognised.
+            The journal can be shared by the threads of a batch upload, but not by several processes.
+            path : str
+                Path of the SQLite database holding the journal, or ':memory:'
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def get(self, owner, descriptor):
+        """ Returns the JournalEntry of a file, or None if no upload of it is recorded
+            owner : str
+                'me', or the ID of the user the file is uploaded for
+            descriptor : UploadDescriptor
+                The file
+        """
+        key = (owner, descriptor.md5_hash, descriptor.size)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT file_id, target, complete FROM uploads WHERE owner = ? AND md5_hash = ? AND size = ?',
+                key).fetchone()
+            if row is None:
+                return None
+            parts = self._connection.execute(
+                'SELECT part FROM upload_parts WHERE owner = ? AND md5_hash = ? AND size = ?', key).fetchall()
+        file_id, target, complete = row
+        return JournalEntry(file_id=file_id,
+                            target=UploadTarget.from_dict(json.loads(target)) if target else None,
+                            completed_parts=(part for part, in parts),
+                            complete=bool(complete))
+
+    def start(self, owner, descriptor, file_id, target):
+        """ Records the creation of an upload whose content is about to be sent """
+        self._write(
+            'INSERT OR REPLACE INTO uploads (owner, md5_hash, size, file_id, target, complete) '
+            'VALUES (?, ?, ?, ?, ?, 0)',
+            (owner, descriptor.md5_hash, descriptor.size, file_id, json.dumps(target.to_dict())),
+            clear_parts=True)
+        return JournalEntry(file_id=file_id, target=target)
+
+    def record_part(self, owner, descriptor, part):
+        """ Records that a part of the content of an upload was sent
+            part : int
+                Index of the part in the upload target
+        """
+        self._write('INSERT OR IGNORE INTO upload_parts (owner, md5_hash, size, part) VALUES (?, ?, ?, ?)',
+                    (owner, descriptor.md5_hash, descriptor.size, part))
+
+    def complete(self, owner, descriptor, file_id):
+        """ Records that all of the content of an upload was sent """
+        self._write(
+            'INSERT OR REPLACE INTO uploads (owner, md5_hash, size, file_id, target, complete) '
+            'VALUES (?, ?, ?, ?, NULL, 1)',
+            (owner, descriptor.md5_hash, descriptor.size, file_id),
+            clear_parts=True)
+
+    def forget(self, owner, descriptor):
+        """ Removes the entry of a file, so that it is uploaded again from the start """
+        self._write('DELETE FROM uploads WHERE owner = ? AND md5_hash = ? AND size = ?',
+                    (owner, descriptor.md5_hash, descriptor.size),
+                    clear_parts=True)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self, statement, parameters, clear_parts=False):
+        # Each change is committed immediately, so that it survives the process being killed
+        with self._lock, self._connection:
+            if clear_parts:
+                self._connection.execute('DELETE FROM upload_parts WHERE owner = ? AND md5_hash = ? AND size = ?',
+                                         parameters[:3])
+            self._connection.execute(statement, parameters)
+
+
+class UploadCheckpoint(object):
+
+    def __init__(self, journal, user_id, descriptor):
+        """ Journal operations for the upload of one file. Every operation does nothing if there is no journal.
+            journal : UploadJournal
+                The journal, or None
+            user_id : int
+                ID of the user the file is uploaded for, or None for the authenticated user
+            descriptor : UploadDescriptor
+                The file
+        """
+        self.journal = journal
+        self.owner = 'me' if user_id is None else str(user_id)
+        self.descriptor = descriptor
+        self.resumed = False
+
+    def entry(self):
+        """ Returns the JournalEntry of an earlier upload of the file, or None """
+        if self.journal is None:
+            return None
+        entry = self.journal.get(self.owner, self.descriptor)
+        self.resumed = entry is not None
+        return entry
+
+    def is_gone(self, response):
+        """ Checks the response fetching the file of an earlier upload. If the file no longer exists, the entry is
+            forgotten and True is returned so that the file is uploaded again.
+        """
+        if response.status_code not in (404, 410):
+            return False
+        self.journal.forget(self.owner, self.descriptor)
+        self.resumed = False
+        return True
+
+    def start(self, response, target):
+        """ Records a newly created upload. Returns its JournalEntry.
+            response : requests.Response
+                Response of the request creating the upload. The ID of the file is read from its 'id'. Uploads
+                without an ID cannot be verified later, so they are not recorded.
+            target : UploadTarget
+                Destination of the content of the file, or None if no content needs to be sent
+        """
+        file_id = response.json().get('id') if self.journal is not None and response.ok else None
+        if file_id is None:
+            return JournalEntry(file_id=None, target=target)
+        file_id = str(file_id)
+        if target is None:
+            self.journal.complete(self.owner, self.descriptor, file_id)
+            return JournalEntry(file_id=file_id, complete=True)
+        return self.journal.start(self.owner, self.descriptor, file_id, target)
+
+    def pending_parts(self, entry, progress):
+        """ Returns the (index, UploadPart) pairs of the parts still to be sent. Parts already sent are reported to
+            `progress` as sent.
+        """
+        pending = []
+        for index, part in enumerate(entry.target.parts):
+            if index in entry.completed_parts:
+                progress.advance(part.size)
+            else:
+                pending.append((index, part))
+        return pending
+
+    def record_part(self, entry, index, response):
+        """ Records the outcome of sending a part. A part rejected with a client error, e.g. because its URL has
+            expired, makes the entry forgotten so that the next run starts a new upload.
+        """
+        if self.journal is None or entry.file_id is None:
+            return
+        if response.ok:
+            self.journal.record_part(self.owner, self.descriptor, index)
+        elif 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            self.journal.forget(self.owner, self.descriptor)
+
+    def finish(self, entry, part_responses):
+        """ Records the upload as complete if every part was sent """
+        if self.journal is not None and entry.file_id is not None and all(r.ok for r in part_responses):
+            self.journal.complete(self.owner, self.descriptor, entry.file_id)
@@ -0,0 +1,447 @@
+""" AsyncSwsClient tests. These run the client against a local aiohttp server.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from functools import partial
+
+import pytest
+from requests.exceptions import HTTPError, Timeout as RequestsTimeout
+
+from sws_py_sdk.async_sws_client import AsyncSwsClient
+from sws_py_sdk.cache import TTLCache
+from sws_py_sdk.circuit_breaker import CircuitBreaker, CircuitOpenError
+from sws_py_sdk.coalesce import RequestCoalescer
+from sws_py_sdk.hedging import HedgingPolicy
+from sws_py_sdk.rate_limit import TokenBucket
+from sws_py_sdk.retry import RetryPolicy
+from sws_py_sdk.timeouts import Timeout
+
+web = pytest.importorskip('aiohttp.web')
+
+APP_ID = 'myClientAppId'
+NEW_ACCESS_TOKEN = 'NgCXRKdjsLksdKKJjslPQmxMzYjw'
+
+MOCK_TOKEN_REFRESH_RESPONSE_BODY = {
+    "tokens": {
+        "access": {"token": NEW_ACCESS_TOKEN, "expires_at": 1489142529, "type": "Bearer"},
+        "refresh": {"token": "NgAagAAYqJQjdkEkjkjSkkseKSKaweplOeklUm_SHo", "expires_at": 1489174529}
+    }
+}
+
+
+def run_with_server(routes, test):
+    """ Starts an aiohttp server with the given routes, then runs `test(base_url)` against it """
+    async def main():
+        app = web.Application()
+        app.add_routes(routes)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            return await test(f'http://127.0.0.1:{port}')
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_endpoint_methods_return_awaitables():
+    async def get_licenses(request):
+        assert request.headers['Authorization'] == 'Bearer my.token'
+        assert request.query['app_name'] == 'serato_dj'
+        return web.json_response({'items': [{'id': 'SDJ-1'}]})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}) as client:
+            client.access_token = 'my.token'
+            response = await client.license().get_licenses(app_name='serato_dj')
+            assert response.status_code == 200
+            assert response.json() == {'items': [{'id': 'SDJ-1'}]}
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+
+
+def test_concurrent_requests_share_the_pool():
+    async def get_product(request):
+        return web.json_response({'id': request.match_info['product_id']})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}) as client:
+            responses = await asyncio.gather(*[client.license().get_product_info(i) for i in range(20)])
+            assert [r.json()['id'] for r in responses] == [str(i) for i in range(20)]
+
+    run_with_server([web.get('/api/v1/products/products/{product_id}', get_product)], test)
+
+
+def test_invalid_access_token_will_refresh_and_retry():
+    async def get_licenses(request):
+        if request.headers['Authorization'] != f'Bearer {NEW_ACCESS_TOKEN}':
+            return web.json_response({'code': 2002, 'errorText': 'Expired Access token'}, status=401)
+        return web.json_response({'items': []})
+
+    async def token_refresh(request):
+        return web.json_response(MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+
+    updates = []
+
+    async def test(base_url):
+        service_uri = {'id': base_url, 'license': base_url}
+        async with AsyncSwsClient(app_id=APP_ID, service_uri=service_uri, user_id=1000) as client:
+            client.access_token = 'expired.token'
+            client.set_access_token_updated_callback(lambda token, expires: updates.append(token))
+            response = await client.license().get_licenses()
+            assert response.status_code == 200
+            assert client.access_token == NEW_ACCESS_TOKEN
+
+    run_with_server([web.get('/api/v1/users/1000/licenses', get_licenses),
+                     web.post('/api/v1/tokens/refresh', token_refresh)], test)
+    assert updates == [NEW_ACCESS_TOKEN]
+
+
+def test_read_timeout_is_enforced():
+    async def slow_licenses(request):
+        await asyncio.sleep(0.5)
+        return web.json_response({'items': []})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  timeout=Timeout(read=50)) as client:
+            with pytest.raises(RequestsTimeout):
+                await client.license().get_licenses()
+
+    run_with_server([web.get('/api/v1/me/licenses', slow_licenses)], test)
+
+
+def test_concurrent_invalid_access_tokens_refresh_once():
+    refresh_calls = []
+
+    async def get_licenses(request):
+        if request.headers['Authorization'] != f'Bearer {NEW_ACCESS_TOKEN}':
+            return web.json_response({'code': 2002, 'errorText': 'Expired Access token'}, status=401)
+        return web.json_response({'items': []})
+
+    async def token_refresh(request):
+        refresh_calls.append(request)
+        await asyncio.sleep(0.05)
+        return web.json_response(MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+
+    async def test(base_url):
+        service_uri = {'id': base_url, 'license': base_url}
+        async with AsyncSwsClient(app_id=APP_ID, service_uri=service_uri) as client:
+            client.access_token = 'expired.token'
+            responses = await asyncio.gather(*[client.license().get_licenses() for i in range(10)])
+            assert [response.status_code for response in responses] == [200] * 10
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses),
+                     web.post('/api/v1/tokens/refresh', token_refresh)], test)
+    assert len(refresh_calls) == 1
+
+
+def test_token_refresh_scheduler_refreshes_before_expiry():
+    refresh_calls = []
+
+    async def token_refresh(request):
+        refresh_calls.append(request)
+        return web.json_response(MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'id': base_url}) as client:
+            client.access_token_expires_at = datetime.utcnow() + timedelta(seconds=60.05)
+            client.start_token_refresh_scheduler(refresh_margin=60, jitter=0, poll_interval=0.2)
+            for i in range(100):
+                if refresh_calls:
+                    break
+                await asyncio.sleep(0.01)
+            assert client.access_token == NEW_ACCESS_TOKEN
+
+    run_with_server([web.post('/api/v1/tokens/refresh', token_refresh)], test)
+    assert len(refresh_calls) == 1
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    async def get_licenses(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return web.json_response({}, status=503)
+        return web.json_response({'items': []})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  retry_policy=RetryPolicy(backoff_factor=0)) as client:
+            response = await client.license().get_licenses()
+            assert response.status_code == 200
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+    assert len(calls) == 2
+
+
+def test_open_circuit_takes_no_rate_limit_token():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    bucket = TokenBucket(rate=0.001, capacity=1)
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}, circuit_breaker=breaker,
+                                  rate_limits={'license': bucket}) as client:
+            breaker.record_failure(('license', '/api/v1/products/products/{id}'))
+            with pytest.raises(CircuitOpenError):
+                await client.license().get_product_info(1)
+        assert bucket.reserve(max_wait=0) == 0
+
+    run_with_server([], test)
+
+def test_cancelled_half_open_trial_admits_the_next_call():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.2)
+    requests = []
+
+    async def get_licenses(request):
+        requests.append(request)
+        if len(requests) == 1:
+            await asyncio.sleep(1)
+        return web.json_response({'items': []})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}, circuit_breaker=breaker) as client:
+            client.access_token = 'my.token'
+            breaker.record_failure(('license', '/api/v1/me/licenses'))
+            await asyncio.sleep(0.25)
+            trial = asyncio.ensure_future(client.license().get_licenses())
+            while not requests:
+                await asyncio.sleep(0.01)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            response = await client.license().get_licenses()
+            assert response.status_code == 200
+        assert breaker.state(('license', '/api/v1/me/licenses')) == 'closed'
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+
+def test_product_changes_invalidate_cached_product_info_once_sent():
+    product = {'valid_to': '2023-01-01'}
+
+    async def get_product(request):
+        return web.json_response(dict(product))
+
+    async def update_product(request):
+        valid_to = (await request.post())['valid_to']
+        await asyncio.sleep(0.1)
+        product['valid_to'] = valid_to
+        return web.json_response({})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  response_cache=TTLCache(ttl=60)) as client:
+            client.access_token = 'my.token'
+            update = asyncio.ensure_future(client.license().admin_update_product('P-1', valid_to='2024-01-01'))
+            await asyncio.sleep(0.05)
+            # Read, and cache, the product while the change is in progress
+            assert (await client.license().get_product_info('P-1')).json() == {'valid_to': '2023-01-01'}
+            await update
+            assert (await client.license().get_product_info('P-1')).json() == {'valid_to': '2024-01-01'}
+
+    run_with_server([web.get('/api/v1/products/products/{product_id}', get_product),
+                     web.put('/api/v1/products/products/{product_id}', update_product)], test)
+
+def test_responses_written_to_a_sink_are_not_cached():
+    async def get_product_types(request):
+        return web.json_response({'items': [1]})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  response_cache=TTLCache(ttl=60)) as client:
+            chunks = []
+            await client.license().fetch(auth='bearer', endpoint='/api/v1/products/types', sink=chunks.append,
+                                         cache='public')
+            assert b''.join(chunks) == b'{"items": [1]}'
+            response = await client.license().get_product_types()
+            assert response.json() == {'items': [1]}
+
+    run_with_server([web.get('/api/v1/products/types', get_product_types)], test)
+
+def test_batch():
+    async def get_product(request):
+        if request.match_info['product_id'] == '3':
+            return web.json_response({}, status=404)
+        return web.json_response({'id': request.match_info['product_id']})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}) as client:
+            calls = {i: partial(client.license().get_product_info, i) for i in range(10)}
+            return {result.key: result async for result in client.batch(calls, max_concurrency=4)}
+
+    results = run_with_server([web.get('/api/v1/products/products/{product_id}', get_product)], test)
+    assert sorted(results) == list(range(10))
+    assert not results[3].ok
+    assert results[3].response.status_code == 404
+    assert results[5].response.json() == {'id': '5'}
+
+
+def test_download_invoice(tmp_path):
+    content = b'%PDF-1.4 ' + b'x' * 500000
+
+    async def get_invoice(request):
+        if request.match_info['invoice_id'] == '404':
+            return web.json_response({'code': 404}, status=404)
+        return web.Response(body=content, content_type='application/pdf')
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'ecom': base_url}) as client:
+            response = await client.ecom().download_invoice(1, 2, tmp_path / 'invoice.pdf')
+            assert response.status_code == 200
+            response = await client.ecom().download_invoice(1, 404, tmp_path / 'missing.pdf')
+            assert response.json() == {'code': 404}
+            results = [result async for result in client.ecom().download_invoices([(1, 3), (2, 4)], tmp_path)]
+            assert all(result.ok for result in results)
+
+    run_with_server([web.get('/api/v1/me/orders/{order_id}/invoices/{invoice_id}', get_invoice)], test)
+    assert (tmp_path / 'invoice.pdf').read_bytes() == content
+    assert not (tmp_path / 'missing.pdf').exists()
+    assert (tmp_path / '2-4.pdf').read_bytes() == content
+
+
+def test_stream_invoice():
+    content = b'%PDF-1.4 ' + b'x' * 500000
+
+    async def get_invoice(request):
+        if request.match_info['invoice_id'] == '404':
+            return web.json_response({'code': 404}, status=404)
+        return web.Response(body=content, content_type='application/pdf')
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'ecom': base_url}) as client:
+            chunks = [chunk async for chunk in client.ecom().stream_invoice(1, 2)]
+            assert len(chunks) > 1
+            assert b''.join(chunks) == content
+            with pytest.raises(HTTPError):
+                async for _ in client.ecom().stream_invoice(1, 404):
+                    pass
+            # Stopping early cancels the download
+            async for chunk in client.ecom().stream_invoice(1, 2):
+                break
+            assert chunk == content[:len(chunk)]
+
+    run_with_server([web.get('/api/v1/me/orders/{order_id}/invoices/{invoice_id}', get_invoice)], test)
+
+
+def test_upload_file_streams_parts(tmp_path):
+    content = bytes(range(256)) * 1000
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(content)
+    received = {}
+
+    async def create_file(request):
+        base_url = f'{request.scheme}://{request.host}'
+        parts = [{'url': f'{base_url}/storage/{index}'} for index in range(3)]
+        return web.json_response({'id': 'file-1', 'upload': {'parts': parts}}, status=201)
+
+    async def put_part(request):
+        assert request.headers['Content-Type'] == 'audio/mpeg'
+        received[request.match_info['index']] = await request.read()
+        assert request.content_length == len(received[request.match_info['index']])
+        return web.Response()
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'cloudlib': base_url}) as client:
+            result = await client.cloudlib().me_upload_file(path, max_workers=2)
+            assert result.ok
+            assert len(result.part_responses) == 3
+
+    run_with_server([web.post('/api/v1/me/files', create_file), web.put('/storage/{index}', put_part)], test)
+    assert b''.join(received[str(index)] for index in range(3)) == content
+
+
+def test_identical_requests_are_coalesced():
+    calls = []
+
+    async def get_licenses(request):
+        calls.append(request)
+        await asyncio.sleep(0.1)
+        return web.json_response({'items': []})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  request_coalescer=RequestCoalescer()) as client:
+            responses = await asyncio.gather(*[client.license().get_licenses() for _ in range(10)])
+            assert all(response is responses[0] for response in responses)
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+    assert len(calls) == 1
+
+
+def test_slow_request_is_hedged():
+    calls = []
+
+    async def get_licenses(request):
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(0.5)
+        return web.json_response({'items': [len(calls)]})
+
+    async def test(base_url):
+        policy = HedgingPolicy(delay=0.05)
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url}, hedging_policy=policy) as client:
+            response = await asyncio.wait_for(client.license().get_licenses(), 0.4)
+            assert response.json() == {'items': [2]}
+            assert policy.stats()['hedge_wins'] == 1
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+    assert len(calls) == 2
+
+
+def test_metrics_events_include_connection_timings():
+    async def get_licenses(request):
+        return web.json_response({'items': []})
+
+    async def test(base_url):
+        events = []
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  metrics_hook=events.append) as client:
+            await client.license().get_licenses()
+            await client.license().get_licenses()
+        first, second = events
+        assert (first.service, first.endpoint, first.status) == ('license', '/api/v1/me/licenses', 200)
+        assert first.connect is not None and first.connect >= 0
+        assert 0 < first.ttfb <= first.duration
+        assert first.response_bytes == len(b'{"items": []}')
+        # The second call reuses the pooled connection
+        assert second.connect is None
+
+    run_with_server([web.get('/api/v1/me/licenses', get_licenses)], test)
+
+
+def test_concurrent_calls_have_separate_traces():
+    sdk_trace = pytest.importorskip('opentelemetry.sdk.trace')
+    in_memory = pytest.importorskip('opentelemetry.sdk.trace.export.in_memory_span_exporter')
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from sws_py_sdk.tracing import Tracing
+
+    exporter = in_memory.InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    traceparents = []
+
+    async def get_product(request):
+        traceparents.append(request.headers['traceparent'])
+        await asyncio.sleep(0.01)
+        return web.json_response({'id': request.match_info['product_id']})
+
+    async def test(base_url):
+        async with AsyncSwsClient(app_id=APP_ID, service_uri={'license': base_url},
+                                  tracing=Tracing(tracer=provider.get_tracer('test'))) as client:
+            await asyncio.gather(*[client.license().get_product_info(i) for i in range(5)])
+
+    run_with_server([web.get('/api/v1/products/products/{product_id}', get_product)], test)
+    spans = exporter.get_finished_spans()
+    call_spans = {span.context.span_id: span for span in spans if span.parent is None}
+    request_spans = [span for span in spans if span.parent is not None]
+    assert len(call_spans) == len(request_spans) == 5
+    assert len({span.context.trace_id for span in call_spans.values()}) == 5
+    assert all(span.parent.span_id in call_spans for span in request_spans)
+    assert {span.name for span in spans} == {'GET /api/v1/products/products/{id}'}
+    # Each request carries the context of its own span
+    assert {traceparent[:-3] for traceparent in traceparents} == {
+        f'00-{span.context.trace_id:032x}-{span.context.span_id:016x}' for span in request_spans}
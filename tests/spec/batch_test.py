@@ -0,0 +1,80 @@
+import re
+import threading
+import time
+from functools import partial
+
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.batch import BatchQueue, run_batch
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.timeouts import Timeout
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+
+
+def test_batch_returns_every_result_with_errors_captured(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+
+    def get_product(request, context):
+        product_id = request.path.split('/')[-1]
+        if product_id == '13':
+            raise ConnectionError('Connection reset')
+        return {'id': product_id}
+
+    requests_mock.register_uri('GET', re.compile(SERVICE_URI['license'] + '/api/v1/products/products/'),
+                               json=get_product)
+    calls = {product_id: partial(sws.license().get_product_info, product_id) for product_id in range(20)}
+    results = {result.key: result for result in sws.batch(calls, max_workers=4)}
+
+    assert sorted(results) == list(range(20))
+    assert not results[13].ok
+    assert isinstance(results[13].exception, ConnectionError)
+    assert all(results[i].response.json() == {'id': str(i)} for i in range(20) if i != 13)
+
+
+def test_batch_bounds_concurrency():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.pop()
+
+    results = list(run_batch(((i, call) for i in range(20)), max_workers=3))
+    assert len(results) == 20
+    assert max(peak) == 3
+
+
+def test_batch_calls_inherit_timeout_override(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + '/api/v1/me/licenses', json={'items': []})
+    with sws.with_timeout(Timeout(connect=100, read=200)):
+        results = list(sws.batch({'licenses': sws.license().get_licenses}))
+    assert results[0].ok
+    assert requests_mock.last_request.timeout == (0.1, 0.2)
+
+
+def test_batch_runs_calls_added_while_others_are_in_progress():
+    follower_done = threading.Event()
+
+    def slow():
+        # Only completes once the call queued after the fast one has run
+        assert follower_done.wait(5)
+
+    calls = BatchQueue([('slow', slow), ('fast', lambda: None)])
+    keys = []
+    for result in run_batch(calls, max_workers=3):
+        assert result.exception is None
+        keys.append(result.key)
+        if result.key == 'fast':
+            calls.extend([('follower', follower_done.set)])
+    assert sorted(keys) == ['fast', 'follower', 'slow']
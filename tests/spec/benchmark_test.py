@@ -0,0 +1,49 @@
+""" Smoke tests of the benchmark harness and mock server, so that they keep working as the clients change.
+"""
+import pytest
+
+from benchmarks.harness import compare, run_benchmark
+from benchmarks.mock_server import MockSwsServer
+
+
+@pytest.fixture
+def server():
+    with MockSwsServer(seed=1) as server:
+        yield server
+
+
+@pytest.mark.parametrize('mode', ['sync', 'threaded', 'async'])
+def test_run_benchmark_measures_every_call(server, mode):
+    if mode == 'async':
+        pytest.importorskip('aiohttp')
+    result = run_benchmark(server, mode=mode, requests=20, concurrency=4, warmup=2)
+    assert len(result.latencies) == 20
+    assert result.errors == 0
+    assert result.server_stats['requests'] == 20
+    assert 0 < result.percentile(50) <= result.percentile(99)
+    assert result.throughput > 0
+
+
+def test_expired_tokens_are_refreshed(server):
+    server.token_ttl = 0.05
+    server.latency = 0.005
+    result = run_benchmark(server, mode='sync', scenario='licenses', requests=40, warmup=0)
+    assert result.errors == 0
+    assert result.server_stats['token_refreshes'] > 0
+    assert result.server_stats['expired_tokens'] == result.server_stats['token_refreshes']
+
+
+def test_server_errors_are_counted(server):
+    server.error_rate = 0.5
+    result = run_benchmark(server, mode='sync', requests=40, warmup=0)
+    assert result.errors == server.stats['errors'] > 0
+
+
+def test_compare_reports_regressions(server):
+    result = run_benchmark(server, mode='sync', requests=10, warmup=0)
+    baseline = result.to_dict()
+    assert compare([result], [baseline]) == []
+    baseline.update(throughput=result.throughput * 2, p99=result.percentile(99) / 2)
+    regressions = compare([result], [baseline])
+    assert len(regressions) == 2
+    assert regressions[0].startswith('sync/mixed: throughput fell')
@@ -0,0 +1,109 @@
+import fnmatch
+import time
+
+import pytest
+
+from sws_py_sdk.cache import RedisCache, SQLiteCache, TTLCache
+
+
+class LocalRedis(object):
+    """ Local stand-in for a Redis server, implementing the commands used by RedisCache """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name):
+        value, expires_at = self.values.get(name, (None, 0))
+        return value if expires_at > time.monotonic() else None
+
+    def set(self, name, value, px):
+        self.values[name] = (value, time.monotonic() + px / 1000)
+
+    def delete(self, *names):
+        for name in names:
+            self.values.pop(name, None)
+
+    def scan_iter(self, match):
+        return [name for name in list(self.values) if fnmatch.fnmatch(name, match)]
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'redis'])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return TTLCache(**kwargs)
+        if request.param == 'sqlite':
+            return SQLiteCache(str(tmp_path / 'cache.db'), **kwargs)
+        return RedisCache(server, **kwargs)
+    server = LocalRedis()
+    return make
+
+
+def test_values_expire_after_ttl(make_cache):
+    cache = make_cache(ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=10)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert 'b' in cache
+
+
+def test_least_recently_used_value_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert len(cache) == 2
+
+
+def test_invalidate(make_cache):
+    cache = make_cache()
+    cache.set(('license', 'a'), 1)
+    cache.set(('license', 'b'), 2)
+    cache.set(('ecom', 'c'), 3)
+    cache.invalidate(('license', 'a'))
+    assert cache.get(('license', 'a'), 'missing') == 'missing'
+    cache.invalidate_matching(lambda key: key[0] == 'license')
+    assert ('license', 'b') not in cache
+    assert cache.get(('ecom', 'c')) == 3
+    cache.clear()
+    assert ('ecom', 'c') not in cache
+
+
+def test_sqlite_cache_is_shared_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer = SQLiteCache(path, maxsize=2)
+    reader = SQLiteCache(path, maxsize=2)
+    reader.touch_interval = 0
+    writer.set(('a',), {'items': [1]})
+    writer.set(('b',), 2)
+    assert reader.get(('a',)) == {'items': [1]}
+    reader.set(('c',), 3)
+    assert ('a',) in writer
+    assert ('b',) not in writer
+
+
+def test_sqlite_cache_reads_do_not_write(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=0.05)
+    cache.set(('a',), 1)
+    changes = cache._connection.total_changes
+    for _ in range(10):
+        assert cache.get(('a',)) == 1
+    time.sleep(0.06)
+    assert cache.get(('a',)) is None
+    assert cache._connection.total_changes == changes
+    cache.set(('b',), 2)
+    assert cache._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0] == 1
+
+
+def test_shared_caches_store_json(make_cache):
+    cache = make_cache()
+    value = {'content': b'\x00body', 'headers': {'ETag': '"1"'}, 'items': [1, 2]}
+    cache.set(('license', '/api/v1/products/types', (('app_name', 'dj'),)), value)
+    assert cache.get(('license', '/api/v1/products/types', (('app_name', 'dj'),))) == value
+    cache.invalidate_matching(lambda key: key == ('license', '/api/v1/products/types', (('app_name', 'dj'),)))
+    assert cache.get(('license', '/api/v1/products/types', (('app_name', 'dj'),))) is None
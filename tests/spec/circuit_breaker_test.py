@@ -0,0 +1,142 @@
+import time
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.circuit_breaker import CircuitBreaker, CircuitOpenError
+from sws_py_sdk.rate_limit import TokenBucket
+from sws_py_sdk.service import endpoint_template
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.timeouts import DeadlineExceeded, Timeout
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+PRODUCT_URL = SERVICE_URI['license'] + '/api/v1/products/products/'
+PRODUCT_KEY = ('license', '/api/v1/products/products/{id}')
+
+
+def test_endpoint_template():
+    assert endpoint_template('/api/v1/users/1000/licenses') == '/api/v1/users/{id}/licenses'
+    assert endpoint_template('/api/v1/me/licenses') == '/api/v1/me/licenses'
+    assert endpoint_template('http://192.168.4.6/api/v1/me/licenses/authorizations/12') == \
+        '/api/v1/me/licenses/authorizations/{id}'
+    assert endpoint_template('/api/v1/products/products/SDJ-1047936-0034') == '/api/v1/products/products/{id}'
+
+
+def test_circuit_opens_after_consecutive_failures(requests_mock):
+    changes = []
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60,
+                             state_change_callback=lambda key, old, new: changes.append((key, old, new)))
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, circuit_breaker=breaker)
+    requests_mock.register_uri('GET', PRODUCT_URL + '1', status_code=503, json={})
+
+    assert sws.license().get_product_info(1).status_code == 503
+    assert breaker.state(PRODUCT_KEY) == 'closed'
+    assert sws.license().get_product_info(1).status_code == 503
+    assert breaker.state(PRODUCT_KEY) == 'open'
+    assert changes == [(PRODUCT_KEY, 'closed', 'open')]
+
+    # Every product ID shares the circuit of the endpoint template
+    with pytest.raises(CircuitOpenError):
+        sws.license().get_product_info(2)
+    assert requests_mock.call_count == 2
+
+    # Other endpoints are unaffected
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + '/api/v1/me/licenses', json={'items': []})
+    assert sws.license().get_licenses().status_code == 200
+
+
+def test_success_resets_the_failure_count(requests_mock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, circuit_breaker=breaker)
+    requests_mock.register_uri('GET', PRODUCT_URL + '1', [{'exc': ConnectionError},
+                                                          {'status_code': 200, 'json': {}},
+                                                          {'exc': ConnectionError}])
+    for i in range(3):
+        try:
+            sws.license().get_product_info(1)
+        except ConnectionError:
+            pass
+    assert breaker.state(PRODUCT_KEY) == 'closed'
+
+
+def test_half_open_circuit_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    breaker.before_request(PRODUCT_KEY)
+    breaker.record_failure(PRODUCT_KEY)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(PRODUCT_KEY)
+
+    time.sleep(0.02)
+    breaker.before_request(PRODUCT_KEY)
+    assert breaker.state(PRODUCT_KEY) == 'half_open'
+    # Only one trial request at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(PRODUCT_KEY)
+    breaker.record_success(PRODUCT_KEY)
+    assert breaker.state(PRODUCT_KEY) == 'closed'
+
+
+def test_half_open_circuit_reopens_after_a_failed_trial():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure(PRODUCT_KEY)
+    time.sleep(0.02)
+    breaker.before_request(PRODUCT_KEY)
+    breaker.record_failure(PRODUCT_KEY)
+    assert breaker.state(PRODUCT_KEY) == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(PRODUCT_KEY)
+
+
+def test_stale_half_open_trial_expires():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure(PRODUCT_KEY)
+    time.sleep(0.02)
+    breaker.before_request(PRODUCT_KEY)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request(PRODUCT_KEY)
+    # The outcome of the trial is never recorded
+    time.sleep(0.02)
+    breaker.before_request(PRODUCT_KEY)
+    assert breaker.state(PRODUCT_KEY) == 'half_open'
+
+
+def test_trial_request_with_an_unrecorded_outcome_is_released(requests_mock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, circuit_breaker=breaker)
+    requests_mock.register_uri('GET', PRODUCT_URL + '1', exc=KeyboardInterrupt)
+    breaker.record_failure(PRODUCT_KEY)
+    breaker.recovery_timeout = 0
+    with pytest.raises(KeyboardInterrupt):
+        sws.license().get_product_info(1)
+    breaker.recovery_timeout = 60
+    assert breaker.state(PRODUCT_KEY) == 'half_open'
+    breaker.before_request(PRODUCT_KEY)
+
+def test_open_circuit_takes_no_rate_limit_token(requests_mock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    bucket = TokenBucket(rate=0.001, capacity=1)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, circuit_breaker=breaker, rate_limits={'license': bucket})
+    breaker.record_failure(PRODUCT_KEY)
+    with pytest.raises(CircuitOpenError):
+        sws.license().get_product_info(1)
+    assert bucket.reserve(max_wait=0) == 0
+
+
+def test_trial_request_past_the_rate_limit_deadline_is_released(requests_mock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    bucket = TokenBucket(rate=0.001, capacity=1)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(total=100), circuit_breaker=breaker,
+              rate_limits={'license': bucket})
+    requests_mock.register_uri('GET', PRODUCT_URL + '1', json={})
+    bucket.reserve()
+    breaker.record_failure(PRODUCT_KEY)
+    time.sleep(0.02)
+    with pytest.raises(DeadlineExceeded):
+        sws.license().get_product_info(1)
+    assert breaker.state(PRODUCT_KEY) == 'half_open'
+    # The trial slot the call did not use is available to the next call
+    breaker.before_request(PRODUCT_KEY)
@@ -0,0 +1,34 @@
+from sws_py_sdk.cache import TTLCache
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "cloudlib": "http://192.168.4.8"
+}
+FILE_URL = SERVICE_URI['cloudlib'] + '/api/v1/me/files/{}'
+
+
+def test_get_files(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    for file_id in range(5):
+        requests_mock.register_uri('GET', FILE_URL.format(file_id), json={'id': file_id})
+    requests_mock.register_uri('GET', FILE_URL.format(5), status_code=404, json={'code': 404})
+
+    results = {result.key: result for result in sws.cloudlib().get_files(range(6), max_workers=3)}
+
+    assert sorted(results) == list(range(6))
+    assert results[3].response.json() == {'id': 3}
+    assert not results[5].ok
+
+
+def test_get_files_with_cache(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    for file_id in range(3):
+        requests_mock.register_uri('GET', FILE_URL.format(file_id), json={'id': file_id})
+    cache = TTLCache(ttl=60)
+
+    list(sws.cloudlib().get_files([0, 1], cache=cache))
+    results = list(sws.cloudlib().get_files([0, 1, 2], cache=cache))
+
+    assert sorted(result.key for result in results) == [0, 1, 2]
+    assert requests_mock.call_count == 3
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.coalesce import RequestCoalescer
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "license": "http://192.168.4.8"
+}
+LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+
+
+def slow_licenses(request, context):
+    time.sleep(0.2)
+    return {'items': ['SDJ-1']}
+
+
+def call_concurrently(call, count=5):
+    barrier = threading.Barrier(count)
+
+    def run():
+        barrier.wait()
+        return call()
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return [future.result() for future in [executor.submit(run) for _ in range(count)]]
+
+
+def test_identical_requests_are_sent_once(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, request_coalescer=RequestCoalescer())
+    requests_mock.register_uri('GET', LICENSES_URL, json=slow_licenses)
+
+    responses = call_concurrently(sws.license().get_licenses)
+
+    assert requests_mock.call_count == 1
+    assert all(response is responses[0] for response in responses)
+    assert responses[0].json() == {'items': ['SDJ-1']}
+    sws.license().get_licenses()
+    assert requests_mock.call_count == 2
+
+
+def test_different_requests_are_not_coalesced(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, request_coalescer=RequestCoalescer())
+    requests_mock.register_uri('GET', LICENSES_URL, json=slow_licenses)
+    names = iter(['serato_dj', 'serato_studio'])
+    lock = threading.Lock()
+
+    def get_licenses():
+        with lock:
+            app_name = next(names)
+        return sws.license().get_licenses(app_name=app_name)
+
+    call_concurrently(get_licenses, count=2)
+    assert requests_mock.call_count == 2
+
+
+def test_exception_is_shared():
+    coalescer = RequestCoalescer()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ConnectionError('down')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(coalescer.run, 'key', fail)
+        started.wait()
+        follower = executor.submit(coalescer.run, 'key', lambda: pytest.fail('must not be called'))
+        for future in (leader, follower):
+            with pytest.raises(ConnectionError):
+                future.result()
+
+
+def test_cancelling_the_leader_does_not_cancel_followers():
+    coalescer = RequestCoalescer()
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        await asyncio.sleep(0.1)
+        return f'response {len(calls)}'
+
+    async def test():
+        leader = asyncio.ensure_future(coalescer.run_async('key', call))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(coalescer.run_async('key', call)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await asyncio.gather(*followers) == ['response 2'] * 3
+        assert leader.cancelled()
+
+    asyncio.run(test())
+    assert len(calls) == 2
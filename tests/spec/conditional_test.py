@@ -0,0 +1,58 @@
+from sws_py_sdk.cache import TTLCache
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "license": "http://192.168.4.8"
+}
+LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+
+
+def test_unchanged_body_is_served_from_cache(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, conditional_cache=TTLCache())
+    requests_mock.register_uri('GET', LICENSES_URL, [
+        {'json': {'items': ['SDJ-1']}, 'headers': {'ETag': '"v1"'}},
+        {'status_code': 304, 'headers': {'ETag': '"v1"', 'Cache-Control': 'private'}},
+    ])
+
+    assert sws.license().get_licenses().json() == {'items': ['SDJ-1']}
+    response = sws.license().get_licenses()
+
+    assert requests_mock.last_request.headers['If-None-Match'] == '"v1"'
+    assert response.status_code == 200
+    assert response.json() == {'items': ['SDJ-1']}
+    assert response.headers['Cache-Control'] == 'private'
+
+
+def test_changed_body_replaces_stored_response(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, conditional_cache=TTLCache())
+    last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    requests_mock.register_uri('GET', LICENSES_URL, [
+        {'json': {'items': []}, 'headers': {'Last-Modified': last_modified}},
+        {'json': {'items': ['SDJ-1']}, 'headers': {'ETag': '"v2"'}},
+        {'status_code': 304},
+    ])
+
+    sws.license().get_licenses()
+    assert sws.license().get_licenses().json() == {'items': ['SDJ-1']}
+    assert requests_mock.last_request.headers['If-Modified-Since'] == last_modified
+    assert sws.license().get_licenses().json() == {'items': ['SDJ-1']}
+    assert requests_mock.last_request.headers['If-None-Match'] == '"v2"'
+
+
+def test_stored_responses_depend_on_access_token(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, conditional_cache=TTLCache())
+    requests_mock.register_uri('GET', LICENSES_URL, json={'items': []}, headers={'ETag': '"v1"'})
+    sws.access_token = 'token.1'
+    sws.license().get_licenses()
+    sws.access_token = 'token.2'
+    sws.license().get_licenses()
+    assert 'If-None-Match' not in requests_mock.last_request.headers
+
+
+def test_requests_are_not_conditional_by_default(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', LICENSES_URL, json={'items': []}, headers={'ETag': '"v1"'})
+    sws.license().get_licenses()
+    sws.license().get_licenses()
+    assert 'If-None-Match' not in requests_mock.last_request.headers
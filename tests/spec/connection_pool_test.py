@@ -0,0 +1,37 @@
+import time
+
+from sws_py_sdk.connection_pool import ConnectionPool
+from sws_py_sdk.sws import Sws
+
+SERVICE_URI = {
+    "id": "http://192.168.4.6",
+    "license": "http://192.168.4.7"
+}
+app_id = "MyClientId"
+
+
+def test_session_is_reused_between_requests(requests_mock):
+    """Check that every request made through an Sws instance uses the same pooled session"""
+    sws = Sws(app_id=app_id, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + '/api/v1/me/licenses', json={'items': []})
+    first_session = sws.connection_pool.session()
+    sws.license().get_licenses()
+    sws.license().get_licenses()
+    assert sws.connection_pool.session() is first_session
+    assert requests_mock.call_count == 2
+
+
+def test_pool_is_shared_between_sws_instances():
+    pool = ConnectionPool(pool_maxsize=20)
+    first = Sws(app_id=app_id, service_uri=SERVICE_URI, connection_pool=pool)
+    second = Sws(app_id=app_id, service_uri=SERVICE_URI, connection_pool=pool)
+    assert first.connection_pool.session() is second.connection_pool.session()
+    assert pool.session().get_adapter('https://license.serato.com')._pool_maxsize == 20
+
+
+def test_idle_session_is_evicted():
+    pool = ConnectionPool(idle_timeout=0.01)
+    session = pool.session()
+    time.sleep(0.02)
+    assert pool.session() is not session
+
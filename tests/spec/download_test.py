@@ -0,0 +1,58 @@
+import io
+
+from sws_py_sdk.download import DownloadFile
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "ecom": "http://192.168.4.8"
+}
+INVOICE_URL = SERVICE_URI['ecom'] + '/api/v1/me/orders/{}/invoices/{}'
+PDF_CONTENT = b'%PDF-1.4 ' + b'x' * 200000
+
+
+def test_download_invoice_to_path(requests_mock, tmp_path):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', INVOICE_URL.format(1, 2), content=PDF_CONTENT,
+                               request_headers={'Accept': 'application/pdf'})
+    response = sws.ecom().download_invoice(1, 2, tmp_path / 'invoice.pdf', chunk_size=1024)
+    assert response.status_code == 200
+    assert (tmp_path / 'invoice.pdf').read_bytes() == PDF_CONTENT
+    assert not (tmp_path / 'invoice.pdf.part').exists()
+
+
+def test_download_invoice_to_file_object(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', INVOICE_URL.format(1, 2), content=PDF_CONTENT)
+    buffer = io.BytesIO()
+    sws.ecom().download_invoice(1, 2, buffer)
+    assert buffer.getvalue() == PDF_CONTENT
+
+
+def test_failed_download_writes_nothing(requests_mock, tmp_path):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', INVOICE_URL.format(1, 2), status_code=404, json={'code': 404})
+    response = sws.ecom().download_invoice(1, 2, tmp_path / 'invoice.pdf')
+    assert response.status_code == 404
+    assert response.json() == {'code': 404}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_invoices(requests_mock, tmp_path):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    invoices = [(order_id, order_id * 10) for order_id in range(1, 6)]
+    for order_id, invoice_id in invoices:
+        requests_mock.register_uri('GET', INVOICE_URL.format(order_id, invoice_id), content=b'invoice %d' % order_id)
+
+    results = list(sws.ecom().download_invoices(invoices, tmp_path, max_workers=3))
+
+    assert sorted(result.key for result in results) == invoices
+    assert all(result.ok for result in results)
+    assert (tmp_path / '3-30.pdf').read_bytes() == b'invoice 3'
+
+
+def test_discarded_download_leaves_no_file(tmp_path):
+    download = DownloadFile(tmp_path / 'invoice.pdf')
+    download.write(b'partial')
+    download.discard()
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,60 @@
+import re
+from unittest import mock
+
+from sws_py_sdk.firewall_header import FirewallHeader
+from sws_py_sdk.sws import Sws
+
+HEADER_PATTERN = re.compile(r'"[serato]{3}~[\x28-\x31\x59-\x5B\x5D\x5E\x79]{8}[\x38-\x41\x69-\x6E]{8}'
+                            r'[\x20-\x21\x23-\x29\x51-\x56\x78]{8}[\x40-\x49\x71-\x76]{8}"')
+
+
+def shifted_hash(firewall_header, g_hash):
+    """ The original, character by character, shift of a hash """
+    shifted = ''.join(firewall_header.shiftChunk(g_hash[i*8:i*8+8], shift)
+                      for i, shift in enumerate(firewall_header.SHIFTS))
+    return firewall_header.replaceInvalidCharacters(shifted)
+
+
+def test_header_matches_pattern():
+    firewall_header = FirewallHeader()
+    for i in range(200):
+        assert HEADER_PATTERN.fullmatch(firewall_header.getHeader()['x-serato-firewall'])
+
+
+def test_translation_matches_character_shifts():
+    firewall_header = FirewallHeader()
+    for g_hash in ['0123456789abcdef' * 2, 'fedcba9876543210' * 2, 'dddddddd22222222dddddddd22222222']:
+        with mock.patch('hashlib.md5') as md5:
+            md5.return_value.hexdigest.return_value = g_hash
+            header = firewall_header.getHeaderHash()
+        assert header[5:-1] == shifted_hash(firewall_header, g_hash)
+
+
+def test_header_is_regenerated_for_every_request_by_default():
+    firewall_header = FirewallHeader()
+    headers = {firewall_header.getHeader()['x-serato-firewall'] for i in range(20)}
+    assert len(headers) > 1
+
+
+def test_header_is_reused_within_cache_window():
+    firewall_header = FirewallHeader(cache_window=60)
+    with mock.patch('time.monotonic', return_value=1000.0):
+        header = firewall_header.getHeader()
+        assert all(firewall_header.getHeader() == header for i in range(20))
+    with mock.patch('time.monotonic', return_value=1061.0):
+        with mock.patch.object(firewall_header, 'getHeaderHash', return_value='"new"'):
+            assert firewall_header.getHeader() == {'x-serato-firewall': '"new"'}
+
+
+def test_services_share_firewall_header(requests_mock):
+    firewall_header = FirewallHeader(cache_window=60)
+    sws = Sws(app_id='MyClientId', service_uri={'id': 'http://192.168.4.6', 'license': 'http://192.168.4.7'},
+              test_env=True, firewall_header=firewall_header)
+    requests_mock.get('http://192.168.4.7/api/v1/products/types', json={})
+    requests_mock.get('http://192.168.4.6/api/v1/me', json={})
+    sws.license().get_product_types()
+    sws.identity().get_user()
+    headers = [request.headers['x-serato-firewall'] for request in requests_mock.request_history]
+    assert sws.license().FirewallHeader is firewall_header
+    assert headers[0] == headers[1]
+    assert HEADER_PATTERN.fullmatch(headers[0])
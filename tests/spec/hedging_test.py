@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests import Request
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.circuit_breaker import CircuitBreaker
+from sws_py_sdk.hedging import HedgingPolicy
+from sws_py_sdk.rate_limit import TokenBucket
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "license": "http://192.168.4.8"
+}
+LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+KEY = ('license', '/api/v1/me/licenses')
+
+
+def test_delay_is_derived_from_latency_percentile():
+    policy = HedgingPolicy(percentile=90, min_samples=10, min_delay=0, max_delay=5)
+    for latency in range(1, 10):
+        policy.record(KEY, latency / 10)
+    assert policy.hedge_delay(KEY) is None
+    policy.record(KEY, 3.0)
+    assert policy.hedge_delay(KEY) == 0.9
+    assert HedgingPolicy(delay=0.2).hedge_delay(KEY) == 0.2
+
+
+class FakeResponse(object):
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_slow_request_is_hedged_and_aborted():
+    policy = HedgingPolicy(delay=0.05)
+    sent = []
+    aborted = threading.Event()
+
+    def send(request):
+        sent.append((request, threading.current_thread()))
+        if len(sent) == 1:
+            if aborted.wait(0.3):
+                raise ConnectionError('Aborted')
+            return FakeResponse('slow')
+        return FakeResponse('hedge')
+
+    start = time.monotonic()
+    response = policy.send(KEY, send, Request('GET', LICENSES_URL).prepare(), abort=aborted.set)
+
+    assert response.name == 'hedge'
+    assert time.monotonic() - start < 0.25
+    assert sent[0][0] is not sent[1][0]
+    assert sent[0][1] is threading.current_thread()
+    assert sent[1][1] is not threading.current_thread()
+    assert policy.stats() == {'requests': 1, 'hedged': 1, 'hedge_wins': 1, 'hedge_rate': 1.0}
+    policy.close()
+
+
+def test_requests_are_sent_on_the_calling_thread():
+    policy = HedgingPolicy(delay=5)
+    threads = []
+
+    def send(request):
+        threads.append(threading.current_thread())
+        return FakeResponse('primary')
+
+    with ThreadPoolExecutor(max_workers=30) as executor:
+        list(executor.map(lambda _: policy.send(KEY, send, Request('GET', LICENSES_URL).prepare()), range(60)))
+
+    assert len(threads) == 60
+    assert not any(thread.name.startswith('sws-hedge') for thread in threads)
+    assert policy.stats()['hedged'] == 0
+    policy.close()
+
+
+@contextmanager
+def local_server(respond):
+    """ Serves GET requests with `respond(number of the request)`, which returns (status, body) """
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            calls.append(self.path)
+            status, body = respond(len(calls))
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', calls
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_slow_request_is_aborted_by_its_hedge():
+    def respond(call):
+        if call == 1:
+            time.sleep(1)
+        return 200, {'items': [call]}
+
+    breaker = CircuitBreaker(failure_threshold=1)
+    with local_server(respond) as (base_url, calls):
+        sws = Sws(app_id=APP_ID, service_uri={'license': base_url}, hedging_policy=HedgingPolicy(delay=0.05),
+                  circuit_breaker=breaker)
+        start = time.monotonic()
+        response = sws.license().get_licenses()
+        assert time.monotonic() - start < 0.5
+        assert response.json() == {'items': [2]}
+        # The aborted request is not a failure of the endpoint
+        assert breaker.state(KEY) == 'closed'
+        sws.close()
+
+
+def test_hedge_is_rate_limited_and_recorded_by_the_circuit_breaker():
+    def respond(call):
+        if call == 1:
+            time.sleep(1)
+            return 200, {'items': []}
+        return 503, {'code': 503}
+
+    bucket = TokenBucket(rate=1, capacity=2)
+    breaker = CircuitBreaker(failure_threshold=1)
+    with local_server(respond) as (base_url, calls):
+        sws = Sws(app_id=APP_ID, service_uri={'license': base_url}, hedging_policy=HedgingPolicy(delay=0.05),
+                  rate_limits={'license': bucket}, circuit_breaker=breaker)
+        assert sws.license().get_licenses().status_code == 503
+        assert len(calls) == 2
+        assert bucket.reserve(max_wait=0) is None
+        assert breaker.state(KEY) == 'open'
+        sws.close()
+
+
+def test_losing_async_request_is_cancelled():
+    policy = HedgingPolicy(delay=0.05)
+    sent = []
+    cancelled = []
+
+    async def send(request):
+        sent.append(request)
+        if len(sent) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(request)
+                raise
+        return FakeResponse('hedge')
+
+    response = asyncio.run(policy.send_async(KEY, send, Request('GET', LICENSES_URL).prepare()))
+
+    assert response.name == 'hedge'
+    assert len(cancelled) == 1
+
+
+def test_fast_request_is_not_hedged(requests_mock):
+    policy = HedgingPolicy(delay=1)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, hedging_policy=policy)
+    requests_mock.register_uri('GET', LICENSES_URL, json={'items': []})
+    requests_mock.register_uri('POST', LICENSES_URL, json={})
+
+    sws.license().get_licenses()
+    sws.license().fetch(auth='bearer', endpoint='/api/v1/me/licenses', method='POST')
+
+    assert requests_mock.call_count == 2
+    assert policy.stats()['requests'] == 1
+    assert policy.stats()['hedged'] == 0
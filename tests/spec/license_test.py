@@ -0,0 +1,146 @@
+from sws_py_sdk.cache import SQLiteCache, TTLCache
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "license": "http://192.168.4.8"
+}
+PRODUCT_TYPES_URL = SERVICE_URI['license'] + '/api/v1/products/types'
+
+
+def test_product_types_are_cached(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=TTLCache(ttl=60))
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, json={'items': []})
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL + '/5', json={'id': 5})
+
+    for _ in range(3):
+        assert sws.license().get_product_types(app_name='serato_dj').json() == {'items': []}
+        assert sws.license().get_product_type_details(5).json() == {'id': 5}
+    sws.license().get_product_types(app_name='serato_studio')
+
+    assert requests_mock.call_count == 3
+
+
+def test_product_type_cache_invalidation(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=TTLCache(ttl=60))
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, json={'items': []})
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL + '/5', json={'id': 5})
+    sws.license().get_product_types()
+    sws.license().get_product_type_details(5)
+
+    sws.license().invalidate_product_types()
+    sws.license().get_product_types()
+    sws.license().get_product_type_details(5)
+
+    assert requests_mock.call_count == 4
+
+
+def test_product_changes_invalidate_cached_product_info(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=TTLCache(ttl=60))
+    products_url = SERVICE_URI['license'] + '/api/v1/products/products'
+    requests_mock.register_uri('GET', products_url + '/P-1', [{'json': {'valid_to': '2023-01-01'}},
+                                                              {'json': {'valid_to': '2024-01-01'}},
+                                                              {'json': {'upgraded': True}},
+                                                              {'status_code': 404, 'json': {'code': 404}}])
+    requests_mock.register_uri('GET', products_url + '/P-2', json={'id': 'P-2'})
+    requests_mock.register_uri('PUT', products_url + '/P-1', json={})
+    requests_mock.register_uri('POST', products_url, json={})
+    requests_mock.register_uri('DELETE', products_url + '/P-1', status_code=204)
+    sws.license().get_product_info('P-1')
+    sws.license().get_product_info('P-2')
+
+    sws.license().admin_update_product('P-1', valid_to='2024-01-01')
+    assert sws.license().get_product_info('P-1').json() == {'valid_to': '2024-01-01'}
+    sws.license().admin_add_product(55, user_id=1, upgrade_from_product_id='P-1')
+    assert sws.license().get_product_info('P-1').json() == {'upgraded': True}
+    sws.license().delete_product('P-1')
+    assert sws.license().get_product_info('P-1').status_code == 404
+    sws.license().get_product_info('P-2')
+
+    assert [request.method for request in requests_mock.request_history].count('GET') == 5
+
+
+def test_product_info_read_during_a_change_is_not_kept(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=TTLCache(ttl=60))
+    product_url = SERVICE_URI['license'] + '/api/v1/products/products/P-1'
+    requests_mock.register_uri('GET', product_url, [{'json': {'valid_to': '2023-01-01'}},
+                                                    {'json': {'valid_to': '2024-01-01'}}])
+
+    def update_product(request, context):
+        # Another caller reads the product while the change is in progress
+        sws.license().get_product_info('P-1')
+        return {}
+
+    requests_mock.register_uri('PUT', product_url, json=update_product)
+    sws.license().admin_update_product('P-1', valid_to='2024-01-01')
+    assert sws.license().get_product_info('P-1').json() == {'valid_to': '2024-01-01'}
+
+def test_product_types_are_not_cached_by_default(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, json={'items': []})
+    sws.license().get_product_types()
+    sws.license().get_product_types()
+    assert requests_mock.call_count == 2
+
+
+def test_errors_are_not_cached(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=TTLCache(ttl=60))
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, [{'status_code': 503, 'json': {'code': 503}},
+                                                          {'json': {'items': []}}])
+    assert sws.license().get_product_types().status_code == 503
+    assert sws.license().get_product_types().status_code == 200
+
+
+def test_product_info_is_shared_through_a_sqlite_cache(requests_mock, tmp_path):
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + '/api/v1/products/products/P-1', json={'id': 'P-1'})
+    for _ in range(2):
+        # Each Sws instance stands for a worker process with its own connection to the cache
+        sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=SQLiteCache(str(tmp_path / 'cache.db')))
+        assert sws.license().get_product_info('P-1').json() == {'id': 'P-1'}
+    assert requests_mock.call_count == 1
+
+
+def test_cached_responses_do_not_store_the_access_token(requests_mock, tmp_path):
+    path = tmp_path / 'cache.db'
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=SQLiteCache(str(path)))
+    sws.access_token = 'secret.access.token'
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, json={'items': [1]})
+    sws.license().get_product_types()
+    response = sws.license().get_product_types()
+    assert response.json() == {'items': [1]}
+    assert requests_mock.call_count == 1
+    sws.response_cache.close()
+    assert b'secret.access.token' not in path.read_bytes()
+
+
+def test_cached_responses_are_keyed_by_host_and_identity(requests_mock):
+    cache = TTLCache(ttl=60)
+    other_uri = {'license': 'http://192.168.4.9'}
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + '/api/v1/products/products/P-1', json={'id': 'P-1'})
+    requests_mock.register_uri('GET', other_uri['license'] + '/api/v1/products/products/P-1', json={'id': 'P-1'})
+    first = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=cache)
+    first.access_token = 'First.Access.Token'
+    # Another worker of the same app and user, holding its own token
+    second = Sws(app_id=APP_ID, service_uri=SERVICE_URI, response_cache=cache)
+    second.access_token = 'Second.Access.Token'
+    other_user = Sws(app_id=APP_ID, user_id=1000, service_uri=SERVICE_URI, response_cache=cache)
+    other_user.access_token = 'First.Access.Token'
+    other_host = Sws(app_id=APP_ID, service_uri=other_uri, response_cache=cache)
+    other_host.access_token = 'First.Access.Token'
+
+    for sws in (first, second, other_user, other_host):
+        sws.license().get_product_info('P-1')
+    assert requests_mock.call_count == 3
+
+    # A token refresh keeps the cached entries
+    first.access_token = 'Refreshed.Access.Token'
+    first.license().get_product_info('P-1')
+    assert requests_mock.call_count == 3
+
+
+def test_product_types_are_shared_by_every_user(requests_mock):
+    cache = TTLCache(ttl=60)
+    requests_mock.register_uri('GET', PRODUCT_TYPES_URL, json={'items': []})
+    for user_id in (0, 1000, 2000):
+        Sws(app_id=APP_ID, user_id=user_id, service_uri=SERVICE_URI, response_cache=cache).license().get_product_types()
+    assert requests_mock.call_count == 1
@@ -0,0 +1,121 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.cache import TTLCache
+from sws_py_sdk.metrics import PrometheusMetrics, RequestEvent
+from sws_py_sdk.retry import RetryPolicy
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.sws_client import SwsClient
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+PRODUCT_URL = SERVICE_URI['license'] + '/api/v1/products/products/1234'
+GET_LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+TOKEN_REFRESH_URL = SERVICE_URI['id'] + '/api/v1/tokens/refresh'
+
+
+def test_every_call_emits_an_event(requests_mock):
+    events = []
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append)
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'}, headers={'Content-Length': '14'})
+    sws.license().get_product_info('1234')
+    assert len(events) == 1
+    event = events[0]
+    assert (event.service, event.endpoint, event.method, event.status) == ('license', '/api/v1/products/products/{id}',
+                                                                           'GET', 200)
+    assert event.error is None
+    assert event.response_bytes == 14
+    assert event.request_bytes == 0
+    assert event.duration > 0
+    assert event.retries == 0
+    assert not event.token_refreshed
+    assert not event.cached
+
+
+def test_event_counts_request_bytes(requests_mock):
+    events = []
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append)
+    requests_mock.post(TOKEN_REFRESH_URL, json={})
+    sws.identity().token_refresh('refresh.token')
+    assert events[0].method == 'POST'
+    assert events[0].request_bytes == len(requests_mock.last_request.body)
+
+
+def test_event_counts_retries(requests_mock):
+    events = []
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append,
+              retry_policy=RetryPolicy(max_attempts=3, backoff_factor=0))
+    requests_mock.get(GET_LICENSES_URL, [{'status_code': 503, 'json': {}}, {'exc': ConnectionError},
+                                         {'status_code': 200, 'json': {'items': []}}])
+    sws.license().get_licenses()
+    assert [(event.status, event.retries) for event in events] == [(200, 2)]
+
+
+def test_event_reports_token_refresh(requests_mock):
+    events = []
+    sws_client = SwsClient(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append)
+    sws_client.access_token = 'Expired.Access.Token'
+    requests_mock.get(GET_LICENSES_URL, [{'status_code': 401, 'json': {'code': 2002, 'error': 'Expired'}},
+                                         {'status_code': 200, 'json': {'items': []}}])
+    requests_mock.post(TOKEN_REFRESH_URL, json={'tokens': {'access': {'token': 'new.token', 'expires_at': 1489142529},
+                                                           'refresh': {'token': 'refresh.token'}}})
+    sws_client.license().get_licenses()
+    assert [(event.endpoint, event.token_refreshed) for event in events] == [('/api/v1/tokens/refresh', False),
+                                                                             ('/api/v1/me/licenses', True)]
+
+
+def test_event_reports_exceptions(requests_mock):
+    events = []
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append)
+    requests_mock.get(GET_LICENSES_URL, exc=ConnectionError)
+    with pytest.raises(ConnectionError):
+        sws.license().get_licenses()
+    assert events[0].status is None
+    assert isinstance(events[0].error, ConnectionError)
+
+
+def test_event_reports_cache_hits(requests_mock):
+    events = []
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=events.append, response_cache=TTLCache())
+    requests_mock.get(SERVICE_URI['license'] + '/api/v1/products/types', json={'items': []})
+    sws.license().get_product_types()
+    sws.license().get_product_types()
+    assert [event.cached for event in events] == [False, True]
+    assert requests_mock.call_count == 1
+
+
+def test_prometheus_metrics_aggregate_events():
+    metrics = PrometheusMetrics(buckets=(0.1, 1.0))
+    metrics(RequestEvent('license', '/api/v1/me/licenses', 'GET', status=200, duration=0.05, ttfb=0.04,
+                         response_bytes=100, retries=1))
+    metrics(RequestEvent('license', '/api/v1/me/licenses', 'GET', status=200, duration=0.5, ttfb=0.4,
+                         response_bytes=50, token_refreshed=True))
+    metrics(RequestEvent('license', '/api/v1/me/licenses', 'GET', error=ConnectionError(), duration=2.0))
+    assert metrics.value('requests_total', status='200') == 2
+    assert metrics.value('errors_total', error='ConnectionError') == 1
+    assert metrics.value('retries_total') == 1
+    assert metrics.value('token_refreshes_total') == 1
+    assert metrics.value('response_bytes_total', service='license') == 150
+    assert metrics.value('request_duration_seconds') == (3, 2.55)
+    assert metrics.value('time_to_first_byte_seconds') == (2, pytest.approx(0.44))
+    exposition = metrics.exposition()
+    labels = 'service="license",endpoint="/api/v1/me/licenses",method="GET"'
+    assert f'sws_requests_total{{{labels},status="200"}} 2' in exposition
+    assert f'sws_request_duration_seconds_bucket{{{labels},le="0.1"}} 1' in exposition
+    assert f'sws_request_duration_seconds_bucket{{{labels},le="1.0"}} 2' in exposition
+    assert f'sws_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in exposition
+    assert f'sws_request_duration_seconds_count{{{labels}}} 3' in exposition
+    assert '# TYPE sws_request_duration_seconds histogram' in exposition
+    metrics.clear()
+    assert metrics.value('requests_total') == 0
+
+
+def test_prometheus_metrics_as_client_hook(requests_mock):
+    metrics = PrometheusMetrics()
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, metrics_hook=metrics)
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'})
+    sws.license().get_product_info('1234')
+    assert metrics.value('requests_total', endpoint='/api/v1/products/products/{id}') == 1
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from sws_py_sdk.rate_limit import TokenBucket
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.timeouts import DeadlineExceeded, Timeout
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+GET_LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+
+
+def test_bucket_allows_a_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_reserve_over_max_wait_takes_no_tokens():
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.reserve()
+    assert bucket.reserve(max_wait=0.5) is None
+    assert bucket.reserve() == pytest.approx(1, abs=0.01)
+
+
+def test_acquire_async():
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def acquire_many():
+        started = time.monotonic()
+        await asyncio.gather(*[bucket.acquire_async() for i in range(5)])
+        return time.monotonic() - started
+
+    assert asyncio.run(acquire_many()) >= 0.07
+
+
+def test_requests_are_rate_limited_per_service(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, rate_limits={'license': TokenBucket(rate=50, capacity=1)})
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    requests_mock.register_uri('POST', SERVICE_URI['id'] + '/api/v1/tokens/refresh', json={})
+
+    started = time.monotonic()
+    for i in range(5):
+        sws.identity().token_refresh('refresh.token')
+    assert time.monotonic() - started < 0.05
+
+    started = time.monotonic()
+    for i in range(5):
+        sws.license().get_licenses()
+    assert time.monotonic() - started >= 0.07
+
+
+def test_rate_limit_wait_past_deadline_raises(requests_mock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(total=100), rate_limits={'license': bucket})
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    sws.license().get_licenses()
+    with pytest.raises(DeadlineExceeded):
+        sws.license().get_licenses()
@@ -0,0 +1,107 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from requests.exceptions import ConnectionError, ConnectTimeout
+
+from sws_py_sdk.retry import RetryPolicy, parse_retry_after
+from sws_py_sdk.sws import Sws
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+GET_LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+AUTHORIZATIONS_URL = SERVICE_URI['license'] + '/api/v1/me/licenses/authorizations'
+NO_BACKOFF = RetryPolicy(max_attempts=3, backoff_factor=0)
+
+
+def create_license_authorization(sws):
+    return sws.license().create_license_authorization(action='activate', app_name='serato_studio',
+                                                      app_version='1.0.0', host_machine_id='ABC123123',
+                                                      host_machine_name='My Machine', license_id='420',
+                                                      system_time='2019-10-10T17:01:33+13:00')
+
+
+def test_requests_are_not_retried_without_a_policy(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, [{'status_code': 503, 'json': {}},
+                                                         {'status_code': 200, 'json': {'items': []}}])
+    assert sws.license().get_licenses().status_code == 503
+    assert requests_mock.call_count == 1
+
+
+def test_gateway_errors_are_retried(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=NO_BACKOFF)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, [{'status_code': 502, 'json': {}},
+                                                         {'status_code': 504, 'json': {}},
+                                                         {'status_code': 200, 'json': {'items': []}}])
+    assert sws.license().get_licenses().status_code == 200
+    assert requests_mock.call_count == 3
+
+
+def test_retries_stop_at_max_attempts(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=NO_BACKOFF)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, status_code=503, json={})
+    assert sws.license().get_licenses().status_code == 503
+    assert requests_mock.call_count == 3
+
+
+def test_connection_errors_are_retried(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=NO_BACKOFF)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, [{'exc': ConnectionError},
+                                                         {'status_code': 200, 'json': {'items': []}}])
+    assert sws.license().get_licenses().status_code == 200
+
+
+def test_post_is_not_replayed_after_it_may_have_been_processed(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=NO_BACKOFF)
+    requests_mock.register_uri('POST', AUTHORIZATIONS_URL, [{'status_code': 503, 'json': {}},
+                                                            {'status_code': 200, 'json': {}}])
+    assert create_license_authorization(sws).status_code == 503
+
+    requests_mock.register_uri('POST', AUTHORIZATIONS_URL, [{'exc': ConnectionError},
+                                                            {'status_code': 200, 'json': {}}])
+    with pytest.raises(ConnectionError):
+        create_license_authorization(sws)
+
+
+def test_post_is_retried_when_it_was_not_processed(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=NO_BACKOFF)
+    requests_mock.register_uri('POST', AUTHORIZATIONS_URL, [{'status_code': 429, 'json': {}},
+                                                            {'exc': ConnectTimeout},
+                                                            {'status_code': 200, 'json': {}}])
+    assert create_license_authorization(sws).status_code == 200
+    assert requests_mock.call_count == 3
+
+
+def test_retry_after_is_respected(requests_mock):
+    policy = RetryPolicy(backoff_factor=10)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, status_code=429, headers={'Retry-After': '0.01'}, json={})
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, retry_policy=policy)
+    response = sws.license().get_licenses()
+    assert policy.backoff(1, response) == 0.01
+    assert requests_mock.call_count == 3
+
+
+def test_retry_does_not_wait_past_the_deadline(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=1000, retry_policy=RetryPolicy())
+    requests_mock.register_uri('GET', GET_LICENSES_URL, status_code=503, headers={'Retry-After': '60'}, json={})
+    assert sws.license().get_licenses().status_code == 503
+    assert requests_mock.call_count == 1
+
+
+def test_backoff_is_exponential_and_capped():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+    assert [policy.backoff(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+    jittered = RetryPolicy(backoff_factor=1, max_backoff=5)
+    assert all(0 <= jittered.backoff(3) <= 4 for i in range(20))
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 < parse_retry_after(in_a_minute) <= 60
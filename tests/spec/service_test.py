@@ -59,3 +59,31 @@ def test_cdn_auth_header(requests_mock):
 
     # Any API call (validating the request headers)
     sws.identity().token_refresh(refresh_token='totally_refresh_refresh_token')
+
+
+def test_invalid_access_token_handler_without_context(requests_mock):
+    licenses_url = SERVICE_URI['license'] + '/api/v1/me/licenses'
+    requests_mock.register_uri('GET', licenses_url, [{'status_code': 401, 'json': {'code': 2002}},
+                                                     {'json': {'items': []}}])
+    handled = []
+
+    def handler(service, response):
+        handled.append(response.status_code)
+        return service.fetch_request(service.last_request)
+
+    sws = Sws(app_id=app_id, service_uri=SERVICE_URI, invalid_access_token_handler=handler)
+    assert sws.license().get_licenses().json() == {'items': []}
+    assert handled == [401]
+
+
+def test_invalid_access_token_handler_with_context(requests_mock):
+    licenses_url = SERVICE_URI['license'] + '/api/v1/me/licenses'
+    requests_mock.register_uri('GET', licenses_url, [{'status_code': 401, 'json': {'code': 2002}},
+                                                     {'json': {'items': []}}])
+
+    def handler(service, response, context):
+        return service.fetch_request(context.request, context=context)
+
+    sws = Sws(app_id=app_id, service_uri=SERVICE_URI, invalid_access_token_handler=handler)
+    assert sws.license().get_licenses().json() == {'items': []}
+    assert sws.license().last_request is None
@@ -1,4 +1,7 @@
-from datetime import datetime 
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 import pytest
 import requests_mock
@@ -190,4 +193,84 @@ def test_invalid_access_token_will_refresh_and_retry(requests_mock):
 
 def handle_access_token_update(token, expires):
     assert token == MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['token']
-    assert expires == datetime.utcfromtimestamp(MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['expires_at'])
\ No newline at end of file
+    assert expires == datetime.utcfromtimestamp(MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['expires_at'])
+
+def test_concurrent_invalid_access_tokens_refresh_once(requests_mock):
+    """ When many threads hit an expired token at once, only one of them refreshes it """
+    sws_client = SwsClient(app_id=APP_ID, secret='myclientapppassword', service_uri=SERVICE_URI, user_id=1000)
+    sws_client.access_token = 'Expired.Access.Token'
+    sws_client.refresh_token = MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['refresh']['token']
+    new_token = MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['token']
+
+    def get_licenses(request, context):
+        if request.headers['Authorization'] != f'Bearer {new_token}':
+            context.status_code = EXPIRED_ACCESS_TOKEN_ERROR['http_code']
+            return EXPIRED_ACCESS_TOKEN_ERROR['response_body']
+        return MOCK_GET_LICENSES_RESPONSE_BODY
+
+    def token_refresh(request, context):
+        time.sleep(0.05)
+        return MOCK_TOKEN_REFRESH_RESPONSE_BODY
+
+    requests_mock.register_uri('GET', SERVICE_URI['license'] + GET_LICENSES_API, json=get_licenses)
+    refresh = requests_mock.register_uri('POST', SERVICE_URI['id'] + TOKEN_REFRESH_URL, json=token_refresh)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda i: sws_client.license().get_licenses(), range(8)))
+
+    assert [response.status_code for response in responses] == [200] * 8
+    assert refresh.call_count == 1
+    assert sws_client.access_token == new_token
+
+
+def test_token_refresh_scheduler_refreshes_before_expiry(requests_mock):
+    sws_client = SwsClient(app_id=APP_ID, secret='myclientapppassword', service_uri=SERVICE_URI)
+    sws_client.refresh_token = MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['refresh']['token']
+    sws_client.access_token_expires_at = datetime.utcnow() + timedelta(seconds=60.05)
+    refresh = requests_mock.register_uri('POST', SERVICE_URI['id'] + TOKEN_REFRESH_URL,
+                                         json=MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+
+    sws_client.start_token_refresh_scheduler(refresh_margin=60, jitter=0, poll_interval=0.2)
+    deadline = time.monotonic() + 2
+    while not refresh.called and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sws_client.stop_token_refresh_scheduler()
+
+    # The mock token is already expired, so the scheduler backs off after refreshing it once
+    assert refresh.call_count == 1
+    assert sws_client.access_token == MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['token']
+    assert sws_client.access_token_expires_at == datetime.utcfromtimestamp(
+        MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['expires_at'])
+
+
+def test_token_refresh_scheduler_waits_for_unknown_expiry(requests_mock):
+    sws_client = SwsClient(app_id=APP_ID, secret='myclientapppassword', service_uri=SERVICE_URI)
+    refresh = requests_mock.register_uri('POST', SERVICE_URI['id'] + TOKEN_REFRESH_URL,
+                                         json=MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+    sws_client.start_token_refresh_scheduler(poll_interval=0.01)
+    time.sleep(0.05)
+    sws_client.close()
+    assert not refresh.called
+
+
+def test_concurrent_calls_replay_their_own_request(requests_mock):
+    """ A client shared between threads must replay each thread's own request after refreshing the token """
+    sws_client = SwsClient(app_id=APP_ID, secret='myclientapppassword', service_uri=SERVICE_URI)
+    sws_client.access_token = 'Expired.Access.Token'
+    new_token = MOCK_TOKEN_REFRESH_RESPONSE_BODY['tokens']['access']['token']
+
+    def get_product(request, context):
+        time.sleep(0.01)
+        if request.headers['Authorization'] != f'Bearer {new_token}':
+            context.status_code = EXPIRED_ACCESS_TOKEN_ERROR['http_code']
+            return EXPIRED_ACCESS_TOKEN_ERROR['response_body']
+        return {'id': request.path.split('/')[-1]}
+
+    requests_mock.register_uri('GET', re.compile(SERVICE_URI['license'] + '/api/v1/products/products/'),
+                               json=get_product)
+    requests_mock.register_uri('POST', SERVICE_URI['id'] + TOKEN_REFRESH_URL, json=MOCK_TOKEN_REFRESH_RESPONSE_BODY)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda i: sws_client.license().get_product_info(f'product{i}'), range(16)))
+
+    assert [response.json()['id'] for response in responses] == [f'product{i}' for i in range(16)]
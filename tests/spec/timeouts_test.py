@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.sws_client import SwsClient
+from sws_py_sdk.timeouts import DeadlineExceeded, Timeout
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6"
+}
+GET_LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+
+
+def test_client_timeout_is_passed_to_the_transport(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=3000)
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    sws.license().get_licenses()
+    connect, read = requests_mock.last_request.timeout
+    assert 0 < connect <= 3.0
+    assert 0 < read <= 3.0
+
+
+def test_split_timeouts(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(connect=500, read=2000))
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    sws.license().get_licenses()
+    assert requests_mock.last_request.timeout == (0.5, 2.0)
+
+
+def test_timeout_override(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(connect=500, read=2000))
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    with sws.with_timeout(Timeout(connect=100, read=200)):
+        sws.license().get_licenses()
+    assert requests_mock.last_request.timeout == (0.1, 0.2)
+    sws.license().get_licenses()
+    assert requests_mock.last_request.timeout == (0.5, 2.0)
+
+
+def test_read_timeout_is_capped_by_total(requests_mock):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(connect=500, read=20000, total=1000))
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json={'items': []})
+    sws.license().get_licenses()
+    connect, read = requests_mock.last_request.timeout
+    assert connect == 0.5
+    assert read <= 1.0
+
+
+def test_deadline_covers_token_refresh(requests_mock):
+    """ A call that used up its total timeout must not go on to refresh the access token and replay """
+    sws_client = SwsClient(app_id=APP_ID, service_uri=SERVICE_URI, timeout=Timeout(total=50))
+
+    def expired_token(request, context):
+        time.sleep(0.06)
+        context.status_code = 401
+        return {'code': 2002, 'errorText': 'Expired Access token'}
+
+    requests_mock.register_uri('GET', GET_LICENSES_URL, json=expired_token)
+    refresh = requests_mock.register_uri('POST', SERVICE_URI['id'] + '/api/v1/tokens/refresh', json={})
+    with pytest.raises(DeadlineExceeded):
+        sws_client.license().get_licenses()
+    assert not refresh.called
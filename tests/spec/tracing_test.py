@@ -0,0 +1,130 @@
+import pytest
+from requests.exceptions import ConnectionError
+
+from sws_py_sdk.cache import TTLCache
+from sws_py_sdk.retry import RetryPolicy
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.sws_client import SwsClient
+from sws_py_sdk.tracing import Tracing
+
+sdk_trace = pytest.importorskip('opentelemetry.sdk.trace')
+in_memory = pytest.importorskip('opentelemetry.sdk.trace.export.in_memory_span_exporter')
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor  # noqa: E402
+from opentelemetry.trace import SpanKind, StatusCode  # noqa: E402
+
+APP_ID = 'myClientAppId'
+SERVICE_URI = {
+    "id": "http://192.168.4.7",
+    "license": "http://192.168.4.6:8301"
+}
+PRODUCT_URL = SERVICE_URI['license'] + '/api/v1/products/products/1234'
+GET_LICENSES_URL = SERVICE_URI['license'] + '/api/v1/me/licenses'
+TOKEN_REFRESH_URL = SERVICE_URI['id'] + '/api/v1/tokens/refresh'
+
+
+@pytest.fixture
+def exporter():
+    return in_memory.InMemorySpanExporter()
+
+
+@pytest.fixture
+def tracing(exporter):
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return Tracing(tracer=provider.get_tracer('test'))
+
+
+def spans_by_name(exporter):
+    return [(span.name, span.kind) for span in exporter.get_finished_spans()]
+
+
+def test_call_span_uses_endpoint_template(requests_mock, exporter, tracing):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing)
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'})
+    sws.license().get_product_info('1234')
+    request_span, call_span = exporter.get_finished_spans()
+    assert call_span.name == request_span.name == 'GET /api/v1/products/products/{id}'
+    assert (call_span.kind, request_span.kind) == (SpanKind.INTERNAL, SpanKind.CLIENT)
+    assert request_span.parent.span_id == call_span.context.span_id
+    assert call_span.attributes['url.template'] == '/api/v1/products/products/{id}'
+    assert call_span.attributes['sws.service'] == 'license'
+    assert call_span.attributes['http.response.status_code'] == 200
+    assert request_span.attributes['server.address'] == '192.168.4.6'
+    assert request_span.attributes['server.port'] == 8301
+    assert '1234' not in str(dict(call_span.attributes)) + str(dict(request_span.attributes))
+
+
+def test_cache_hit_has_a_call_span(requests_mock, exporter, tracing):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing, response_cache=TTLCache())
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'})
+    sws.license().get_product_info('1234')
+    sws.license().get_product_info('1234')
+    assert spans_by_name(exporter) == [('GET /api/v1/products/products/{id}', SpanKind.CLIENT),
+                                       ('GET /api/v1/products/products/{id}', SpanKind.INTERNAL),
+                                       ('GET /api/v1/products/products/{id}', SpanKind.INTERNAL)]
+    call_span, cached_span = exporter.get_finished_spans()[1:]
+    assert call_span.attributes['sws.cache_hit'] is False
+    assert cached_span.attributes['sws.cache_hit'] is True
+    assert cached_span.attributes['http.response.status_code'] == 200
+    assert requests_mock.call_count == 1
+
+
+def test_trace_context_is_propagated(requests_mock, exporter, tracing):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing)
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'})
+    sws.license().get_product_info('1234')
+    request_span = exporter.get_finished_spans()[0]
+    trace_id = format(request_span.context.trace_id, '032x')
+    span_id = format(request_span.context.span_id, '016x')
+    assert requests_mock.last_request.headers['traceparent'].startswith(f'00-{trace_id}-{span_id}-')
+
+
+def test_trace_context_is_not_propagated_when_disabled(requests_mock, exporter):
+    provider = sdk_trace.TracerProvider()
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI,
+              tracing=Tracing(tracer=provider.get_tracer('test'), propagate=False))
+    requests_mock.get(PRODUCT_URL, json={'id': '1234'})
+    sws.license().get_product_info('1234')
+    assert 'traceparent' not in requests_mock.last_request.headers
+
+
+def test_each_retry_has_a_span(requests_mock, exporter, tracing):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing,
+              retry_policy=RetryPolicy(max_attempts=3, backoff_factor=0))
+    requests_mock.get(GET_LICENSES_URL, [{'status_code': 503, 'json': {}}, {'exc': ConnectionError},
+                                         {'status_code': 200, 'json': {'items': []}}])
+    sws.license().get_licenses()
+    *request_spans, call_span = exporter.get_finished_spans()
+    assert [span.attributes.get('http.request.resend_count') for span in request_spans] == [None, 1, 2]
+    assert all(span.parent.span_id == call_span.context.span_id for span in request_spans)
+    assert request_spans[0].status.status_code == StatusCode.ERROR
+    assert request_spans[1].status.status_code == StatusCode.ERROR
+    assert request_spans[1].events[0].name == 'exception'
+    assert call_span.status.status_code != StatusCode.ERROR
+    assert call_span.attributes['sws.retries'] == 2
+
+
+def test_token_refresh_has_a_child_span(requests_mock, exporter, tracing):
+    sws_client = SwsClient(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing)
+    sws_client.access_token = 'Expired.Access.Token'
+    requests_mock.get(GET_LICENSES_URL, [{'status_code': 401, 'json': {'code': 2002, 'error': 'Expired'}},
+                                         {'status_code': 200, 'json': {'items': []}}])
+    requests_mock.post(TOKEN_REFRESH_URL, json={'tokens': {'access': {'token': 'new.token', 'expires_at': 1489142529},
+                                                           'refresh': {'token': 'refresh.token'}}})
+    sws_client.license().get_licenses()
+    spans = {span.name: span for span in exporter.get_finished_spans() if span.kind == SpanKind.INTERNAL}
+    call_span = spans['GET /api/v1/me/licenses']
+    refresh_span = spans['sws token refresh']
+    assert refresh_span.parent.span_id == call_span.context.span_id
+    assert spans['POST /api/v1/tokens/refresh'].parent.span_id == refresh_span.context.span_id
+    assert call_span.attributes['sws.token_refreshed'] is True
+    assert len([span for span in exporter.get_finished_spans() if span.name == 'GET /api/v1/me/licenses']) == 3
+
+
+def test_failed_call_span_records_the_exception(requests_mock, exporter, tracing):
+    sws = Sws(app_id=APP_ID, service_uri=SERVICE_URI, tracing=tracing)
+    requests_mock.get(GET_LICENSES_URL, exc=ConnectionError)
+    with pytest.raises(ConnectionError):
+        sws.license().get_licenses()
+    assert all(span.status.status_code == StatusCode.ERROR for span in exporter.get_finished_spans())
+    assert len(exporter.get_finished_spans()) == 2
@@ -0,0 +1,85 @@
+from sws_py_sdk.sws import Sws
+from sws_py_sdk.upload_journal import UploadJournal
+
+APP_ID = 'myClientAppId'
+CLOUDLIB_URI = 'http://192.168.4.8'
+STORAGE_URI = 'http://storage.example.com'
+CONTENT = bytes(range(256)) * 300
+PARTS = [{'url': f'{STORAGE_URI}/part/{index}'} for index in range(3)]
+
+
+def read_body(request, context):
+    request.body.read()
+    return ''
+
+
+def register_upload(requests_mock, part_statuses):
+    requests_mock.register_uri('POST', CLOUDLIB_URI + '/api/v1/me/files', status_code=201,
+                               json={'id': 'file-1', 'upload': {'parts': PARTS}})
+    for index, status_code in enumerate(part_statuses):
+        requests_mock.register_uri('PUT', f'{STORAGE_URI}/part/{index}', status_code=status_code, text=read_body)
+
+
+def sent_urls(requests_mock):
+    return sorted(request.url for request in requests_mock.request_history if request.method == 'PUT')
+
+
+def test_interrupted_upload_resumes_with_missing_parts(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    journal = UploadJournal(str(tmp_path / 'journal.db'))
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+
+    register_upload(requests_mock, [200, 200, 503])
+    assert not sws.cloudlib().me_upload_file(path, journal=journal).ok
+    journal.close()
+
+    requests_mock.reset_mock()
+    register_upload(requests_mock, [200, 200, 200])
+    requests_mock.register_uri('GET', CLOUDLIB_URI + '/api/v1/me/files/file-1', json={'id': 'file-1'})
+    progress = []
+    with UploadJournal(str(tmp_path / 'journal.db')) as journal:
+        result = sws.cloudlib().me_upload_file(path, journal=journal,
+                                               progress_callback=lambda d, sent, total: progress.append(sent))
+
+    assert result.ok
+    assert result.resumed
+    assert len(result.part_responses) == 1
+    assert sent_urls(requests_mock) == [f'{STORAGE_URI}/part/2']
+    assert progress[-1] == len(CONTENT)
+
+
+def test_completed_upload_is_only_verified(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    journal = UploadJournal(':memory:')
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    register_upload(requests_mock, [200, 200, 200])
+    assert sws.cloudlib().me_upload_file(path, journal=journal).ok
+
+    requests_mock.reset_mock()
+    requests_mock.register_uri('GET', CLOUDLIB_URI + '/api/v1/me/files/file-1', json={'id': 'file-1'})
+    (tmp_path / 'copy.mp3').write_bytes(CONTENT)
+    result = sws.cloudlib().me_upload_file(tmp_path / 'copy.mp3', journal=journal)
+
+    assert result.ok
+    assert result.resumed
+    assert result.response.json() == {'id': 'file-1'}
+    assert requests_mock.call_count == 1
+
+
+def test_upload_is_restarted_if_file_is_gone(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    journal = UploadJournal(':memory:')
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    register_upload(requests_mock, [200, 200, 200])
+    sws.cloudlib().me_upload_file(path, journal=journal)
+
+    requests_mock.reset_mock()
+    requests_mock.register_uri('GET', CLOUDLIB_URI + '/api/v1/me/files/file-1', status_code=404, json={'code': 404})
+    result = sws.cloudlib().me_upload_file(path, journal=journal)
+
+    assert result.ok
+    assert not result.resumed
+    assert sent_urls(requests_mock) == [f'{STORAGE_URI}/part/{index}' for index in range(3)]
@@ -0,0 +1,198 @@
+import base64
+import hashlib
+
+from sws_py_sdk.retry import RetryPolicy
+from sws_py_sdk.sws import Sws
+from sws_py_sdk import upload
+from sws_py_sdk.upload import HashCache, md5_file, prepare_upload, prepare_uploads
+
+APP_ID = 'myClientAppId'
+
+CONTENT = b'ID3' + bytes(range(256)) * 5000
+
+
+def expected_md5(content):
+    return base64.b64encode(hashlib.md5(content).digest()).decode('ascii')
+
+
+def test_md5_file_in_chunks(tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    assert md5_file(path, chunk_size=1000) == expected_md5(CONTENT)
+    assert md5_file(path, chunk_size=1000, use_mmap=True) == expected_md5(CONTENT)
+
+
+def test_md5_empty_file(tmp_path):
+    path = tmp_path / 'empty.mp3'
+    path.write_bytes(b'')
+    assert md5_file(path, use_mmap=True) == expected_md5(b'')
+
+
+def test_prepare_upload(tmp_path):
+    path = tmp_path / 'track.flac'
+    path.write_bytes(CONTENT)
+    descriptor = prepare_upload(path)
+    assert descriptor.upload_params() == {
+        'md5_hash': expected_md5(CONTENT),
+        'mime_type': 'audio/flac',
+        'size': len(CONTENT),
+        'name': 'track.flac'
+    }
+
+
+def test_prepare_uploads_for_a_directory(tmp_path):
+    (tmp_path / 'crate').mkdir()
+    (tmp_path / 'a.mp3').write_bytes(b'a')
+    (tmp_path / 'crate' / 'b.wav').write_bytes(b'bb')
+    (tmp_path / 'c.unknown').write_bytes(b'ccc')
+
+    descriptors = prepare_uploads(tmp_path, max_workers=2)
+    assert [(d.name, d.size, d.md5_hash) for d in descriptors] == [
+        ('a.mp3', 1, expected_md5(b'a')),
+        ('c.unknown', 3, expected_md5(b'ccc')),
+        ('b.wav', 2, expected_md5(b'bb')),
+    ]
+    assert descriptors[1].mime_type == 'application/octet-stream'
+    assert [d.name for d in prepare_uploads(tmp_path, recursive=False)] == ['a.mp3', 'c.unknown']
+
+
+CLOUDLIB_URI = 'http://192.168.4.8'
+STORAGE_URI = 'http://storage.example.com'
+
+
+def storage_part(received, index):
+    def put(request, context):
+        received[index] = request.body.read() if request.body else b''
+        return ''
+    return put
+
+
+def test_upload_file_in_parallel_parts(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    parts = [{'url': f'{STORAGE_URI}/part/{index}'} for index in range(4)]
+    requests_mock.register_uri('POST', CLOUDLIB_URI + '/api/v1/me/files', status_code=201,
+                               json={'id': 'file-1', 'upload': {'method': 'PUT', 'parts': parts}})
+    received = {}
+    for index in range(4):
+        requests_mock.register_uri('PUT', f'{STORAGE_URI}/part/{index}', text=storage_part(received, index))
+    progress = []
+
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    result = sws.cloudlib().me_upload_file(path, progress_callback=lambda d, sent, total: progress.append(total))
+
+    assert result.ok
+    assert result.response.json()['id'] == 'file-1'
+    assert len(result.part_responses) == 4
+    assert b''.join(received[index] for index in range(4)) == CONTENT
+    assert requests_mock.request_history[0].json() == {
+        'md5_hash': expected_md5(CONTENT), 'mime_type': 'audio/mpeg', 'size': len(CONTENT), 'name': 'track.mp3'}
+    assert requests_mock.request_history[1].headers['Content-Type'] == 'audio/mpeg'
+    assert set(progress) == {len(CONTENT)}
+
+
+def test_upload_without_target_sends_no_content(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    requests_mock.register_uri('POST', CLOUDLIB_URI + '/api/v1/users/7/files', status_code=201, json={'id': 'file-1'})
+
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    result = sws.cloudlib().user_upload_file(7, path)
+
+    assert result.ok
+    assert result.part_responses == []
+    assert requests_mock.call_count == 1
+
+
+def test_failed_part_is_retried(requests_mock, tmp_path):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    requests_mock.register_uri('POST', CLOUDLIB_URI + '/api/v1/me/files', status_code=201,
+                               json={'upload': {'url': f'{STORAGE_URI}/file'}})
+    received = {}
+    requests_mock.register_uri('PUT', f'{STORAGE_URI}/file', [
+        {'status_code': 503},
+        {'text': storage_part(received, 0)},
+    ])
+    progress = []
+
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI}, retry_policy=RetryPolicy(backoff_factor=0))
+    result = sws.cloudlib().me_upload_file(path, progress_callback=lambda d, sent, total: progress.append(sent))
+
+    assert result.ok
+    assert received[0] == CONTENT
+    assert progress[-1] == len(CONTENT)
+
+
+def test_upload_files(requests_mock, tmp_path):
+    for name in ('a.mp3', 'b.mp3'):
+        (tmp_path / name).write_bytes(name.encode())
+    requests_mock.register_uri('POST', CLOUDLIB_URI + '/api/v1/me/files', status_code=201,
+                               json={'upload': {'url': f'{STORAGE_URI}/file'}})
+    requests_mock.register_uri('PUT', f'{STORAGE_URI}/file')
+
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    results = list(sws.cloudlib().upload_files(tmp_path, max_workers=2))
+
+    assert sorted(result.key for result in results) == [str(tmp_path / 'a.mp3'), str(tmp_path / 'b.mp3')]
+    assert all(result.ok for result in results)
+    assert requests_mock.call_count == 4
+
+
+def test_hash_cache_skips_unchanged_files(tmp_path, monkeypatch):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(CONTENT)
+    hashed = []
+    monkeypatch.setattr(upload, 'md5_file', lambda path, **kwargs: hashed.append(path) or 'hash')
+
+    with HashCache(str(tmp_path / 'hashes.db')) as hash_cache:
+        prepare_upload(path, hash_cache=hash_cache)
+    with HashCache(str(tmp_path / 'hashes.db')) as hash_cache:
+        assert prepare_upload(path, hash_cache=hash_cache).md5_hash == 'hash'
+        path.write_bytes(CONTENT + b'edited')
+        prepare_upload(path, hash_cache=hash_cache)
+
+    assert len(hashed) == 2
+
+
+def test_sync_files_sends_each_content_once(requests_mock, tmp_path):
+    (tmp_path / 'a.mp3').write_bytes(b'same')
+    (tmp_path / 'b.mp3').write_bytes(b'same')
+    (tmp_path / 'c.mp3').write_bytes(b'other')
+    known_hashes = set()
+
+    def create_file(request, context):
+        # The service only asks for content it does not have yet
+        context.status_code = 201
+        md5_hash = request.json()['md5_hash']
+        if md5_hash in known_hashes:
+            return {'id': md5_hash}
+        known_hashes.add(md5_hash)
+        return {'id': md5_hash, 'upload': {'url': f'{STORAGE_URI}/{len(known_hashes)}'}}
+
+    for user_id in (1, 2):
+        requests_mock.register_uri('POST', f'{CLOUDLIB_URI}/api/v1/users/{user_id}/files', json=create_file)
+    requests_mock.register_uri('PUT', f'{STORAGE_URI}/1')
+    requests_mock.register_uri('PUT', f'{STORAGE_URI}/2')
+
+    sws = Sws(app_id=APP_ID, service_uri={'cloudlib': CLOUDLIB_URI})
+    results = list(sws.cloudlib().sync_files({1: tmp_path, 2: [tmp_path / 'a.mp3', tmp_path / 'b.mp3']}))
+
+    assert len(results) == 5
+    assert all(result.ok for result in results)
+    methods = [request.method for request in requests_mock.request_history]
+    assert methods.count('POST') == 3
+    assert methods.count('PUT') == 2
+    by_key = {result.key: result.response for result in results}
+    assert by_key[(1, str(tmp_path / 'a.mp3'))] is by_key[(1, str(tmp_path / 'b.mp3'))]
+
+
+def test_sync_plan_schedules_duplicates_after_their_first_upload(tmp_path):
+    (tmp_path / 'a.mp3').write_bytes(b'same')
+    (tmp_path / 'c.mp3').write_bytes(b'other')
+    plan = upload.SyncPlan({1: tmp_path, 2: [tmp_path / 'a.mp3'], 3: [tmp_path / 'a.mp3']})
+    first, followers = plan.schedule()
+    assert [key[0] for key in first] == [1, 1]
+    same = next(key for key in first if key in followers)
+    assert [key[0] for key in followers[same]] == [2, 3]
+    assert len(followers) == 1